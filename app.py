@@ -4,16 +4,24 @@ Adobe Analytics Dashboard - Main Application
 """
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from utils.data_loader import (
-    load_data, get_date_range, filter_by_date,
-    get_comparison_data, calculate_change
+    load_data, get_date_range, load_filtered, resample_long,
+    get_comparison_engine, get_anomaly_detector
 )
 from utils.charts import (
     create_metric_card, create_line_chart, create_area_chart,
-    format_number, COLOR_PALETTE
+    format_number, yen_column, percent_column, date_column, COLOR_PALETTE
 )
+from utils.filters import date_range_selector
+from utils.comparison import CURRENT_PERIOD
+from utils.metrics import METRICS
+from utils.anomaly import BASELINES
+from utils.sections import KPI_METRICS
+from utils.tables import download_buttons
+from utils.profiling import start_profiling, profile_section, performance_panel, timed_rerun
+from utils.datasets import dataset_selector
 
 # Page configuration
 st.set_page_config(
@@ -44,8 +52,12 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+@timed_rerun
 def main():
+    start_profiling()
+
     # Load data
+    dataset_selector()
     df_daily = load_data("daily_summary.csv")
 
     if df_daily.empty:
@@ -58,113 +70,97 @@ def main():
 
     min_date, max_date = get_date_range(df_daily)
 
-    st.sidebar.subheader("期間選択")
-
-    # Quick date range buttons
-    date_option = st.sidebar.radio(
-        "プリセット",
-        ["過去7日", "過去30日", "過去90日", "カスタム"],
-        horizontal=True
-    )
-
-    if date_option == "過去7日":
-        start_date = max_date - timedelta(days=6)
-        end_date = max_date
-    elif date_option == "過去30日":
-        start_date = max_date - timedelta(days=29)
-        end_date = max_date
-    elif date_option == "過去90日":
-        start_date = min_date
-        end_date = max_date
-    else:
-        col1, col2 = st.sidebar.columns(2)
-        with col1:
-            start_date = st.date_input("開始日", min_date, min_value=min_date, max_value=max_date)
-        with col2:
-            end_date = st.date_input("終了日", max_date, min_value=min_date, max_value=max_date)
-
-    # Comparison period
-    comparison_type = st.sidebar.selectbox("比較期間", ["前週", "前日", "前月"])
+    start_date, end_date, comparison_type = date_range_selector(min_date, max_date)
+    baseline = st.sidebar.selectbox("異常検知の基準", list(BASELINES), format_func=BASELINES.__getitem__,
+                                    key="anomaly_baseline")
 
     st.sidebar.markdown("---")
     st.sidebar.caption(f"データ期間: {min_date.strftime('%Y/%m/%d')} - {max_date.strftime('%Y/%m/%d')}")
 
     # Filter data
-    df_current = filter_by_date(df_daily, start_date, end_date)
-    df_previous = get_comparison_data(df_daily, start_date, end_date, comparison_type)
+    df_current = load_filtered("daily_summary.csv", start_date, end_date)
 
     # Main content
     st.title("KPI サマリー")
     st.caption(f"期間: {pd.to_datetime(start_date).strftime('%Y/%m/%d')} - {pd.to_datetime(end_date).strftime('%Y/%m/%d')} | 比較: {comparison_type}")
 
-    # Calculate KPIs
-    current_metrics = {
-        'visitors': df_current['visitors'].sum(),
-        'sessions': df_current['sessions'].sum(),
-        'pageviews': df_current['pageviews'].sum(),
-        'conversions': df_current['conversions'].sum(),
-        'revenue': df_current['revenue'].sum(),
-        'bounce_rate': df_current['bounce_rate'].mean() * 100,
-        'avg_session_duration': df_current['avg_session_duration'].mean(),
-    }
-
-    previous_metrics = {
-        'visitors': df_previous['visitors'].sum(),
-        'sessions': df_previous['sessions'].sum(),
-        'pageviews': df_previous['pageviews'].sum(),
-        'conversions': df_previous['conversions'].sum(),
-        'revenue': df_previous['revenue'].sum(),
-        'bounce_rate': df_previous['bounce_rate'].mean() * 100,
-        'avg_session_duration': df_previous['avg_session_duration'].mean(),
-    }
-
-    # Calculate CVR
-    current_metrics['cvr'] = (current_metrics['conversions'] / current_metrics['sessions'] * 100) if current_metrics['sessions'] > 0 else 0
-    previous_metrics['cvr'] = (previous_metrics['conversions'] / previous_metrics['sessions'] * 100) if previous_metrics['sessions'] > 0 else 0
+    # Calculate KPIs for the window and every reference period from cached prefix sums
+    with profile_section("kpi_comparison"):
+        engine = get_comparison_engine("daily_summary.csv", KPI_METRICS)
+        kpi_table = engine.compare(start_date, end_date)
+        kpi_changes = engine.changes(kpi_table)
+        current_metrics = kpi_table.loc[CURRENT_PERIOD].fillna(0)
+
+    # Unusual days in the window, scored against baselines kept across reruns
+    with profile_section("anomaly_detection"):
+        detector = get_anomaly_detector("daily_summary.csv", KPI_METRICS)
+        anomalies = detector.anomalies(start_date, end_date, method=baseline)
+
+    def kpi_card(name, value=None, prefix=""):
+        other_deltas = " / ".join(
+            f"{ref}: {change:+.1f}%" if not pd.isna(change) else f"{ref}: -"
+            for ref, change in kpi_changes[name].items()
+        )
+        flagged = anomalies[anomalies['metric'] == name]
+        label = METRICS[name].label
+        if not flagged.empty:
+            other_deltas = "異常値: " + ", ".join(
+                f"{row.date.strftime('%m/%d')} ({row.z:+.1f}σ)" for row in flagged.itertuples()
+            ) + "  \n" + other_deltas
+            if flagged['is_bad'].any():
+                label += " ⚠️"
+        create_metric_card(label, current_metrics[name] if value is None else value,
+                           kpi_changes.loc[comparison_type, name], prefix=prefix, help=other_deltas)
 
     # KPI Cards - Row 1 (Traffic)
     st.subheader("トラフィック指標")
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        _, change_pct, _ = calculate_change(current_metrics['visitors'], previous_metrics['visitors'])
-        create_metric_card("訪問者数", current_metrics['visitors'], change_pct)
+        kpi_card('visitors')
 
     with col2:
-        _, change_pct, _ = calculate_change(current_metrics['sessions'], previous_metrics['sessions'])
-        create_metric_card("セッション数", current_metrics['sessions'], change_pct)
+        kpi_card('sessions')
 
     with col3:
-        _, change_pct, _ = calculate_change(current_metrics['pageviews'], previous_metrics['pageviews'])
-        create_metric_card("ページビュー", current_metrics['pageviews'], change_pct)
+        kpi_card('pageviews')
 
     with col4:
-        _, change_pct, _ = calculate_change(current_metrics['bounce_rate'], previous_metrics['bounce_rate'])
-        # Bounce rate: negative is better
-        change_pct = -change_pct if change_pct != 0 else 0
-        create_metric_card("直帰率", f"{current_metrics['bounce_rate']:.1f}%", change_pct)
+        # Bounce rate: lower is better, ComparisonEngine.changes flips the sign of its delta
+        kpi_card('bounce_rate', f"{current_metrics['bounce_rate']:.1f}%")
 
     # KPI Cards - Row 2 (Conversion)
     st.subheader("コンバージョン指標")
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        _, change_pct, _ = calculate_change(current_metrics['conversions'], previous_metrics['conversions'])
-        create_metric_card("コンバージョン数", current_metrics['conversions'], change_pct)
+        kpi_card('conversions')
 
     with col2:
-        _, change_pct, _ = calculate_change(current_metrics['cvr'], previous_metrics['cvr'])
-        create_metric_card("CVR", f"{current_metrics['cvr']:.2f}%", change_pct)
+        kpi_card('cvr', f"{current_metrics['cvr']:.2f}%")
 
     with col3:
-        _, change_pct, _ = calculate_change(current_metrics['revenue'], previous_metrics['revenue'])
-        create_metric_card("売上", current_metrics['revenue'], change_pct, prefix="¥")
+        kpi_card('revenue', prefix="¥")
 
     with col4:
-        avg_order = current_metrics['revenue'] / current_metrics['conversions'] if current_metrics['conversions'] > 0 else 0
-        prev_avg_order = previous_metrics['revenue'] / previous_metrics['conversions'] if previous_metrics['conversions'] > 0 else 0
-        _, change_pct, _ = calculate_change(avg_order, prev_avg_order)
-        create_metric_card("平均注文額", avg_order, change_pct, prefix="¥")
+        kpi_card('avg_order_value', prefix="¥")
+
+    with st.expander("期間比較マトリクス"):
+        df_matrix = kpi_changes.rename(columns={name: METRICS[name].label for name in KPI_METRICS})
+        st.dataframe(df_matrix, width='stretch',
+                     column_config={col: percent_column(col) for col in df_matrix.columns})
+
+    with st.expander(f"異常値検知（{BASELINES[baseline]}との比較、{len(anomalies)} 件）"):
+        if anomalies.empty:
+            st.caption("選択期間に異常値はありません。")
+        else:
+            df_anomalies = anomalies.assign(
+                metric=anomalies['metric'].map(lambda name: METRICS[name].label),
+                is_bad=anomalies['is_bad'].map({True: '悪化', False: '好調'}),
+            )
+            df_anomalies.columns = ['日付', '指標', '値', '基準値', 'zスコア', '判定']
+            st.dataframe(df_anomalies, width='stretch', hide_index=True,
+                         column_config={'日付': date_column()})
 
     st.markdown("---")
 
@@ -173,32 +169,35 @@ def main():
 
     with col1:
         st.subheader("訪問者数・セッション数 推移")
-        df_trend = df_current.copy()
-        df_trend = df_trend.melt(
-            id_vars=['date'],
-            value_vars=['visitors', 'sessions'],
-            var_name='指標',
-            value_name='値'
-        )
-        df_trend['指標'] = df_trend['指標'].map({'visitors': '訪問者数', 'sessions': 'セッション数'})
+        df_trend = resample_long("daily_summary.csv", start_date, end_date, 'day',
+                                 {'visitors': '訪問者数', 'sessions': 'セッション数'})
         fig = create_line_chart(df_trend, x='date', y='値', color='指標')
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig, width='stretch')
 
     with col2:
         st.subheader("売上・コンバージョン 推移")
         fig = create_area_chart(df_current, x='date', y='revenue', title="")
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig, width='stretch')
 
     # Daily breakdown table
     st.subheader("日別詳細データ")
 
-    df_display = df_current[['date', 'visitors', 'sessions', 'pageviews', 'conversions', 'revenue', 'bounce_rate']].copy()
+    df_display = df_current[['date', 'visitors', 'sessions', 'pageviews', 'conversions', 'revenue', 'bounce_rate_pct']]
     df_display.columns = ['日付', '訪問者数', 'セッション数', 'PV', 'CV', '売上', '直帰率']
-    df_display['日付'] = df_display['日付'].dt.strftime('%Y/%m/%d')
-    df_display['売上'] = df_display['売上'].apply(lambda x: f"¥{x:,.0f}")
-    df_display['直帰率'] = df_display['直帰率'].apply(lambda x: f"{x*100:.1f}%")
 
-    st.dataframe(df_display, use_container_width=True, hide_index=True)
+    st.dataframe(
+        df_display,
+        width='stretch',
+        hide_index=True,
+        column_config={
+            '日付': date_column(),
+            '売上': yen_column(),
+            '直帰率': percent_column(),
+        },
+    )
+    download_buttons(df_display, key="summary_daily", file_name="daily_detail")
+
+    performance_panel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,5 @@
+"""
+Benchmarks for Adobe Analytics Dashboard
+
+Run from the repository root, e.g. ``python -m benchmarks.run``.
+"""
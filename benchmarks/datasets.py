@@ -0,0 +1,54 @@
+"""
+Synthetic benchmark datasets at fixed multiples of the sample data size
+"""
+from pathlib import Path
+
+import streamlit as st
+
+from generate_sample_data import generate
+from utils import data_loader
+from utils.datasets import DATASET_CACHE
+
+# Scale (x the default 90-day sample) -> generate() parameters
+SCALES = {
+    1: {},
+    10: {'pages': 120, 'referrers': 120, 'products': 70, 'regions': 100},
+    100: {'hourly': True, 'pages': 48, 'referrers': 48, 'products': 28, 'regions': 40},
+    1000: {'days': 360, 'hourly': True, 'pages': 120, 'referrers': 120, 'products': 70, 'regions': 100},
+}
+
+DATA_ROOT = Path(__file__).parent / ".data"
+
+
+def ensure_dataset(scale: int, root: Path = DATA_ROOT, fmt: str = 'csv') -> Path:
+    """Folder holding the dataset for ``scale``, generated on first use"""
+    path = Path(root) / f"{scale}x-{fmt}"
+    # conversion_funnel is written last, so its presence means the set is complete
+    if not (path / f"conversion_funnel.{fmt}").exists():
+        generate(path, fmt=fmt, **SCALES[scale])
+    return path
+
+
+def dataset_rows(path: Path) -> int:
+    """Total rows across the tables of a dataset"""
+    total = 0
+    for file in Path(path).iterdir():
+        if file.suffix == '.csv':
+            with open(file, 'rb') as f:
+                total += sum(1 for _ in f) - 1
+        elif file.suffix == '.parquet':
+            import pyarrow.parquet as pq
+            total += pq.ParquetFile(file).metadata.num_rows
+    return total
+
+
+def clear_caches():
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    DATASET_CACHE.clear()
+
+
+def use_dataset(path: Path):
+    """Point the data layer at a dataset folder and drop everything cached from the previous one"""
+    data_loader.DATA_DIR = Path(path)
+    clear_caches()
@@ -0,0 +1,343 @@
+"""
+Concurrent-session load simulator
+
+Starts a real ``streamlit run app.py`` server on a synthetic dataset and
+connects N simulated browser sessions to it over Streamlit's websocket
+protocol. Each session follows a seeded random script (page switches, date
+preset, comparison, anomaly baseline, granularity and segment changes) with
+exponential think time between interactions. For every concurrency level the
+report has rerun latency percentiles (overall and per interaction),
+throughput, and the server's resident memory: before the sessions connect,
+peak, and the overhead per connected session. Cache activity comes from the
+dashboard's own OpenMetrics endpoint (see utils/telemetry.py).
+
+AppTest is not used here because it swaps a process-global runtime in and out
+on every run, so concurrent AppTest sessions would interfere with each other.
+
+Requires the websockets package (pip install websockets), which the dashboard
+itself does not need.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --sessions 10 50 100 --actions 20 --think-time 1 --scale 10 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+try:
+    from websockets.asyncio.client import connect
+except ImportError:  # websockets is only needed by this benchmark, not by the dashboard
+    connect = None
+
+from benchmarks.datasets import SCALES, DATA_ROOT, ensure_dataset
+from benchmarks.rerun_latency import INTERACTIVE_LABELS
+from benchmarks.run import ROOT, environment
+
+# URL page names of the multipage app ("" is app.py)
+PAGE_NAMES = ["", "Traffic", "Conversion", "Behavior"]
+
+PAGE_SWITCH = "ページ切替"
+PERCENTILES = (50, 90, 95, 99)
+
+# Probability that an interaction is a page switch rather than a control change
+PAGE_SWITCH_RATE = 0.3
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class DashboardServer:
+    """``streamlit run app.py`` in a subprocess, with telemetry served on a side port"""
+
+    def __init__(self, data_dir: Path, startup_timeout: float = 60):
+        self.port = _free_port()
+        self.metrics_port = _free_port()
+        env = dict(os.environ, AA_DASHBOARD_DATA_DIR=str(data_dir),
+                   AA_DASHBOARD_METRICS_PORT=str(self.metrics_port))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", str(ROOT / "app.py"),
+             "--server.headless", "true", "--server.port", str(self.port),
+             "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_stcore/health", timeout=1):
+                    break
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise RuntimeError("Streamlit サーバーを起動できませんでした")
+                time.sleep(0.2)
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}/_stcore/stream"
+
+    def rss_bytes(self) -> int:
+        with open(f"/proc/{self.process.pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    def metrics(self) -> dict:
+        """Counter totals summed over labels, e.g. {'aa_dashboard_cache_misses': 42.0}"""
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{self.metrics_port}/metrics", timeout=5) as r:
+                text = r.read().decode('utf-8')
+        except OSError:
+            return {}
+        totals = {}
+        for match in re.finditer(r'^(\w+)_total(?:\{[^}]*\})? (\S+)$', text, re.MULTILINE):
+            totals[match[1]] = totals.get(match[1], 0.0) + float(match[2])
+        return totals
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Session:
+    """One simulated browser tab: sends reruns and waits for each script run to finish"""
+
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.timeout = timeout
+        self.page = ""
+        self.controls = {}  # label -> (widget id, options) on the current page
+        self.values = {}    # widget id -> selected option, sent with every rerun like the browser does
+        self.ws = None
+
+    async def connect(self):
+        self.ws = await connect(self.url, max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, page: str = None) -> float:
+        """Rerun ``page`` (default: the current one) and return the latency in seconds"""
+        if page is not None:
+            self.page = page
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_name = self.page
+        for widget_id, value in self.values.items():
+            msg.rerun_script.widget_states.widgets.append(WidgetState(id=widget_id, string_value=value))
+
+        started = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        controls, error = {}, None
+        async with asyncio.timeout(self.timeout):
+            while True:
+                fwd = ForwardMsg()
+                fwd.ParseFromString(await self.ws.recv())
+                kind = fwd.WhichOneof('type')
+                if kind == 'script_finished':
+                    break
+                if kind != 'delta' or fwd.delta.WhichOneof('type') != 'new_element':
+                    continue
+                element = fwd.delta.new_element
+                element_type = element.WhichOneof('type')
+                if element_type in ('radio', 'selectbox'):
+                    widget = getattr(element, element_type)
+                    if widget.label in INTERACTIVE_LABELS:
+                        controls[widget.label] = (widget.id, list(widget.options))
+                elif element_type == 'exception' and error is None:
+                    error = element.exception.message
+        elapsed = time.perf_counter() - started
+        if error:
+            raise RuntimeError(error)
+        self.controls = controls
+        return elapsed
+
+    async def change(self, label: str, rng: random.Random) -> float:
+        widget_id, options = self.controls[label]
+        self.values[widget_id] = rng.choice(options)
+        return await self.rerun()
+
+
+async def play_script(session: Session, actions: int, think_time: float, ramp: float, seed: int) -> tuple:
+    """Play one session's seeded script; returns ([(action, seconds)], [error])"""
+    rng = random.Random(seed)
+    samples, errors = [], []
+    await asyncio.sleep(rng.uniform(0, ramp))
+    try:
+        await session.connect()
+        samples.append(("初回表示", await session.rerun(rng.choice(PAGE_NAMES))))
+        for _ in range(actions):
+            await asyncio.sleep(rng.expovariate(1 / think_time) if think_time > 0 else 0)
+            if rng.random() < PAGE_SWITCH_RATE or not session.controls:
+                action = PAGE_SWITCH
+                coro = session.rerun(rng.choice([p for p in PAGE_NAMES if p != session.page]))
+            else:
+                action = rng.choice(sorted(session.controls))
+                coro = session.change(action, rng)
+            try:
+                samples.append((action, await coro))
+            except RuntimeError as e:
+                errors.append(f"{action}: {e}")
+    except (OSError, TimeoutError) as e:
+        errors.append(f"{type(e).__name__}: {e}")
+    return samples, errors
+
+
+def _percentiles(latencies: list) -> dict:
+    if not latencies:
+        return {}
+    values = np.percentile(latencies, PERCENTILES)
+    return {**{f"p{p}": float(v) for p, v in zip(PERCENTILES, values)},
+            'max': float(max(latencies)), 'count': len(latencies)}
+
+
+async def _warm_up(url: str, timeout: float):
+    """Visit every page once so the shared data caches are loaded before measuring"""
+    session = Session(url, timeout)
+    await session.connect()
+    try:
+        for page in PAGE_NAMES:
+            await session.rerun(page)
+    finally:
+        await session.close()
+
+
+async def _sample_rss(server: DashboardServer, stop: asyncio.Event, peak: list):
+    while not stop.is_set():
+        peak[0] = max(peak[0], server.rss_bytes())
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except TimeoutError:
+            pass
+
+
+async def run_level(server: DashboardServer, sessions: int, actions: int, think_time: float,
+                    ramp: float, seed: int, timeout: float) -> dict:
+    """Run ``sessions`` concurrent sessions against a warmed-up server"""
+    await _warm_up(server.url, timeout)
+    rss_before = server.rss_bytes()
+    metrics_before = server.metrics()
+
+    stop = asyncio.Event()
+    peak = [rss_before]
+    sampler = asyncio.create_task(_sample_rss(server, stop, peak))
+    clients = [Session(server.url, timeout) for _ in range(sessions)]
+    started = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(play_script(client, actions, think_time, ramp, seed * 1000 + i)
+                                         for i, client in enumerate(clients)))
+        duration = time.perf_counter() - started
+        # Measured while every session is still connected and holding its state
+        rss_connected = server.rss_bytes()
+    finally:
+        stop.set()
+        await sampler
+        await asyncio.gather(*(client.close() for client in clients))
+    metrics_after = server.metrics()
+
+    by_action, errors = {}, []
+    for samples, session_errors in results:
+        errors.extend(session_errors)
+        for action, seconds in samples:
+            by_action.setdefault(action, []).append(seconds)
+    latencies = [s for values in by_action.values() for s in values]
+    return {
+        'sessions': sessions,
+        'reruns': len(latencies),
+        'errors': errors,
+        'duration_seconds': duration,
+        'throughput_reruns_per_second': len(latencies) / duration if duration else 0.0,
+        'latency': _percentiles(latencies),
+        'latency_by_action': {action: _percentiles(values) for action, values in sorted(by_action.items())},
+        'rss_before_mb': rss_before / 1024 ** 2,
+        'rss_peak_mb': peak[0] / 1024 ** 2,
+        'rss_connected_mb': rss_connected / 1024 ** 2,
+        'per_session_mb': (rss_connected - rss_before) / sessions / 1024 ** 2,
+        'cache': {name.removeprefix('aa_dashboard_'): metrics_after.get(name, 0.0) - metrics_before.get(name, 0.0)
+                  for name in ('aa_dashboard_cache_calls', 'aa_dashboard_cache_misses',
+                               'aa_dashboard_cache_miss_bytes')},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同時セッション数ごとの再実行レイテンシ・スループット・メモリの負荷試験")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10, 50, 100],
+                        help="同時セッション数（既定: 10 50 100）")
+    parser.add_argument("--actions", type=int, default=10, help="1 セッションあたりの操作回数（既定: 10）")
+    parser.add_argument("--think-time", type=float, default=2.0,
+                        help="操作間の平均待ち時間の秒数（指数分布、既定: 2.0）")
+    parser.add_argument("--ramp", type=float, default=5.0, help="全セッションが接続し終えるまでの秒数（既定: 5.0）")
+    parser.add_argument("--scale", type=int, default=1, choices=sorted(SCALES),
+                        help="データ規模（サンプルデータの倍数、既定: 1）")
+    parser.add_argument("--data-dir", type=Path, default=None,
+                        help="計測に使うデータフォルダ（指定時は --scale を無視）")
+    parser.add_argument("--seed", type=int, default=42, help="操作シナリオの乱数シード（既定: 42）")
+    parser.add_argument("--timeout", type=float, default=600, help="1 回の再実行を待つ上限秒数（既定: 600）")
+    parser.add_argument("--output", type=Path, default=None, help="結果 JSON の出力先")
+    args = parser.parse_args()
+
+    if connect is None:
+        parser.error("負荷試験には websockets 13 以上が必要です（pip install websockets）")
+
+    data_dir = args.data_dir or ensure_dataset(args.scale, DATA_ROOT)
+    levels = []
+    for sessions in args.sessions:
+        # A fresh server per level so memory and caches are not carried over
+        with DashboardServer(data_dir) as server:
+            level = asyncio.run(run_level(server, sessions, args.actions, args.think_time, args.ramp,
+                                          args.seed, args.timeout))
+        levels.append(level)
+        latency = level['latency']
+        print(f"{sessions:4d} セッション  {level['reruns']:5d} 回  "
+              f"{level['throughput_reruns_per_second']:6.2f} 回/秒  "
+              f"p50 {latency.get('p50', 0) * 1000:8.1f} ms  p95 {latency.get('p95', 0) * 1000:8.1f} ms  "
+              f"p99 {latency.get('p99', 0) * 1000:8.1f} ms  max {latency.get('max', 0) * 1000:8.1f} ms  "
+              f"RSS {level['rss_before_mb']:7.1f} → {level['rss_peak_mb']:7.1f} MB  "
+              f"{level['per_session_mb']:6.2f} MB/セッション  エラー {len(level['errors'])}", flush=True)
+        for action, stats in level['latency_by_action'].items():
+            print(f"       {action:16s} {stats['count']:5d} 回  p50 {stats['p50'] * 1000:8.1f} ms  "
+                  f"p95 {stats['p95'] * 1000:8.1f} ms  max {stats['max'] * 1000:8.1f} ms", flush=True)
+
+    if args.output:
+        report = {'environment': environment(), 'data_dir': str(data_dir),
+                  'scenario': {'actions': args.actions, 'think_time': args.think_time, 'ramp': args.ramp,
+                               'seed': args.seed, 'page_switch_rate': PAGE_SWITCH_RATE},
+                  'levels': levels}
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"\n結果: {args.output}")
+
+    errors = [e for level in levels for e in level['errors']]
+    if errors:
+        print(f"\n❌ エラー {len(errors)} 件:")
+        for line in errors[:20]:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Headless page-rerun latency harness
+
+Drives app.py and every page through Streamlit's AppTest on a synthetic
+dataset, steps through every date preset, comparison type, anomaly baseline,
+aggregation granularity and funnel segment, and reports cold (first time the
+combination is computed) and warm (cached) rerun latency per interaction.
+Exits with status 1 when any rerun exceeds its latency budget or raises.
+
+Usage (from the repository root):
+    python -m benchmarks.rerun_latency
+    python -m benchmarks.rerun_latency --scale 100 --cold-budget 5 --warm-budget 1 --output latency.json
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.datasets import SCALES, DATA_ROOT, ensure_dataset, clear_caches, use_dataset
+from benchmarks.run import PAGES, ROOT, environment
+
+# Labels of the widgets whose every option is exercised
+INTERACTIVE_LABELS = ("プリセット", "比較期間", "異常検知の基準", "集計単位", "セグメント")
+
+INITIAL = "初回表示"
+
+
+def _controls(at: AppTest) -> list:
+    """(kind, key, label, option count) of the interactive radios and selectboxes on the page"""
+    controls = []
+    for kind in ("radio", "selectbox"):
+        for widget in getattr(at, kind):
+            if widget.label in INTERACTIVE_LABELS and widget.key:
+                controls.append((kind, widget.key, widget.label, len(widget.options)))
+    return controls
+
+
+def _select(at: AppTest, kind: str, key: str, index: int) -> str:
+    """Select option ``index`` of a widget and return its label"""
+    if kind == "radio":
+        widget = at.radio(key=key)
+        widget.set_value(widget.options[index])
+    else:
+        widget = at.selectbox(key=key)
+        widget.select_index(index)
+    return widget.options[index]
+
+
+def _timed_run(at: AppTest) -> float:
+    started = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return elapsed
+
+
+def profile_page(script: str, timeout: float = 600) -> list:
+    """Cold/warm rerun latency of a page's initial render and of every option of its controls"""
+    page = Path(script).stem
+    clear_caches()
+    at = AppTest.from_file(str(ROOT / script), default_timeout=timeout)
+    records = [{'page': page, 'interaction': INITIAL, 'option': "", 'cold': _timed_run(at), 'warm': _timed_run(at)}]
+
+    for kind, key, label, count in _controls(at):
+        widget = getattr(at, kind)(key=key)
+        original = widget.index
+        rows = []
+        # First pass computes every option's data; the second pass hits the caches
+        for index in range(count):
+            option = _select(at, kind, key, index)
+            rows.append({'page': page, 'interaction': f"{label} ({key})", 'option': option,
+                         'cold': _timed_run(at)})
+        for index, row in enumerate(rows):
+            _select(at, kind, key, index)
+            row['warm'] = _timed_run(at)
+        records.extend(rows)
+        _select(at, kind, key, original)
+        _timed_run(at)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AppTest による各ページ再実行レイテンシの計測")
+    parser.add_argument("--scale", type=int, default=1, choices=sorted(SCALES),
+                        help="データ規模（サンプルデータの倍数、既定: 1）")
+    parser.add_argument("--data-dir", type=Path, default=None,
+                        help="計測に使うデータフォルダ（指定時は --scale を無視）")
+    parser.add_argument("--pages", nargs="+", default=PAGES, help="対象スクリプト（既定: app.py と pages/ の全ページ）")
+    parser.add_argument("--cold-budget", type=float, default=5.0, help="キャッシュなし再実行の上限秒数（既定: 5.0）")
+    parser.add_argument("--warm-budget", type=float, default=1.5, help="キャッシュあり再実行の上限秒数（既定: 1.5）")
+    parser.add_argument("--output", type=Path, default=None, help="結果 JSON の出力先")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or ensure_dataset(args.scale, DATA_ROOT)
+    use_dataset(data_dir)
+
+    records, failures = [], []
+    for script in args.pages:
+        try:
+            page_records = profile_page(script)
+        except RuntimeError as e:
+            failures.append(f"{script}: 例外 {e}")
+            print(f"{script}: ❌ 例外 {e}", flush=True)
+            continue
+        for r in page_records:
+            over = []
+            if r['cold'] > args.cold_budget:
+                over.append(f"cold {r['cold']:.2f}s > {args.cold_budget}s")
+            if r['warm'] > args.warm_budget:
+                over.append(f"warm {r['warm']:.2f}s > {args.warm_budget}s")
+            r['over_budget'] = bool(over)
+            if over:
+                failures.append(f"{r['page']} / {r['interaction']} = {r['option']}: {', '.join(over)}")
+            print(f"{r['page']:14s} {r['interaction']:36s} {r['option']:12s} "
+                  f"cold {r['cold'] * 1000:8.1f} ms  warm {r['warm'] * 1000:8.1f} ms {'❌' if over else ''}",
+                  flush=True)
+        records.extend(page_records)
+
+    if args.output:
+        report = {'environment': environment(), 'data_dir': str(data_dir),
+                  'budgets': {'cold': args.cold_budget, 'warm': args.warm_budget}, 'results': records}
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"\n結果: {args.output}")
+
+    if failures:
+        print(f"\n❌ 予算超過・例外 {len(failures)} 件:")
+        for line in failures:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\n✅ すべての再実行が予算内（cold {args.cold_budget}s / warm {args.warm_budget}s）")
+
+
+if __name__ == "__main__":
+    main()
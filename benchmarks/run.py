@@ -0,0 +1,265 @@
+"""
+Benchmark suite for the data and chart layers
+
+Times the data-layer entry points, every chart helper and each page's full
+rerun on synthetic datasets at 1x/10x/100x/1000x the sample size, recording
+wall time (median and best of --repeat cold runs) and peak traced memory. Results are
+written as JSON and optionally compared with a baseline file. Results are
+printed on stdout; Streamlit's own log messages go to stderr.
+
+Usage (from the repository root):
+    python -m benchmarks.run --scales 1 10 100 --save-baseline
+    python -m benchmarks.run --scales 1 10 100 --baseline benchmarks/baseline.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import plotly
+import streamlit as st
+
+from benchmarks.datasets import SCALES, DATA_ROOT, ensure_dataset, dataset_rows, clear_caches, use_dataset
+from utils.charts import (
+    create_metric_card, create_line_chart, create_area_chart, create_bar_chart,
+    create_pie_chart, create_funnel_chart, create_heatmap
+)
+from utils.data_loader import (
+    load_data, filter_by_date, get_comparison_data, get_date_range, load_filtered,
+    aggregate_by, resample_long
+)
+from utils.filters import COMPARISON_TYPES
+from utils.funnel import compute_funnel
+
+ROOT = Path(__file__).parent.parent
+RESULTS_DIR = Path(__file__).parent / "results"
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+TABLES = [
+    "daily_summary.csv", "page_metrics.csv", "referrer_metrics.csv", "device_metrics.csv",
+    "region_metrics.csv", "product_sales.csv", "conversion_funnel.csv",
+]
+PAGES = ["app.py", "pages/1_Traffic.py", "pages/2_Conversion.py", "pages/3_Behavior.py"]
+
+# Differences smaller than these are treated as noise when comparing with the baseline
+MIN_DELTA_SECONDS = 0.005
+MIN_DELTA_MB = 1.0
+
+
+# ------------------------------------------------------------
+# Cases: name -> (setup(ctx) -> state, run(state, ctx)); setup is not timed
+# ------------------------------------------------------------
+def _period(ctx: dict) -> tuple:
+    return ctx['start'], ctx['end']
+
+
+def _chart(build):
+    """Chart cases build the figure and serialize it, as st.plotly_chart does"""
+    def run(state, ctx):
+        fig = build(state)
+        if fig is not None:
+            fig.to_json()
+    return run
+
+
+def _page(script: str):
+    def setup(ctx):
+        from streamlit.testing.v1 import AppTest
+        return AppTest.from_file(str(ROOT / script), default_timeout=600)
+
+    def run(at, ctx):
+        at.run()
+        if at.exception:
+            raise RuntimeError(f"{script}: {at.exception[0].message}")
+    return setup, run
+
+
+CASES = {
+    # data layer
+    'data/load_data': (
+        lambda ctx: None,
+        lambda state, ctx: [load_data(name) for name in TABLES]),
+    'data/filter_by_date': (
+        lambda ctx: {name: load_data(name) for name in TABLES},
+        lambda state, ctx: [filter_by_date(df, *_period(ctx)) for df in state.values()]),
+    'data/get_comparison_data': (
+        lambda ctx: load_data("daily_summary.csv"),
+        lambda state, ctx: [get_comparison_data(state, *_period(ctx), period_type=p) for p in COMPARISON_TYPES]),
+
+    # chart helpers (inputs cover the whole data range)
+    'chart/create_metric_card': (
+        lambda ctx: load_filtered("daily_summary.csv", ctx['first'], ctx['end'])['revenue'].sum(),
+        lambda state, ctx: create_metric_card("売上", state, 3.2, prefix="¥")),
+    'chart/create_line_chart': (
+        lambda ctx: load_filtered("daily_summary.csv", ctx['first'], ctx['end']),
+        _chart(lambda df: create_line_chart(df, x='date', y='sessions'))),
+    'chart/create_area_chart': (
+        lambda ctx: resample_long("daily_summary.csv", ctx['first'], ctx['end'], 'day',
+                                  {'new_visitors': '新規', 'returning_visitors': 'リピーター'}),
+        _chart(lambda df: create_area_chart(df, x='date', y='値', color='指標'))),
+    'chart/create_bar_chart': (
+        lambda ctx: aggregate_by("page_metrics.csv", ctx['first'], ctx['end'], ('page_name',), {'pageviews': 'sum'}),
+        _chart(lambda df: create_bar_chart(df, x='page_name', y='pageviews'))),
+    'chart/create_pie_chart': (
+        lambda ctx: aggregate_by("referrer_metrics.csv", ctx['first'], ctx['end'], ('referrer_type',),
+                                 {'sessions': 'sum'}),
+        _chart(lambda df: create_pie_chart(df, values='sessions', names='referrer_type'))),
+    'chart/create_funnel_chart': (
+        lambda ctx: compute_funnel(load_filtered("conversion_funnel.csv", ctx['first'], ctx['end'])),
+        _chart(lambda df: create_funnel_chart(df, x='users', y='step_name'))),
+    'chart/create_heatmap': (
+        lambda ctx: load_filtered("page_metrics.csv", ctx['first'], ctx['end']),
+        _chart(lambda df: create_heatmap(df, x='date', y='page_name', z='pageviews'))),
+
+    # full page reruns (every section's aggregation and rendering, cold caches)
+    **{f"page/{Path(script).stem}": _page(script) for script in PAGES},
+}
+
+
+def _context() -> dict:
+    first, last = get_date_range(load_data("daily_summary.csv"))
+    end = last.normalize()
+    return {'first': first.normalize(), 'start': end - pd.Timedelta(days=27), 'end': end}
+
+
+def measure(case: str, ctx: dict, repeat: int, memory: bool = True) -> dict:
+    """Median/min wall time over ``repeat`` cold runs, plus peak traced memory of one extra run"""
+    setup, run = CASES[case]
+    times = []
+    for _ in range(repeat):
+        clear_caches()
+        state = setup(ctx)
+        started = time.perf_counter()
+        run(state, ctx)
+        times.append(time.perf_counter() - started)
+
+    result = {'seconds': statistics.median(times), 'min_seconds': min(times), 'repeat': repeat}
+    if memory:
+        # Measured separately: tracing allocations slows the code down
+        clear_caches()
+        state = setup(ctx)
+        tracemalloc.start()
+        try:
+            run(state, ctx)
+            result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def environment() -> dict:
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'plotly': plotly.__version__,
+        'streamlit': st.__version__,
+    }
+
+
+def run_suite(scales, cases, repeat: int = 5, memory: bool = True, fmt: str = 'csv',
+              data_root: Path = DATA_ROOT) -> dict:
+    report = {'version': 1, 'environment': environment(), 'datasets': {}, 'results': {}}
+    for scale in scales:
+        path = ensure_dataset(scale, data_root, fmt)
+        use_dataset(path)
+        report['datasets'][f"{scale}x"] = {'path': str(path), 'rows': dataset_rows(path), **SCALES[scale]}
+        ctx = _context()
+        for case in cases:
+            result = measure(case, ctx, repeat, memory)
+            report['results'][f"{case}@{scale}x"] = {'case': case, 'scale': scale, **result}
+            peak = f"{result['peak_mb']:9.1f} MB" if 'peak_mb' in result else ""
+            print(f"{case:32s} {scale:>5}x {result['seconds'] * 1000:10.1f} ms {peak}", flush=True)
+    return report
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """Results slower (or using more memory) than the baseline by more than ``threshold``"""
+    regressions = []
+    for key, current in report['results'].items():
+        base = baseline.get('results', {}).get(key)
+        if base is None:
+            continue
+        # Best-of-N time is compared: it is far less sensitive to background noise than the median
+        checks = [('min_seconds', MIN_DELTA_SECONDS, 1000, "ms")]
+        if 'peak_mb' in current and 'peak_mb' in base:
+            checks.append(('peak_mb', MIN_DELTA_MB, 1, "MB"))
+        for field, min_delta, unit_scale, unit in checks:
+            before, after = base[field], current[field]
+            if after > before * (1 + threshold) and after - before > min_delta:
+                regressions.append(f"{key}: {field} {before * unit_scale:.1f} {unit} -> "
+                                   f"{after * unit_scale:.1f} {unit} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="データ層・チャート層・各ページのベンチマーク")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], choices=sorted(SCALES),
+                        help="データ規模（サンプルデータの倍数、既定: 1 10 100）")
+    parser.add_argument("--cases", nargs="+", default=None,
+                        help="実行するケース名の一部（例: data chart/create_heatmap page）。既定: すべて")
+    parser.add_argument("--repeat", type=int, default=5, help="各ケースの実行回数（中央値を記録、既定: 5）")
+    parser.add_argument("--no-memory", action="store_true", help="ピークメモリを計測しない")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="データセットの形式（既定: csv）")
+    parser.add_argument("--data-dir", type=Path, default=DATA_ROOT, help="生成データの保存先")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="結果 JSON の出力先（既定: benchmarks/results/<日時>.json）")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="比較するベースライン JSON")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="回帰とみなす悪化率（既定: 0.2 = 20%%）")
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果をベースラインとして保存する")
+    args = parser.parse_args()
+
+    cases = [case for case in CASES if args.cases is None or any(part in case for part in args.cases)]
+    if not cases:
+        parser.error(f"該当するケースがありません: {args.cases}")
+
+    report = run_suite(args.scales, cases, repeat=args.repeat, memory=not args.no_memory,
+                       fmt=args.format, data_root=args.data_dir)
+
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"\n結果: {output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"ベースラインを保存しました: {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print("ベースラインがないため比較をスキップしました（--save-baseline で作成）")
+        return
+
+    regressions = compare(report, json.loads(args.baseline.read_text(encoding='utf-8')), args.threshold)
+    if regressions:
+        print(f"\n❌ ベースラインより {args.threshold:.0%} 以上悪化したケース:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\n✅ 回帰なし（しきい値 {args.threshold:.0%}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+ダッシュボードのスナップショット作成スクリプト
+
+app.py と各ページを AppTest でヘッドレスに実行し、プリセット・比較期間・異常検知の基準・
+集計単位・セグメントのすべての組み合わせで使われる集計結果（KPI 用の期間データ、
+グループ集計、チャート用の時系列など）を 1 つのスナップショットファイルに保存する。
+ダッシュボードは起動直後からこのファイルをメモリマップして読み、テーブルが更新される
+まではテーブルの読み込みと集計を省略する。
+
+使い方:
+    python build_snapshot.py
+    python build_snapshot.py --data-dir data/large
+    python build_snapshot.py --dataset suite_a     # AA_DASHBOARD_DATASETS_DIR 配下のデータセット
+"""
+import argparse
+import itertools
+import time
+from datetime import datetime
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+from utils import data_loader, datasets
+from utils.snapshot import SNAPSHOT_FILE, recording, write_snapshot
+
+ROOT = Path(__file__).parent
+PAGES = ["app.py", "pages/1_Traffic.py", "pages/2_Conversion.py", "pages/3_Behavior.py"]
+
+# Widgets whose every combination of options is rendered
+CONTROL_LABELS = ("プリセット", "比較期間", "異常検知の基準", "集計単位", "セグメント")
+
+
+def _run(at: AppTest, script: str):
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"{script}: {at.exception[0].message}")
+
+
+def render_all(script: str, timeout: float = 600) -> int:
+    """Render ``script`` for every combination of its controls and return the number of runs"""
+    at = AppTest.from_file(str(ROOT / script), default_timeout=timeout)
+    _run(at, script)
+    controls = [(kind, widget.key, len(widget.options))
+                for kind in ("radio", "selectbox") for widget in getattr(at, kind)
+                if widget.label in CONTROL_LABELS and widget.key]
+    runs = 1
+    for combination in itertools.product(*(range(count) for _, _, count in controls)):
+        for (kind, key, _), index in zip(controls, combination):
+            if kind == "radio":
+                widget = at.radio(key=key)
+                widget.set_value(widget.options[index])
+            else:
+                at.selectbox(key=key).select_index(index)
+        _run(at, script)
+        runs += 1
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全プリセット・全オプションの集計結果を事前計算してスナップショットを作成")
+    parser.add_argument("--data-dir", type=Path, default=data_loader.DATA_DIR,
+                        help="テーブルのフォルダ（既定: sample_data）")
+    parser.add_argument("--dataset", default=None,
+                        help="AA_DASHBOARD_DATASETS_DIR 配下のデータセット名（--data-dir の代わりに指定）")
+    parser.add_argument("--output", "-o", type=Path, default=None,
+                        help=f"出力先（既定: <データフォルダ>/{SNAPSHOT_FILE}。"
+                             "既定以外の場所は環境変数 AA_DASHBOARD_SNAPSHOT で指定）")
+    parser.add_argument("--pages", nargs="+", default=PAGES, help="対象スクリプト（既定: app.py と pages/ の全ページ）")
+    args = parser.parse_args()
+
+    if args.dataset:
+        if args.dataset not in datasets.list_datasets():
+            parser.error(f"データセットが見つかりません: {args.dataset}（AA_DASHBOARD_DATASETS_DIR を確認してください）")
+        # The rendered sessions select this dataset, so the entries match the dashboard's keys
+        datasets.DEFAULT_DATASET = args.dataset
+        args.data_dir = datasets.dataset_dir(args.dataset)
+    else:
+        datasets.DATASETS_DIR = None
+    data_loader.DATA_DIR = args.data_dir
+    output = args.output or args.data_dir / SNAPSHOT_FILE
+
+    started = time.perf_counter()
+    with recording() as entries:
+        for script in args.pages:
+            page_started = time.perf_counter()
+            runs = render_all(script)
+            print(f"{script}: {runs} 通り ({time.perf_counter() - page_started:.1f}s)", flush=True)
+
+    tables = sorted(p.name for p in args.data_dir.iterdir() if p.suffix in ('.csv', '.parquet'))
+    meta = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'data_dir': str(args.data_dir.resolve()),
+        'versions': {name: data_loader.get_data_version(name) for name in tables},
+        'pages': args.pages,
+    }
+    size = write_snapshot(output, entries, meta)
+
+    print(f"\n✅ スナップショット作成完了! ({time.perf_counter() - started:.1f}s)")
+    print(f"出力先: {output}（{len(entries)} 件、{size / 1024 ** 2:.1f} MB）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+レポート一括出力スクリプト
+
+複数の期間とセグメント（事業部ごとの地域・デバイスなど）の組み合わせについて、
+全ページの KPI・グラフ・詳細テーブルをまとめた HTML / PDF レポートを一括で作成する。
+集計はダッシュボードと同じ処理を使い、グラフの画像化（kaleido）はプロセスプールで並列に行う。
+
+使い方:
+    python export_reports.py                                   # 直近 7 日・全体の HTML
+    python export_reports.py --weeks 4 --segments-by region --format html pdf
+    python export_reports.py --period 2025-01-01:2025-01-14 --segment device=mobile --segment device=desktop
+"""
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from utils import data_loader, datasets
+from utils.data_loader import load_data, get_date_range
+from utils.filters import COMPARISON_TYPES
+from utils.reports import ReportSpec, SEGMENT_TABLES, export_reports, segment_values, static_image_available
+
+
+def _period(text: str) -> tuple:
+    try:
+        start, end = (pd.Timestamp(part) for part in text.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"期間は YYYY-MM-DD:YYYY-MM-DD で指定してください: {text}")
+    return start, end
+
+
+def _segment(text: str) -> tuple:
+    dimension, sep, value = text.partition("=")
+    if not sep or dimension not in SEGMENT_TABLES:
+        raise argparse.ArgumentTypeError(f"セグメントは <{'|'.join(SEGMENT_TABLES)}>=<値> で指定してください: {text}")
+    return dimension, value
+
+
+def weekly_periods(last_date: pd.Timestamp, weeks: int) -> list:
+    """The last ``weeks`` complete Monday-Sunday weeks up to ``last_date``, oldest first"""
+    last_sunday = last_date.normalize() - pd.Timedelta(days=(last_date.weekday() + 1) % 7)
+    return [(last_sunday - pd.Timedelta(days=7 * i + 6), last_sunday - pd.Timedelta(days=7 * i))
+            for i in reversed(range(weeks))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="期間・セグメント別の HTML / PDF レポートを一括作成")
+    parser.add_argument("--period", type=_period, action="append", default=[],
+                        help="対象期間 YYYY-MM-DD:YYYY-MM-DD（複数指定可）")
+    parser.add_argument("--weeks", type=int, default=0, help="データ末尾までの直近 N 週（月〜日）を週次レポートとして追加")
+    parser.add_argument("--segment", type=_segment, action="append", default=[],
+                        help="セグメント <列>=<値>（例: region=東京、複数指定可）")
+    parser.add_argument("--segments-by", choices=list(SEGMENT_TABLES), default=None,
+                        help="指定した列の値ごとにレポートを作成（例: region で地域別）")
+    parser.add_argument("--no-overall", action="store_true", help="全体（セグメントなし）のレポートを作成しない")
+    parser.add_argument("--comparison", choices=COMPARISON_TYPES, default=COMPARISON_TYPES[0],
+                        help=f"KPI の比較期間（既定: {COMPARISON_TYPES[0]}）")
+    parser.add_argument("--format", nargs="+", choices=["html", "pdf"], default=["html"],
+                        help="出力形式（既定: html、pdf には kaleido と Chrome が必要）")
+    parser.add_argument("--output", "-o", type=Path, default=Path("reports"), help="出力先フォルダ（既定: reports）")
+    parser.add_argument("--workers", type=int, default=None, help="画像化の並列プロセス数（既定: CPU コア数）")
+    parser.add_argument("--data-dir", type=Path, default=None, help="テーブルのフォルダ（既定: sample_data）")
+    parser.add_argument("--dataset", default=None,
+                        help="AA_DASHBOARD_DATASETS_DIR 配下のデータセット名（--data-dir の代わりに指定）")
+    args = parser.parse_args()
+
+    if args.dataset:
+        if args.dataset not in datasets.list_datasets():
+            parser.error(f"データセットが見つかりません: {args.dataset}（AA_DASHBOARD_DATASETS_DIR を確認してください）")
+        data_loader.DATA_DIR = datasets.dataset_dir(args.dataset)
+    elif args.data_dir:
+        data_loader.DATA_DIR = args.data_dir
+    if "pdf" in args.format and not static_image_available():
+        parser.error("PDF 出力には kaleido と Chrome が必要です（pip install kaleido && kaleido_get_chrome）")
+
+    min_date, max_date = get_date_range(load_data("daily_summary.csv"))
+    if min_date is None:
+        parser.error("データが見つかりません。")
+    periods = list(args.period) + weekly_periods(max_date, args.weeks)
+    if not periods:
+        periods = [(max_date.normalize() - pd.Timedelta(days=6), max_date.normalize())]
+
+    segments = [] if args.no_overall else [()]
+    segments += [(segment,) for segment in args.segment]
+    if args.segments_by:
+        segments += [((args.segments_by, value),) for value in segment_values(args.segments_by)]
+    if not segments:
+        parser.error("作成するレポートがありません（--no-overall には --segment か --segments-by が必要です）")
+
+    specs = [ReportSpec(start, end, filters, args.comparison) for start, end in periods for filters in segments]
+    print(f"レポート: {len(specs)} 件（期間 {len(periods)} × セグメント {len(segments)}）")
+    if not static_image_available():
+        print("kaleido（または Chrome）が使えないため、HTML にはインタラクティブなグラフを埋め込みます")
+
+    started = time.perf_counter()
+    paths = export_reports(specs, args.output, formats=tuple(args.format), workers=args.workers)
+
+    print(f"\n✅ レポート出力完了! ({time.perf_counter() - started:.1f}s)")
+    print(f"出力先: {args.output}（{len(paths)} ファイル）")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,373 +1,442 @@
 """
 Adobe Analytics風サンプルデータ生成スクリプト
+
+日数・ページ数・流入元数・商品数・地域数・時間粒度を指定して、ダッシュボード用の
+テーブルを NumPy のベクトル演算で生成する。行はチャンク単位で書き出すため、
+数千万行規模でもメモリ使用量はチャンクサイズに収まる。
+
+使い方:
+    python generate_sample_data.py
+    python generate_sample_data.py --days 365 --pages 5000 --hourly --format parquet --output data/large
 """
-import pandas as pd
+import argparse
+import time
+from pathlib import Path
+
 import numpy as np
-from datetime import datetime, timedelta
-import random
-
-# 乱数シード固定（再現性のため）
-np.random.seed(42)
-random.seed(42)
-
-# 期間設定（過去90日分）
-end_date = datetime(2025, 1, 15)
-start_date = end_date - timedelta(days=89)
-dates = pd.date_range(start=start_date, end=end_date, freq='D')
-
-# マスターデータ
-pages = [
-    {'page_name': 'トップページ', 'page_url': '/', 'category': 'TOP'},
-    {'page_name': '商品一覧', 'page_url': '/products', 'category': '商品'},
-    {'page_name': '商品詳細 - スマートフォン', 'page_url': '/products/smartphone', 'category': '商品'},
-    {'page_name': '商品詳細 - ノートPC', 'page_url': '/products/laptop', 'category': '商品'},
-    {'page_name': '商品詳細 - タブレット', 'page_url': '/products/tablet', 'category': '商品'},
-    {'page_name': '商品詳細 - イヤホン', 'page_url': '/products/earphone', 'category': '商品'},
-    {'page_name': 'カート', 'page_url': '/cart', 'category': 'CV'},
-    {'page_name': '購入手続き', 'page_url': '/checkout', 'category': 'CV'},
-    {'page_name': '購入完了', 'page_url': '/thanks', 'category': 'CV'},
-    {'page_name': '会社概要', 'page_url': '/about', 'category': 'その他'},
-    {'page_name': 'お問い合わせ', 'page_url': '/contact', 'category': 'その他'},
-    {'page_name': '検索結果', 'page_url': '/search', 'category': '検索'},
-]
+import pandas as pd
 
-referrers = [
-    {'referrer': 'google', 'referrer_type': 'Organic Search'},
-    {'referrer': 'yahoo', 'referrer_type': 'Organic Search'},
-    {'referrer': 'bing', 'referrer_type': 'Organic Search'},
-    {'referrer': 'facebook', 'referrer_type': 'Social'},
-    {'referrer': 'twitter', 'referrer_type': 'Social'},
-    {'referrer': 'instagram', 'referrer_type': 'Social'},
-    {'referrer': 'line', 'referrer_type': 'Social'},
-    {'referrer': 'google_ads', 'referrer_type': 'Paid Search'},
-    {'referrer': 'yahoo_ads', 'referrer_type': 'Paid Search'},
-    {'referrer': 'direct', 'referrer_type': 'Direct'},
-    {'referrer': 'email', 'referrer_type': 'Email'},
-    {'referrer': 'affiliate', 'referrer_type': 'Affiliate'},
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow は Parquet 出力と CSV の高速書き出しにのみ使う
+    pa = None
+
+# ============================================================
+# マスターデータ（既定値。指定数がこれを超える分は自動生成する）
+# ============================================================
+PAGES = [
+    {'page_name': 'トップページ', 'page_url': '/', 'page_category': 'TOP', 'weight': 0.25},
+    {'page_name': '商品一覧', 'page_url': '/products', 'page_category': '商品', 'weight': 0.18},
+    {'page_name': '商品詳細 - スマートフォン', 'page_url': '/products/smartphone', 'page_category': '商品', 'weight': 0.12},
+    {'page_name': '商品詳細 - ノートPC', 'page_url': '/products/laptop', 'page_category': '商品', 'weight': 0.10},
+    {'page_name': '商品詳細 - タブレット', 'page_url': '/products/tablet', 'page_category': '商品', 'weight': 0.06},
+    {'page_name': '商品詳細 - イヤホン', 'page_url': '/products/earphone', 'page_category': '商品', 'weight': 0.05},
+    {'page_name': 'カート', 'page_url': '/cart', 'page_category': 'CV', 'weight': 0.08},
+    {'page_name': '購入手続き', 'page_url': '/checkout', 'page_category': 'CV', 'weight': 0.04},
+    {'page_name': '購入完了', 'page_url': '/thanks', 'page_category': 'CV', 'weight': 0.03},
+    {'page_name': '会社概要', 'page_url': '/about', 'page_category': 'その他', 'weight': 0.03},
+    {'page_name': 'お問い合わせ', 'page_url': '/contact', 'page_category': 'その他', 'weight': 0.02},
+    {'page_name': '検索結果', 'page_url': '/search', 'page_category': '検索', 'weight': 0.04},
 ]
 
-devices = ['desktop', 'mobile', 'tablet']
-device_weights = [0.35, 0.55, 0.10]
+REFERRERS = [
+    {'referrer': 'google', 'referrer_type': 'Organic Search', 'weight': 0.30},
+    {'referrer': 'yahoo', 'referrer_type': 'Organic Search', 'weight': 0.10},
+    {'referrer': 'bing', 'referrer_type': 'Organic Search', 'weight': 0.03},
+    {'referrer': 'facebook', 'referrer_type': 'Social', 'weight': 0.05},
+    {'referrer': 'twitter', 'referrer_type': 'Social', 'weight': 0.04},
+    {'referrer': 'instagram', 'referrer_type': 'Social', 'weight': 0.06},
+    {'referrer': 'line', 'referrer_type': 'Social', 'weight': 0.04},
+    {'referrer': 'google_ads', 'referrer_type': 'Paid Search', 'weight': 0.12},
+    {'referrer': 'yahoo_ads', 'referrer_type': 'Paid Search', 'weight': 0.05},
+    {'referrer': 'direct', 'referrer_type': 'Direct', 'weight': 0.12},
+    {'referrer': 'email', 'referrer_type': 'Email', 'weight': 0.05},
+    {'referrer': 'affiliate', 'referrer_type': 'Affiliate', 'weight': 0.04},
+]
 
-browsers = ['Chrome', 'Safari', 'Edge', 'Firefox', 'Other']
-browser_weights = [0.45, 0.30, 0.12, 0.08, 0.05]
+DEVICES = [
+    {'device': 'desktop', 'weight': 0.35, 'cvr_factor': 1.3},
+    {'device': 'mobile', 'weight': 0.55, 'cvr_factor': 0.85},
+    {'device': 'tablet', 'weight': 0.10, 'cvr_factor': 1.0},
+]
 
-regions = ['東京', '大阪', '神奈川', '愛知', '福岡', '北海道', '埼玉', '千葉', '兵庫', 'その他']
-region_weights = [0.25, 0.12, 0.10, 0.08, 0.06, 0.05, 0.07, 0.06, 0.05, 0.16]
+REGIONS = [
+    {'region': '東京', 'weight': 0.25},
+    {'region': '大阪', 'weight': 0.12},
+    {'region': '神奈川', 'weight': 0.10},
+    {'region': '愛知', 'weight': 0.08},
+    {'region': '福岡', 'weight': 0.06},
+    {'region': '北海道', 'weight': 0.05},
+    {'region': '埼玉', 'weight': 0.07},
+    {'region': '千葉', 'weight': 0.06},
+    {'region': '兵庫', 'weight': 0.05},
+    {'region': 'その他', 'weight': 0.16},
+]
 
-products = [
-    {'product_id': 'SP001', 'product_name': 'スマートフォン Pro', 'product_category': 'スマートフォン', 'price': 89800},
-    {'product_id': 'SP002', 'product_name': 'スマートフォン Lite', 'product_category': 'スマートフォン', 'price': 49800},
-    {'product_id': 'LP001', 'product_name': 'ノートPC 15インチ', 'product_category': 'ノートPC', 'price': 129800},
-    {'product_id': 'LP002', 'product_name': 'ノートPC 13インチ', 'product_category': 'ノートPC', 'price': 98000},
-    {'product_id': 'TB001', 'product_name': 'タブレット 10インチ', 'product_category': 'タブレット', 'price': 59800},
-    {'product_id': 'EP001', 'product_name': 'ワイヤレスイヤホン', 'product_category': 'イヤホン', 'price': 19800},
-    {'product_id': 'EP002', 'product_name': 'ノイズキャンセリングイヤホン', 'product_category': 'イヤホン', 'price': 34800},
+PRODUCTS = [
+    {'product_id': 'SP001', 'product_name': 'スマートフォン Pro', 'product_category': 'スマートフォン', 'unit_price': 89800, 'weight': 0.25},
+    {'product_id': 'SP002', 'product_name': 'スマートフォン Lite', 'product_category': 'スマートフォン', 'unit_price': 49800, 'weight': 0.15},
+    {'product_id': 'LP001', 'product_name': 'ノートPC 15インチ', 'product_category': 'ノートPC', 'unit_price': 129800, 'weight': 0.20},
+    {'product_id': 'LP002', 'product_name': 'ノートPC 13インチ', 'product_category': 'ノートPC', 'unit_price': 98000, 'weight': 0.12},
+    {'product_id': 'TB001', 'product_name': 'タブレット 10インチ', 'product_category': 'タブレット', 'unit_price': 59800, 'weight': 0.10},
+    {'product_id': 'EP001', 'product_name': 'ワイヤレスイヤホン', 'product_category': 'イヤホン', 'unit_price': 19800, 'weight': 0.10},
+    {'product_id': 'EP002', 'product_name': 'ノイズキャンセリングイヤホン', 'product_category': 'イヤホン', 'unit_price': 34800, 'weight': 0.08},
 ]
 
-# ============================================================
-# 1. 日別サマリーデータ
-# ============================================================
-daily_data = []
-
-for date in dates:
-    # 曜日による変動（週末は増加）
-    weekday = date.weekday()
-    weekday_factor = 1.3 if weekday >= 5 else 1.0
-
-    # 月による季節変動
-    month = date.month
-    if month in [11, 12]:  # 年末商戦
-        season_factor = 1.4
-    elif month in [1]:  # 初売り
-        season_factor = 1.2
-    else:
-        season_factor = 1.0
-
-    base_visitors = int(np.random.normal(5000, 800) * weekday_factor * season_factor)
-    base_sessions = int(base_visitors * np.random.uniform(1.2, 1.5))
-    base_pageviews = int(base_sessions * np.random.uniform(3.5, 5.0))
-
-    # コンバージョン（CVR 2-4%）
-    cvr = np.random.uniform(0.02, 0.04) * season_factor
-    conversions = int(base_sessions * cvr)
-
-    # 売上
-    avg_order_value = np.random.normal(45000, 15000)
-    revenue = int(conversions * avg_order_value)
-
-    # その他指標
-    bounce_rate = np.random.uniform(0.35, 0.50)
-    avg_session_duration = np.random.uniform(120, 300)  # 秒
-    pages_per_session = base_pageviews / base_sessions if base_sessions > 0 else 0
-
-    daily_data.append({
-        'date': date.strftime('%Y-%m-%d'),
-        'visitors': base_visitors,
-        'new_visitors': int(base_visitors * np.random.uniform(0.6, 0.75)),
-        'returning_visitors': int(base_visitors * np.random.uniform(0.25, 0.4)),
-        'sessions': base_sessions,
-        'pageviews': base_pageviews,
-        'conversions': conversions,
-        'revenue': revenue,
-        'bounce_rate': round(bounce_rate, 4),
-        'avg_session_duration': round(avg_session_duration, 2),
-        'pages_per_session': round(pages_per_session, 2),
-    })
+# 流入元タイプ別の CVR 係数（その他のタイプは 0.8）
+REFERRER_CVR_FACTORS = {'Paid Search': 1.3, 'Email': 1.5, 'Organic Search': 1.0, 'Direct': 1.2}
+
+FUNNEL_STEPS = ['商品閲覧', 'カート追加', '購入手続き開始', '購入完了']
+
+# 時間帯別のトラフィック配分（0 時〜23 時、夜と昼休みにピーク）
+HOURLY_PROFILE = np.array([
+    1.6, 1.0, 0.6, 0.4, 0.4, 0.6, 1.4, 2.8, 3.9, 4.4, 4.8, 5.2,
+    5.9, 5.4, 4.9, 4.7, 4.6, 4.8, 5.3, 6.0, 6.6, 6.9, 5.8, 3.5,
+])
+HOURLY_PROFILE = HOURLY_PROFILE / HOURLY_PROFILE.sum()
+
+# 1 回に生成・書き出す最大行数
+CHUNK_ROWS = 2_000_000
 
-df_daily = pd.DataFrame(daily_data)
-df_daily.to_csv('/Users/yoheinakanishi/Dev/test/sample_data/daily_summary.csv', index=False, encoding='utf-8-sig')
-print(f"daily_summary.csv: {len(df_daily)} rows")
 
 # ============================================================
-# 2. ページ別データ（日別×ページ）
+# マスター生成
 # ============================================================
-page_data = []
-
-# ページの人気度重み
-page_weights = {
-    '/': 0.25,
-    '/products': 0.18,
-    '/products/smartphone': 0.12,
-    '/products/laptop': 0.10,
-    '/products/tablet': 0.06,
-    '/products/earphone': 0.05,
-    '/cart': 0.08,
-    '/checkout': 0.04,
-    '/thanks': 0.03,
-    '/about': 0.03,
-    '/contact': 0.02,
-    '/search': 0.04,
-}
-
-for date in dates:
-    total_pv = df_daily[df_daily['date'] == date.strftime('%Y-%m-%d')]['pageviews'].values[0]
-
-    for page in pages:
-        weight = page_weights.get(page['page_url'], 0.05)
-        pv = int(total_pv * weight * np.random.uniform(0.8, 1.2))
-        unique_pv = int(pv * np.random.uniform(0.6, 0.85))
-
-        # 離脱率（ページにより異なる）
-        if page['category'] == 'CV':
-            exit_rate = np.random.uniform(0.1, 0.3) if page['page_url'] == '/thanks' else np.random.uniform(0.2, 0.4)
-        else:
-            exit_rate = np.random.uniform(0.25, 0.55)
-
-        avg_time = np.random.uniform(30, 180)
-
-        page_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'page_name': page['page_name'],
-            'page_url': page['page_url'],
-            'page_category': page['category'],
-            'pageviews': pv,
-            'unique_pageviews': unique_pv,
-            'avg_time_on_page': round(avg_time, 2),
-            'exit_rate': round(exit_rate, 4),
-            'entrances': int(unique_pv * np.random.uniform(0.2, 0.5)),
-        })
-
-df_pages = pd.DataFrame(page_data)
-df_pages.to_csv('/Users/yoheinakanishi/Dev/test/sample_data/page_metrics.csv', index=False, encoding='utf-8-sig')
-print(f"page_metrics.csv: {len(df_pages)} rows")
+def _long_tail(count: int) -> np.ndarray:
+    """Zipf-like weights for generated members beyond the defaults"""
+    return 0.02 / np.arange(1, count + 1) ** 0.8
+
+
+def _master(defaults: list, count: int, extra) -> pd.DataFrame:
+    """First ``count`` members: the defaults, then ``extra(i)`` rows with long-tail weights"""
+    rows = defaults[:count] + [extra(i) for i in range(1, count - len(defaults) + 1)]
+    df = pd.DataFrame(rows)
+    if count > len(defaults):
+        df.loc[len(defaults):, 'weight'] = _long_tail(count - len(defaults))
+    df['weight'] = df['weight'] / df['weight'].sum()
+    return df
+
+
+def build_masters(pages: int = 12, referrers: int = 12, products: int = 7, regions: int = 10,
+                  seed: int = 42) -> dict:
+    """Dimension members for each table, extended with generated members when asked for more"""
+    rng = np.random.default_rng(seed + 1)
+    categories = ['スマートフォン', 'ノートPC', 'タブレット', 'イヤホン']
+    return {
+        'pages': _master(PAGES, pages, lambda i: {
+            'page_name': f'商品詳細 - 商品{i:05d}', 'page_url': f'/products/item{i:05d}',
+            'page_category': '商品'}),
+        'referrers': _master(REFERRERS, referrers, lambda i: {
+            'referrer': f'referral_{i:04d}', 'referrer_type': 'Referral'}),
+        'devices': pd.DataFrame(DEVICES),
+        'regions': _master(REGIONS, regions, lambda i: {'region': f'地域{i:03d}'}),
+        'products': _master(PRODUCTS, products, lambda i: {
+            'product_id': f'XX{i:05d}', 'product_name': f'商品 {i:05d}',
+            'product_category': categories[i % len(categories)],
+            'unit_price': int(rng.integers(20, 1500)) * 100}),
+    }
+
 
 # ============================================================
-# 3. 流入元別データ（日別×流入元）
+# 時系列（日別サマリー）
 # ============================================================
-referrer_data = []
-
-# 流入元の重み
-ref_weights = {
-    'google': 0.30,
-    'yahoo': 0.10,
-    'bing': 0.03,
-    'facebook': 0.05,
-    'twitter': 0.04,
-    'instagram': 0.06,
-    'line': 0.04,
-    'google_ads': 0.12,
-    'yahoo_ads': 0.05,
-    'direct': 0.12,
-    'email': 0.05,
-    'affiliate': 0.04,
-}
-
-for date in dates:
-    daily_row = df_daily[df_daily['date'] == date.strftime('%Y-%m-%d')].iloc[0]
-    total_sessions = daily_row['sessions']
-    total_cv = daily_row['conversions']
-    total_revenue = daily_row['revenue']
-
-    for ref in referrers:
-        weight = ref_weights.get(ref['referrer'], 0.05)
-        sessions = int(total_sessions * weight * np.random.uniform(0.8, 1.2))
-
-        # 流入元によってCVRが異なる
-        if ref['referrer_type'] == 'Paid Search':
-            cvr_factor = 1.3
-        elif ref['referrer_type'] == 'Email':
-            cvr_factor = 1.5
-        elif ref['referrer_type'] == 'Organic Search':
-            cvr_factor = 1.0
-        elif ref['referrer_type'] == 'Direct':
-            cvr_factor = 1.2
-        else:
-            cvr_factor = 0.8
-
-        cv = int(sessions * (total_cv / total_sessions) * cvr_factor * np.random.uniform(0.7, 1.3)) if total_sessions > 0 else 0
-        revenue = int(cv * (total_revenue / total_cv)) if total_cv > 0 else 0
-
-        referrer_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'referrer': ref['referrer'],
-            'referrer_type': ref['referrer_type'],
-            'sessions': sessions,
-            'visitors': int(sessions * np.random.uniform(0.7, 0.9)),
-            'pageviews': int(sessions * np.random.uniform(3.0, 5.0)),
-            'conversions': cv,
-            'revenue': revenue,
-            'bounce_rate': round(np.random.uniform(0.3, 0.55), 4),
-        })
-
-df_referrers = pd.DataFrame(referrer_data)
-df_referrers.to_csv('/Users/yoheinakanishi/Dev/test/sample_data/referrer_metrics.csv', index=False, encoding='utf-8-sig')
-print(f"referrer_metrics.csv: {len(df_referrers)} rows")
+def build_timeline(days: int = 90, end_date: str = "2025-01-15", hourly: bool = False,
+                   visitors: int = 5000, seed: int = 42) -> pd.DataFrame:
+    """Site totals per day (or per hour) that every breakdown table is scaled from"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=pd.Timestamp(end_date), periods=days, freq='D')
+    n = len(dates)
+
+    # 曜日による変動（週末は増加）と月による季節変動（年末商戦・初売り）
+    weekday_factor = np.where(dates.weekday >= 5, 1.3, 1.0)
+    season_factor = np.select([dates.month.isin([11, 12]), dates.month == 1], [1.4, 1.2], 1.0)
+
+    day_visitors = np.maximum(rng.normal(visitors, visitors * 0.16, n) * weekday_factor * season_factor, 0)
+    day_sessions = day_visitors * rng.uniform(1.2, 1.5, n)
+    day_pageviews = day_sessions * rng.uniform(3.5, 5.0, n)
+    day_conversions = day_sessions * rng.uniform(0.02, 0.04, n) * season_factor
+    day_revenue = day_conversions * np.maximum(rng.normal(45000, 15000, n), 0)
+
+    if hourly:
+        shares = HOURLY_PROFILE * rng.uniform(0.85, 1.15, (n, 24))
+        shares /= shares.sum(axis=1, keepdims=True)
+        timestamps = (dates.values[:, None] + np.arange(24) * np.timedelta64(1, 'h')).ravel()
+        split = lambda values: (values[:, None] * shares).ravel()
+        day_visitors, day_sessions, day_pageviews, day_conversions, day_revenue = map(
+            split, (day_visitors, day_sessions, day_pageviews, day_conversions, day_revenue))
+        dates = pd.DatetimeIndex(timestamps)
+        n = len(dates)
+
+    visitors_ = day_visitors.astype(np.int64)
+    sessions = day_sessions.astype(np.int64)
+    pageviews = day_pageviews.astype(np.int64)
+    conversions = day_conversions.astype(np.int64)
+    return pd.DataFrame({
+        'date': dates,
+        'visitors': visitors_,
+        'new_visitors': (visitors_ * rng.uniform(0.6, 0.75, n)).astype(np.int64),
+        'returning_visitors': (visitors_ * rng.uniform(0.25, 0.4, n)).astype(np.int64),
+        'sessions': sessions,
+        'pageviews': pageviews,
+        'conversions': conversions,
+        'revenue': (conversions * np.divide(day_revenue, day_conversions, out=np.zeros(n),
+                                            where=day_conversions > 0)).astype(np.int64),
+        'bounce_rate': rng.uniform(0.35, 0.50, n).round(4),
+        'avg_session_duration': rng.uniform(120, 300, n).round(2),
+        'pages_per_session': np.divide(pageviews, sessions, out=np.zeros(n), where=sessions > 0).round(2),
+    })
+
 
 # ============================================================
-# 4. デバイス・ブラウザ別データ（日別）
+# 内訳テーブル（時系列 × ディメンション、チャンク単位）
 # ============================================================
-device_data = []
-
-for date in dates:
-    daily_row = df_daily[df_daily['date'] == date.strftime('%Y-%m-%d')].iloc[0]
-    total_sessions = daily_row['sessions']
-    total_cv = daily_row['conversions']
-    total_revenue = daily_row['revenue']
-
-    for i, device in enumerate(devices):
-        weight = device_weights[i]
-        sessions = int(total_sessions * weight * np.random.uniform(0.9, 1.1))
-
-        # デバイスによるCVR差
-        if device == 'desktop':
-            cvr_factor = 1.3
-        elif device == 'mobile':
-            cvr_factor = 0.85
+def _ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    return np.divide(num, den, out=np.zeros(np.broadcast(num, den).shape), where=den > 0)
+
+
+def _grid(dates, master: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    """len(dates) x len(master) rows: date, the master's attributes, then the generated columns"""
+    n, d = len(dates), len(master)
+    member = np.tile(np.arange(d), n)
+    out = {'date': pd.Categorical.from_codes(np.repeat(np.arange(n), d), dates)
+           if isinstance(dates, pd.Index) and dates.dtype == object else np.repeat(np.asarray(dates), d)}
+    for column in master.columns.drop(['weight', 'cvr_factor'], errors='ignore'):
+        codes, uniques = pd.factorize(master[column])
+        if pd.api.types.is_numeric_dtype(uniques):
+            out[column] = uniques.to_numpy()[codes[member]]
         else:
-            cvr_factor = 1.0
-
-        cv = int(sessions * (total_cv / total_sessions) * cvr_factor) if total_sessions > 0 else 0
-        revenue = int(cv * (total_revenue / total_cv)) if total_cv > 0 else 0
-
-        device_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'device': device,
-            'sessions': sessions,
-            'visitors': int(sessions * np.random.uniform(0.7, 0.9)),
-            'pageviews': int(sessions * np.random.uniform(3.5, 5.5)),
-            'conversions': cv,
-            'revenue': revenue,
-            'bounce_rate': round(np.random.uniform(0.3, 0.5), 4),
-        })
-
-df_devices = pd.DataFrame(device_data)
-df_devices.to_csv('/Users/yoheinakanishi/Dev/test/sample_data/device_metrics.csv', index=False, encoding='utf-8-sig')
-print(f"device_metrics.csv: {len(df_devices)} rows")
+            out[column] = pd.Categorical.from_codes(codes[member], uniques)
+    out.update({name: values.ravel() for name, values in columns.items()})
+    return pd.DataFrame(out)
+
+
+def page_chunk(rng, t: pd.DataFrame, dates, master: pd.DataFrame) -> pd.DataFrame:
+    shape = (len(t), len(master))
+    pv = (t['pageviews'].to_numpy()[:, None] * master['weight'].to_numpy() * rng.uniform(0.8, 1.2, shape)).astype(np.int64)
+    unique_pv = (pv * rng.uniform(0.6, 0.85, shape)).astype(np.int64)
+    # 離脱率（購入完了 < CV ページ < その他）
+    is_cv = (master['page_category'] == 'CV').to_numpy()
+    is_thanks = (master['page_url'] == '/thanks').to_numpy()
+    low = np.select([is_thanks, is_cv], [0.1, 0.2], 0.25)
+    high = np.select([is_thanks, is_cv], [0.3, 0.4], 0.55)
+    return _grid(dates, master, {
+        'pageviews': pv,
+        'unique_pageviews': unique_pv,
+        'avg_time_on_page': rng.uniform(30, 180, shape).round(2),
+        'exit_rate': (low + (high - low) * rng.uniform(0, 1, shape)).round(4),
+        'entrances': (unique_pv * rng.uniform(0.2, 0.5, shape)).astype(np.int64),
+    })
 
-# ============================================================
-# 5. 地域別データ（日別）
-# ============================================================
-region_data = []
-
-for date in dates:
-    daily_row = df_daily[df_daily['date'] == date.strftime('%Y-%m-%d')].iloc[0]
-    total_sessions = daily_row['sessions']
-    total_cv = daily_row['conversions']
-    total_revenue = daily_row['revenue']
-
-    for i, region in enumerate(regions):
-        weight = region_weights[i]
-        sessions = int(total_sessions * weight * np.random.uniform(0.85, 1.15))
-        cv = int(total_cv * weight * np.random.uniform(0.8, 1.2))
-        revenue = int(cv * (total_revenue / total_cv)) if total_cv > 0 else 0
-
-        region_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'region': region,
-            'sessions': sessions,
-            'visitors': int(sessions * np.random.uniform(0.7, 0.9)),
-            'pageviews': int(sessions * np.random.uniform(3.5, 5.0)),
-            'conversions': cv,
-            'revenue': revenue,
-        })
-
-df_regions = pd.DataFrame(region_data)
-df_regions.to_csv('/Users/yoheinakanishi/Dev/test/sample_data/region_metrics.csv', index=False, encoding='utf-8-sig')
-print(f"region_metrics.csv: {len(df_regions)} rows")
 
-# ============================================================
-# 6. 商品別売上データ（日別）
-# ============================================================
-product_data = []
-
-for date in dates:
-    daily_row = df_daily[df_daily['date'] == date.strftime('%Y-%m-%d')].iloc[0]
-    total_cv = daily_row['conversions']
-
-    # 商品の人気度
-    product_weights = [0.25, 0.15, 0.20, 0.12, 0.10, 0.10, 0.08]
-
-    for i, product in enumerate(products):
-        weight = product_weights[i]
-        quantity = int(total_cv * weight * np.random.uniform(0.7, 1.3))
-        revenue = quantity * product['price']
-
-        product_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'product_id': product['product_id'],
-            'product_name': product['product_name'],
-            'product_category': product['product_category'],
-            'unit_price': product['price'],
-            'quantity': quantity,
-            'revenue': revenue,
-        })
-
-df_products = pd.DataFrame(product_data)
-df_products.to_csv('/Users/yoheinakanishi/Dev/test/sample_data/product_sales.csv', index=False, encoding='utf-8-sig')
-print(f"product_sales.csv: {len(df_products)} rows")
+def referrer_chunk(rng, t: pd.DataFrame, dates, master: pd.DataFrame) -> pd.DataFrame:
+    shape = (len(t), len(master))
+    total_sessions = t['sessions'].to_numpy()[:, None]
+    total_cv = t['conversions'].to_numpy()[:, None]
+    sessions = (total_sessions * master['weight'].to_numpy() * rng.uniform(0.8, 1.2, shape)).astype(np.int64)
+    cvr_factor = master['referrer_type'].map(REFERRER_CVR_FACTORS).fillna(0.8).to_numpy()
+    cv = (sessions * _ratio(total_cv, total_sessions) * cvr_factor * rng.uniform(0.7, 1.3, shape)).astype(np.int64)
+    return _grid(dates, master, {
+        'sessions': sessions,
+        'visitors': (sessions * rng.uniform(0.7, 0.9, shape)).astype(np.int64),
+        'pageviews': (sessions * rng.uniform(3.0, 5.0, shape)).astype(np.int64),
+        'conversions': cv,
+        'revenue': (cv * _ratio(t['revenue'].to_numpy()[:, None], total_cv)).astype(np.int64),
+        'bounce_rate': rng.uniform(0.3, 0.55, shape).round(4),
+    })
+
+
+def device_chunk(rng, t: pd.DataFrame, dates, master: pd.DataFrame) -> pd.DataFrame:
+    shape = (len(t), len(master))
+    total_sessions = t['sessions'].to_numpy()[:, None]
+    total_cv = t['conversions'].to_numpy()[:, None]
+    sessions = (total_sessions * master['weight'].to_numpy() * rng.uniform(0.9, 1.1, shape)).astype(np.int64)
+    cv = (sessions * _ratio(total_cv, total_sessions) * master['cvr_factor'].to_numpy()).astype(np.int64)
+    return _grid(dates, master, {
+        'sessions': sessions,
+        'visitors': (sessions * rng.uniform(0.7, 0.9, shape)).astype(np.int64),
+        'pageviews': (sessions * rng.uniform(3.5, 5.5, shape)).astype(np.int64),
+        'conversions': cv,
+        'revenue': (cv * _ratio(t['revenue'].to_numpy()[:, None], total_cv)).astype(np.int64),
+        'bounce_rate': rng.uniform(0.3, 0.5, shape).round(4),
+    })
 
-# ============================================================
-# 7. CVファネルデータ（日別）
-# ============================================================
-funnel_data = []
 
-funnel_steps = ['商品閲覧', 'カート追加', '購入手続き開始', '購入完了']
+def region_chunk(rng, t: pd.DataFrame, dates, master: pd.DataFrame) -> pd.DataFrame:
+    shape = (len(t), len(master))
+    weight = master['weight'].to_numpy()
+    total_cv = t['conversions'].to_numpy()[:, None]
+    sessions = (t['sessions'].to_numpy()[:, None] * weight * rng.uniform(0.85, 1.15, shape)).astype(np.int64)
+    cv = (total_cv * weight * rng.uniform(0.8, 1.2, shape)).astype(np.int64)
+    return _grid(dates, master, {
+        'sessions': sessions,
+        'visitors': (sessions * rng.uniform(0.7, 0.9, shape)).astype(np.int64),
+        'pageviews': (sessions * rng.uniform(3.5, 5.0, shape)).astype(np.int64),
+        'conversions': cv,
+        'revenue': (cv * _ratio(t['revenue'].to_numpy()[:, None], total_cv)).astype(np.int64),
+    })
 
-for date in dates:
-    daily_row = df_daily[df_daily['date'] == date.strftime('%Y-%m-%d')].iloc[0]
 
-    # ファネルの各ステップの数
-    product_views = int(daily_row['sessions'] * np.random.uniform(0.6, 0.8))
-    cart_adds = int(product_views * np.random.uniform(0.15, 0.25))
-    checkout_starts = int(cart_adds * np.random.uniform(0.5, 0.7))
-    purchases = daily_row['conversions']
+def product_chunk(rng, t: pd.DataFrame, dates, master: pd.DataFrame) -> pd.DataFrame:
+    shape = (len(t), len(master))
+    quantity = (t['conversions'].to_numpy()[:, None] * master['weight'].to_numpy()
+                * rng.uniform(0.7, 1.3, shape)).astype(np.int64)
+    return _grid(dates, master, {
+        'quantity': quantity,
+        'revenue': quantity * master['unit_price'].to_numpy(),
+    })
 
-    step_values = [product_views, cart_adds, checkout_starts, purchases]
 
-    for i, step in enumerate(funnel_steps):
-        funnel_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'step_number': i + 1,
-            'step_name': step,
-            'users': step_values[i],
-            'conversion_rate_from_prev': round(step_values[i] / step_values[i-1], 4) if i > 0 and step_values[i-1] > 0 else 1.0,
-            'conversion_rate_from_start': round(step_values[i] / step_values[0], 4) if step_values[0] > 0 else 0,
-        })
+def funnel_chunk(rng, t: pd.DataFrame, dates, master: pd.DataFrame) -> pd.DataFrame:
+    n = len(t)
+    product_views = (t['sessions'].to_numpy() * rng.uniform(0.6, 0.8, n)).astype(np.int64)
+    cart_adds = (product_views * rng.uniform(0.15, 0.25, n)).astype(np.int64)
+    checkout_starts = (cart_adds * rng.uniform(0.5, 0.7, n)).astype(np.int64)
+    users = np.column_stack([product_views, cart_adds, checkout_starts, t['conversions'].to_numpy()])
+    from_prev = np.ones_like(users, dtype=float)
+    from_prev[:, 1:] = _ratio(users[:, 1:], users[:, :-1])
+    return _grid(dates, master, {
+        'users': users,
+        'conversion_rate_from_prev': from_prev.round(4),
+        'conversion_rate_from_start': _ratio(users, users[:, :1]).round(4),
+    })
 
-df_funnel = pd.DataFrame(funnel_data)
-df_funnel.to_csv('/Users/yoheinakanishi/Dev/test/sample_data/conversion_funnel.csv', index=False, encoding='utf-8-sig')
-print(f"conversion_funnel.csv: {len(df_funnel)} rows")
 
-print("\n✅ サンプルデータ生成完了!")
-print(f"出力先: /Users/yoheinakanishi/Dev/test/sample_data/")
+# (ファイル名, マスター, 生成関数)
+TABLES = [
+    ('page_metrics', 'pages', page_chunk),
+    ('referrer_metrics', 'referrers', referrer_chunk),
+    ('device_metrics', 'devices', device_chunk),
+    ('region_metrics', 'regions', region_chunk),
+    ('product_sales', 'products', product_chunk),
+    ('conversion_funnel', 'funnel', funnel_chunk),
+]
+
+
+# ============================================================
+# 書き出し
+# ============================================================
+class TableWriter:
+    """Append chunks of one table to a CSV (UTF-8 with BOM) or Parquet file
+
+    Uses pyarrow when it is installed (required for Parquet); CSV falls back
+    to pandas, which is several times slower on large tables.
+    """
+
+    def __init__(self, path: Path, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        self.rows = 0
+        self._file = None
+        self._writer = None
+
+    @staticmethod
+    def _arrow(df: pd.DataFrame):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # 辞書型（Categorical）は通常の文字列列として保存する
+        schema = pa.schema([field.with_type(field.type.value_type) if pa.types.is_dictionary(field.type)
+                            else field for field in table.schema])
+        return table.cast(schema).replace_schema_metadata(None)
+
+    def write(self, df: pd.DataFrame):
+        if pa is None:
+            if self.rows == 0:
+                df.to_csv(self.path, index=False, encoding='utf-8-sig')
+            else:
+                df.to_csv(self.path, index=False, header=False, mode='a', encoding='utf-8')
+        else:
+            table = self._arrow(df)
+            if self._writer is None:
+                if self.fmt == 'parquet':
+                    self._writer = pq.ParquetWriter(self.path, table.schema)
+                else:
+                    self._file = open(self.path, 'wb')
+                    # 生成する値にカンマ・改行は含まれないため、既存 CSV と同じく引用符なしで書く
+                    self._file.write(('\ufeff' + ','.join(table.column_names) + '\n').encode('utf-8'))
+                    options = pa_csv.WriteOptions(include_header=False, quoting_style='none')
+                    self._writer = pa_csv.CSVWriter(self._file, table.schema, write_options=options)
+            self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+
+def _date_labels(dates: pd.DatetimeIndex, fmt: str, hourly: bool):
+    """CSV keeps the original text dates; Parquet stores real timestamps"""
+    if fmt == 'parquet':
+        return dates
+    return pd.Index(dates.strftime('%Y-%m-%d %H:%M:%S' if hourly else '%Y-%m-%d'), dtype=object)
+
+
+def generate(output_dir, days: int = 90, end_date: str = "2025-01-15", pages: int = 12,
+             referrers: int = 12, products: int = 7, regions: int = 10, hourly: bool = False,
+             visitors: int = 5000, fmt: str = 'csv', seed: int = 42, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Generate every dashboard table into ``output_dir`` and return {table name: row count}"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    masters = build_masters(pages, referrers, products, regions, seed)
+    masters['funnel'] = pd.DataFrame({'step_number': np.arange(1, len(FUNNEL_STEPS) + 1),
+                                      'step_name': FUNNEL_STEPS})
+    timeline = build_timeline(days, end_date, hourly, visitors, seed)
+    rng = np.random.default_rng(seed + 2)
+    counts = {}
+
+    writer = TableWriter(output_dir / f"daily_summary.{fmt}", fmt)
+    writer.write(timeline.assign(date=_date_labels(pd.DatetimeIndex(timeline['date']), fmt, hourly)))
+    writer.close()
+    counts['daily_summary'] = writer.rows
+
+    for name, master_name, build_chunk in TABLES:
+        master = masters[master_name]
+        step = max(1, chunk_rows // len(master))
+        writer = TableWriter(output_dir / f"{name}.{fmt}", fmt)
+        for start in range(0, len(timeline), step):
+            t = timeline.iloc[start:start + step]
+            dates = _date_labels(pd.DatetimeIndex(t['date']), fmt, hourly)
+            writer.write(build_chunk(rng, t, dates, master))
+        writer.close()
+        counts[name] = writer.rows
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adobe Analytics風サンプルデータを生成")
+    parser.add_argument("--output", "-o", default="sample_data", help="出力先フォルダ（既定: sample_data）")
+    parser.add_argument("--days", type=int, default=90, help="日数（既定: 90）")
+    parser.add_argument("--end-date", default="2025-01-15", help="最終日（既定: 2025-01-15）")
+    parser.add_argument("--pages", type=int, default=12, help="ページ数（既定: 12）")
+    parser.add_argument("--referrers", type=int, default=12, help="流入元数（既定: 12）")
+    parser.add_argument("--products", type=int, default=7, help="商品数（既定: 7）")
+    parser.add_argument("--regions", type=int, default=10, help="地域数（既定: 10）")
+    parser.add_argument("--visitors", type=int, default=5000, help="1 日あたりの平均訪問者数（既定: 5000）")
+    parser.add_argument("--hourly", action="store_true", help="時間単位で生成する（行数は 24 倍）")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="出力形式（既定: csv。parquet には pyarrow が必要）")
+    parser.add_argument("--seed", type=int, default=42, help="乱数シード（既定: 42）")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                        help=f"1 回に生成・書き出す最大行数（既定: {CHUNK_ROWS}）")
+    args = parser.parse_args()
+
+    if args.format == "parquet" and pa is None:
+        parser.error("Parquet 出力には pyarrow が必要です（pip install pyarrow）")
+
+    started = time.perf_counter()
+    counts = generate(args.output, days=args.days, end_date=args.end_date, pages=args.pages,
+                      referrers=args.referrers, products=args.products, regions=args.regions,
+                      hourly=args.hourly, visitors=args.visitors, fmt=args.format, seed=args.seed,
+                      chunk_rows=args.chunk_rows)
+
+    for name, rows in counts.items():
+        print(f"{name}.{args.format}: {rows} rows")
+
+    print(f"\n✅ サンプルデータ生成完了! ({sum(counts.values())} rows, {time.perf_counter() - started:.1f}s)")
+    print(f"出力先: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
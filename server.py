@@ -0,0 +1,19 @@
+"""
+ダウンロードをストリーミング配信するサーバー起動スクリプト
+
+st.App で app.py（と pages/）を起動し、詳細テーブルの CSV / XLSX を一時ファイルから
+チャンク単位で送る HTTP ルート（/api/export/<token>）を追加する。この構成では
+ダウンロードボタンがこのルートへのリンクになり、作成したファイルを Streamlit の
+メモリ上に保持しない。`streamlit run app.py` で起動した場合は従来どおり
+Streamlit のダウンロードボタン（ファイル全体をメモリに保持）になる。
+
+使い方:
+    streamlit run server.py
+"""
+from pathlib import Path
+
+import streamlit as st
+
+from utils.export import export_routes
+
+app = st.App(Path(__file__).parent / "app.py", routes=export_routes())
@@ -0,0 +1,19 @@
+import sys
+from pathlib import Path
+
+import pytest
+import streamlit as st
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.datasets import DATASET_CACHE  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Every test starts from empty data caches"""
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    DATASET_CACHE.clear()
+    yield
+    DATASET_CACHE.clear()
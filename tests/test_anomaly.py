@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import data_loader
+from utils.anomaly import AnomalyDetector, daily_metric_values
+from utils.sections import KPI_METRICS
+
+METHODS = ['rolling', 'seasonal']
+
+
+@pytest.fixture
+def daily() -> pd.DataFrame:
+    """Sample daily summary with a few injected spikes and drops, so both baselines flag days"""
+    df = pd.read_csv(data_loader.DATA_DIR / "daily_summary.csv", parse_dates=['date'])
+    columns = ['visitors', 'sessions', 'pageviews', 'revenue']
+    df[columns] = df[columns].astype(float)
+    for day, factor in ((40, 4.0), (62, 0.2), (85, 5.0)):
+        df.loc[day, columns] *= factor
+    return df
+
+
+def _assert_same_detector(result: AnomalyDetector, expected: AnomalyDetector):
+    for method in METHODS:
+        pd.testing.assert_frame_equal(result.scores(method), expected.scores(method))
+        pd.testing.assert_frame_equal(result.anomalies(method=method), expected.anomalies(method=method))
+
+
+@pytest.mark.parametrize("split", [1, 7, 50, 84])
+def test_appended_days_match_a_rebuild(daily, split):
+    full = daily_metric_values(daily, KPI_METRICS)
+    incremental = AnomalyDetector(KPI_METRICS).update(full.iloc[:split]).update(full)
+    rebuilt = AnomalyDetector(KPI_METRICS).update(full)
+
+    assert all(len(rebuilt.anomalies(method=method)) > 0 for method in METHODS)
+    _assert_same_detector(incremental, rebuilt)
+
+
+def test_revised_day_is_rescored(daily):
+    full = daily_metric_values(daily, KPI_METRICS)
+    revised = full.copy()
+    revised.iloc[60, 0] *= 3
+    incremental = AnomalyDetector(KPI_METRICS).update(full).update(revised)
+    _assert_same_detector(incremental, AnomalyDetector(KPI_METRICS).update(revised))
+
+
+def test_get_anomaly_detector_continues_from_previous_version(daily, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, 'DATA_DIR', tmp_path)
+    path = tmp_path / "daily_summary.csv"
+
+    daily.iloc[:70].to_csv(path, index=False)
+    os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+    old = data_loader.get_anomaly_detector("daily_summary.csv", KPI_METRICS)
+    old_scores = {method: old.scores(method) for method in METHODS}
+
+    scored = []
+    rolling_stats = AnomalyDetector._rolling_stats
+    monkeypatch.setattr(AnomalyDetector, '_rolling_stats',
+                        lambda self, prefix, t: scored.append(len(t)) or rolling_stats(self, prefix, t))
+
+    daily.to_csv(path, index=False)
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+    new = data_loader.get_anomaly_detector("daily_summary.csv", KPI_METRICS)
+
+    # Only the appended days were scored, and the previous version's detector was left as it was
+    assert new is not old
+    assert scored == [len(daily) - 70]
+    for method in METHODS:
+        pd.testing.assert_frame_equal(old.scores(method), old_scores[method])
+
+    rebuilt = AnomalyDetector(KPI_METRICS).update(daily_metric_values(data_loader.load_data("daily_summary.csv"),
+                                                                      KPI_METRICS))
+    _assert_same_detector(new, rebuilt)
+    assert np.isfinite(new.scores('seasonal').to_numpy()).any()
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.bitmap_index import BitmapIndex
+from utils.data_loader import load_data, load_filtered, load_sliced
+
+START, END = pd.Timestamp("2024-11-01"), pd.Timestamp("2024-11-30")
+
+
+def _mask_filter(df: pd.DataFrame, filters: dict, start=START, end=END) -> pd.DataFrame:
+    """Reference result: plain boolean masks over the raw rows"""
+    mask = (df['date'] >= start) & (df['date'] < end + pd.Timedelta(days=1))
+    for dim, vals in filters.items():
+        if dim in df.columns:
+            mask &= df[dim].isin(vals if isinstance(vals, (list, tuple, set)) else [vals])
+    return df[mask]
+
+
+def _assert_same_rows(result: pd.DataFrame, expected: pd.DataFrame):
+    pd.testing.assert_frame_equal(result.sort_index(), expected.sort_index())
+
+
+@pytest.mark.parametrize("filename", ["daily_summary.csv", "referrer_metrics.csv", "page_metrics.csv"])
+def test_load_filtered_matches_date_mask(filename):
+    _assert_same_rows(load_filtered(filename, START, END), _mask_filter(load_data(filename), {}))
+
+
+@pytest.mark.parametrize("filename, filters", [
+    ("referrer_metrics.csv", {'referrer_type': ['Organic Search']}),
+    ("referrer_metrics.csv", {'referrer_type': ['Organic Search', 'Direct'], 'referrer': 'google'}),
+    ("device_metrics.csv", {'device': ['desktop', 'mobile']}),
+    ("page_metrics.csv", {'page_category': ['TOP'], 'device': ['desktop']}),  # device is not a page column
+    ("region_metrics.csv", {'region': ['東京', '大阪'], 'device': 'mobile'}),
+])
+def test_load_sliced_matches_boolean_mask(filename, filters):
+    result = load_sliced(filename, START, END, filters)
+    expected = _mask_filter(load_data(filename), filters)
+    assert len(expected) > 0
+    _assert_same_rows(result, expected)
+
+
+@pytest.mark.parametrize("filters", [
+    {'device': []},
+    {'device': ['smartwatch']},
+    {'device': ['desktop'], 'referrer': ['no-such-referrer']},
+])
+def test_load_sliced_empty_or_unknown_values(filters):
+    for filename in ("device_metrics.csv", "referrer_metrics.csv"):
+        result = load_sliced(filename, START, END, filters)
+        _assert_same_rows(result, _mask_filter(load_data(filename), filters))
+
+
+def test_load_sliced_without_applicable_filters_is_the_period():
+    _assert_same_rows(load_sliced("daily_summary.csv", START, END, {'device': ['desktop']}),
+                      load_filtered("daily_summary.csv", START, END))
+
+
+def test_index_with_missing_values_and_hourly_dates():
+    rng = np.random.default_rng(0)
+    n = 500
+    df = pd.DataFrame({
+        'date': pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 10 * 24, n), unit='h'),
+        'device': rng.choice(['desktop', 'mobile', None], n),
+        'region': rng.choice(['東京都', '大阪府', '愛知県'], n),
+    })
+    index = BitmapIndex(df, ['device', 'region'])
+
+    assert sorted(index.values('device')) == ['desktop', 'mobile']
+    np.testing.assert_array_equal(index.rows('device', 'mobile'), np.flatnonzero(df['device'] == 'mobile'))
+    assert len(index.rows('device', 'tablet')) == 0
+
+    start, end = pd.Timestamp("2025-01-03"), pd.Timestamp("2025-01-05")
+    rows = index.select({'device': ['desktop'], 'region': ['東京都', '愛知県']}, start, end)
+    expected = np.flatnonzero((df['device'] == 'desktop') & df['region'].isin(['東京都', '愛知県'])
+                              & (df['date'] >= start) & (df['date'] < end + pd.Timedelta(days=1)))
+    np.testing.assert_array_equal(rows, expected)
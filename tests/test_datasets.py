@@ -0,0 +1,168 @@
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import data_loader, datasets
+from utils.datasets import DATASET_CACHE, DatasetCache
+
+START, END = pd.Timestamp("2024-11-01"), pd.Timestamp("2024-11-30")
+MB = 1024 ** 2
+
+
+def _array_cache(budget_bytes: float):
+    cache = DatasetCache(budget_bytes)
+    calls = []
+
+    @cache
+    def load(table: str, version: int, n: int = 1000):
+        calls.append((table, version, n))
+        return np.zeros(n)  # n * 8 bytes
+    return cache, load, calls
+
+
+def _datasets_of(cache: DatasetCache) -> list:
+    return [dataset for dataset, _, _ in cache.resident()]
+
+
+def test_hits_do_not_recompute():
+    cache, load, calls = _array_cache(MB)
+    assert load("a/x", 1) is load("a/x", 1)
+    load("a/x", 1, n=10)
+    load("a/x", 1, n=10)
+    assert calls == [("a/x", 1, 1000), ("a/x", 1, 10)]
+
+
+def test_least_recently_used_dataset_is_evicted_over_budget():
+    cache, load, _ = _array_cache(20_000)
+    load("a/x", 1)
+    load("b/x", 1)
+    load("a/x", 1)  # a is now more recent than b
+    assert cache.evictions == 0
+
+    load("c/x", 1)
+    assert _datasets_of(cache) == ["c", "a"]
+    assert cache.evictions == 1
+    assert sum(nbytes for _, _, nbytes in cache.resident()) <= cache.budget_bytes
+
+
+def test_dataset_being_stored_into_drops_its_own_oldest_entries():
+    cache, load, _ = _array_cache(25_000)
+    for n in (1000, 1001, 1002):
+        load("a/x", 1, n)
+    load("a/x", 1, 1000)  # touch the oldest entry
+    load("a/x", 1, 1003)
+
+    entries = list(cache._datasets["a"])
+    assert [key[3] for key in entries] == [(1002,), (1000,), (1003,)]
+    assert cache.evictions == 0
+
+
+def test_new_version_replaces_old_and_previous_returns_it():
+    cache, load, _ = _array_cache(MB)
+    old = load("a/x", 1, n=5)
+    assert cache.previous(load, "a/x", n=5) is old
+    assert cache.previous(load, "a/x", n=6) is None
+
+    new = load("a/x", 2, n=5)
+    assert cache.previous(load, "a/x", n=5) is new
+    assert len(cache._datasets["a"]) == 1
+
+
+def test_dict_arguments_are_keyed_in_order():
+    cache = DatasetCache(MB)
+    calls = []
+
+    @cache
+    def aggregate(table, version, agg: dict):
+        calls.append(agg)
+        return list(agg)
+
+    assert aggregate("a/x", 1, {'x': 'sum', 'y': 'mean'}) == ['x', 'y']
+    assert aggregate("a/x", 1, {'y': 'mean', 'x': 'sum'}) == ['y', 'x']
+    aggregate("a/x", 1, {'x': 'sum', 'y': 'mean'})
+    assert len(calls) == 2
+
+
+def test_concurrent_misses_compute_once():
+    cache = DatasetCache(MB)
+    calls = []
+
+    @cache
+    def slow(table, version):
+        calls.append(table)
+        time.sleep(0.05)
+        return np.zeros(10)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(slow("a/x", 1))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert cache._loading == {}
+
+
+@pytest.fixture
+def suites(tmp_path, monkeypatch):
+    """Two datasets (copies of sample_data) under DATASETS_DIR"""
+    for name in ("suite_a", "suite_b"):
+        (tmp_path / name).mkdir()
+        for path in data_loader.DATA_DIR.glob("*.csv"):
+            shutil.copy(path, tmp_path / name)
+    monkeypatch.setattr(datasets, 'DATASETS_DIR', tmp_path)
+    monkeypatch.setenv("AA_DASHBOARD_SNAPSHOT", str(tmp_path / "none.snapshot"))
+    return tmp_path
+
+
+def _query(dataset: str):
+    """Base table plus derived queries of one dataset, as the pages run them"""
+    table = datasets.table_key("referrer_metrics.csv", dataset)
+    version = data_loader._version(table)
+    data_loader._filter_cached(table, version, START, END)
+    data_loader._slice_cached(table, version, START, END, (('referrer_type', ('Direct',)),))
+    data_loader._aggregate_cached(table, version, START, END, ('referrer',), {'sessions': 'sum'})
+    data_loader._group_quantile_cached(table, version, START, END, ('referrer',), 'sessions', 0.5)
+    daily = datasets.table_key("daily_summary.csv", dataset)
+    data_loader._resample_cached(daily, data_loader._version(daily), START, END, 'week', {'visitors': 'sum'}, 0)
+    data_loader._anomaly_detector(daily, data_loader._version(daily), ('visitors', 'sessions'))
+
+
+def test_derived_entries_count_and_are_dropped_with_their_dataset(suites, monkeypatch):
+    _query("suite_a")
+    names = {key[0] for key in DATASET_CACHE._datasets["suite_a"]}
+    assert {'_load_csv', '_bitmap_index', '_filter_cached', '_slice_cached', '_aggregate_cached',
+            '_group_quantile_cached', '_resample_cached', '_anomaly_detector'} <= names
+    (_, entries, nbytes), = DATASET_CACHE.resident()
+    assert entries == len(DATASET_CACHE._datasets["suite_a"])
+    assert nbytes == sum(n for _, n in DATASET_CACHE._datasets["suite_a"].values())
+
+    # Room for one dataset: querying the second one evicts the first with everything derived from it
+    monkeypatch.setattr(DATASET_CACHE, 'budget_bytes', nbytes * 1.5)
+    _query("suite_b")
+    assert _datasets_of(DATASET_CACHE) == ["suite_b"]
+    assert not any(key[1].startswith("suite_a/") for entries in DATASET_CACHE._datasets.values() for key in entries)
+
+
+def test_previous_after_mtime_change(suites):
+    table = datasets.table_key("daily_summary.csv", "suite_a")
+    path = data_loader._table_path(table)
+    old_version = data_loader._version(table)
+    old = data_loader._load_csv(table, old_version)
+
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    new_version = data_loader._version(table)
+    assert new_version != old_version
+    assert DATASET_CACHE.previous(data_loader._load_csv, table) is old
+
+    new = data_loader._load_csv(table, new_version)
+    assert new is not old
+    assert DATASET_CACHE.previous(data_loader._load_csv, table) is new
+    assert [key[2] for key in DATASET_CACHE._datasets["suite_a"] if key[0] == '_load_csv'] == [new_version]
@@ -0,0 +1,131 @@
+import asyncio
+import codecs
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import export
+from utils.export import export_bytes, register_export, write_csv, write_xlsx
+
+
+@pytest.fixture(autouse=True)
+def empty_registry(monkeypatch):
+    monkeypatch.setattr(export, '_pending', export.OrderedDict())
+    monkeypatch.setattr(export, '_slots', {})
+    monkeypatch.setattr(export, '_streaming', False)
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        '日付': pd.to_datetime(["2025-01-01", "2025-01-02", None, "2025-01-04", "2025-01-05"]),
+        'セッション': np.array([10, 20, 30, 40, 50], dtype=np.int64),
+        'CVR(%)': [1.5, np.nan, 2.25, np.inf, 0.0],
+        'フラグ': [True, False, True, False, True],
+        '流入元': ["google", "a<b>&c", "bad\x01char\x1f", None, "ページ \"引用\""],
+    })
+
+
+def test_csv_has_bom_header_and_all_chunks(frame):
+    f = io.BytesIO()
+    write_csv(frame, f, chunk_rows=2)
+    data = f.getvalue()
+
+    assert data.startswith(codecs.BOM_UTF8)
+    assert data[len(codecs.BOM_UTF8):].decode('utf-8').splitlines()[0] == "日付,セッション,CVR(%),フラグ,流入元"
+    result = pd.read_csv(io.BytesIO(data), encoding='utf-8-sig', parse_dates=['日付'])
+    assert list(result.columns) == list(frame.columns)
+    assert len(result) == len(frame)
+    pd.testing.assert_series_equal(result['日付'], frame['日付'], check_dtype=False)
+    pd.testing.assert_series_equal(result['セッション'], frame['セッション'])
+    assert result['流入元'].tolist()[:2] == ["google", "a<b>&c"]
+
+
+def test_xlsx_reads_back(frame):
+    pytest.importorskip("openpyxl")
+    f = io.BytesIO()
+    write_xlsx(frame, f, chunk_rows=2, sheet_name="詳細")
+    f.seek(0)
+    result = pd.read_excel(f, sheet_name="詳細")
+
+    assert list(result.columns) == list(frame.columns)
+    pd.testing.assert_series_equal(result['日付'], frame['日付'], check_dtype=False)
+    assert result['セッション'].tolist() == frame['セッション'].tolist()
+    # Non-finite numbers are written as empty cells
+    np.testing.assert_array_equal(result['CVR(%)'].to_numpy(), [1.5, np.nan, 2.25, np.nan, 0.0])
+    assert result['フラグ'].tolist() == frame['フラグ'].tolist()
+    # Characters that XML 1.0 cannot hold are dropped; markup is escaped, not interpreted
+    assert result['流入元'].tolist()[:3] == ["google", "a<b>&c", "badchar"]
+    assert pd.isna(result['流入元'][3])
+    assert result['流入元'][4] == "ページ \"引用\""
+
+
+def test_export_bytes_matches_the_writer(frame):
+    for fmt, writer in export.WRITERS.items():
+        f = io.BytesIO()
+        writer(frame, f, export.CHUNK_ROWS)
+        if fmt == 'csv':
+            assert export_bytes(frame, fmt) == f.getvalue()
+        else:
+            assert export_bytes(frame, fmt)[:2] == b"PK"
+
+
+def test_same_frame_keeps_its_url(frame):
+    slot = ("session", "detail", 'csv')
+    url = register_export(slot, frame, 'csv', "detail.csv")
+    assert url.startswith(export.EXPORT_ROUTE + "/")
+    assert register_export(slot, frame, 'csv', "detail.csv") == url
+
+    # A new frame (e.g. another search) replaces the slot's registration
+    other = register_export(slot, frame.head(2), 'csv', "detail.csv")
+    assert other != url
+    assert list(export._pending) == [other.rsplit('/', 1)[1]]
+    assert export._slots == {slot: other.rsplit('/', 1)[1]}
+
+
+def test_eviction_clears_slots(frame, monkeypatch):
+    monkeypatch.setattr(export, 'MAX_PENDING', 3)
+    urls = [register_export(("session", f"table{i}", 'csv'), frame, 'csv', "detail.csv") for i in range(5)]
+
+    assert len(export._pending) == 3
+    assert set(export._slots) == {("session", f"table{i}", 'csv') for i in range(2, 5)}
+    assert set(export._slots.values()) == set(export._pending) == {url.rsplit('/', 1)[1] for url in urls[2:]}
+
+
+def test_expired_registrations_are_dropped(frame):
+    old_slot, new_slot = ("old", "detail", 'csv'), ("new", "detail", 'csv')
+    token = register_export(old_slot, frame, 'csv', "detail.csv").rsplit('/', 1)[1]
+    slot, df, fmt, file_name, registered = export._pending[token]
+    export._pending[token] = (slot, df, fmt, file_name, registered - export.PENDING_TTL - 1)
+
+    register_export(new_slot, frame, 'csv', "detail.csv")
+    assert token not in export._pending
+    assert list(export._slots) == [new_slot]
+
+
+def test_route_streams_the_file_and_rejects_unknown_tokens(frame, monkeypatch):
+    pytest.importorskip("starlette")
+    from starlette.requests import Request
+
+    monkeypatch.setattr(export, 'STREAM_CHUNK', 64)
+    endpoint = export.export_routes()[0].endpoint
+    assert export.streaming_enabled()
+
+    async def fetch(url: str):
+        token = url.rsplit('/', 1)[1]
+        response = await endpoint(Request({'type': 'http', 'method': 'GET', 'path': url, 'headers': [],
+                                           'path_params': {'token': token}}))
+        if response.status_code != 200:
+            return response, response.body
+        return response, b"".join([chunk async for chunk in response.body_iterator])
+
+    url = register_export(("session", "detail", 'csv'), frame, 'csv', "detail.csv")
+    response, body = asyncio.run(fetch(url))
+    assert body == export_bytes(frame, 'csv')
+    assert response.headers['content-length'] == str(len(body))
+    assert 'filename="detail.csv"' in response.headers['content-disposition']
+
+    response, _ = asyncio.run(fetch(export.EXPORT_ROUTE + "/unknown"))
+    assert response.status_code == 404
@@ -0,0 +1,131 @@
+import os
+import pickle
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import build_snapshot
+from utils import data_loader, datasets
+from utils.datasets import DATASET_CACHE
+from utils.snapshot import ALIGN, SNAPSHOT_FILE, Snapshot, recording, write_snapshot
+
+START, END = pd.Timestamp("2024-11-01"), pd.Timestamp("2024-11-30")
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Copy of sample_data the data layer reads (and a snapshot can be written next to)"""
+    for path in data_loader.DATA_DIR.glob("*.csv"):
+        shutil.copy(path, tmp_path)
+    monkeypatch.setattr(data_loader, 'DATA_DIR', tmp_path)
+    monkeypatch.setattr(datasets, 'DATASETS_DIR', None)
+    monkeypatch.delenv("AA_DASHBOARD_SNAPSHOT", raising=False)
+    return tmp_path
+
+
+def _queries() -> dict:
+    return {
+        'filtered': data_loader.load_filtered("daily_summary.csv", START, END),
+        'sliced': data_loader.load_sliced("device_metrics.csv", START, END, {'device': ['desktop']}),
+        'aggregate': data_loader.aggregate_by("referrer_metrics.csv", START, END, ('referrer_type',),
+                                              {'sessions': 'sum', 'conversions': 'sum'}, derive=['cvr']),
+        'resample': data_loader.resample_by("daily_summary.csv", START, END, 'week', {'pageviews': 'sum'}),
+        'long': data_loader.resample_long("daily_summary.csv", START, END, 'day', {'visitors': '訪問者数'}),
+        'quantile': data_loader.group_quantile("page_metrics.csv", START, END, 'page_name', 'pageviews', 0.25),
+    }
+
+
+def _assert_same_results(result: dict, expected: dict):
+    for name, value in expected.items():
+        if isinstance(value, pd.DataFrame):
+            pd.testing.assert_frame_equal(result[name], value, obj=name)
+        else:
+            assert result[name] == value, name
+
+
+def _record_snapshot(data_dir) -> dict:
+    with recording() as entries:
+        expected = _queries()
+    write_snapshot(data_dir / SNAPSHOT_FILE, entries)
+    DATASET_CACHE.clear()
+    return expected
+
+
+def test_write_and_read_round_trip(tmp_path):
+    frame = pd.DataFrame({
+        'date': pd.date_range("2025-01-01", periods=5),
+        'count': np.arange(5, dtype=np.int64),
+        'rate': [0.1, np.nan, 0.3, 0.4, 0.5],
+        'name': ['a', 'b', None, 'd', 'e'],
+        'flag': [True, False, True, False, True],
+        'kind': pd.Categorical(['x', 'y', 'x', 'y', 'x']),
+    })
+    entries = {b'frame': frame, b'array': np.arange(12.0).reshape(3, 4), b'scalar': 1.5}
+    path = tmp_path / SNAPSHOT_FILE
+    size = write_snapshot(path, entries, {'pages': ['app.py']})
+    assert size == path.stat().st_size
+
+    snapshot = Snapshot(path)
+    assert len(snapshot) == 3 and b'frame' in snapshot and snapshot.meta == {'pages': ['app.py']}
+    pd.testing.assert_frame_equal(snapshot.get(b'frame'), frame)
+    array = snapshot.get(b'array')
+    np.testing.assert_array_equal(array, entries[b'array'])
+    array[0, 0] = -1  # buffers are copied out of the read-only map
+    assert snapshot.get(b'scalar') == 1.5
+    assert snapshot.get(b'missing', 'default') == 'default'
+    assert all(offset % ALIGN == 0 for _, _, buffers in snapshot._entries.values() for offset, _ in buffers)
+
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / SNAPSHOT_FILE
+    path.write_bytes(b"not a snapshot file")
+    with pytest.raises(ValueError):
+        Snapshot(path)
+
+
+def test_queries_are_served_from_the_snapshot(data_dir, monkeypatch):
+    expected = _record_snapshot(data_dir)
+
+    def not_loaded(table, version):
+        raise AssertionError(f"{table} was loaded although the snapshot has the query")
+    monkeypatch.setattr(data_loader, '_load_csv', not_loaded)
+    _assert_same_results(_queries(), expected)
+
+
+def test_changed_table_mtime_invalidates_its_entries(data_dir, monkeypatch):
+    expected = _record_snapshot(data_dir)
+
+    path = data_dir / "daily_summary.csv"
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    loaded = []
+    load_csv = data_loader._load_csv
+    monkeypatch.setattr(data_loader, '_load_csv', lambda table, version: loaded.append(table) or load_csv(table, version))
+    _assert_same_results(_queries(), expected)
+    # Only the rewritten table is read again; the other queries still come from the snapshot
+    assert set(loaded) == {"daily_summary.csv"}
+
+
+def test_build_snapshot_matches_fresh_queries(data_dir, monkeypatch):
+    output = data_dir / SNAPSHOT_FILE
+    monkeypatch.setattr(sys, 'argv', ["build_snapshot.py", "--data-dir", str(data_dir), "--pages", "app.py"])
+    build_snapshot.main()
+
+    snapshot = Snapshot(output)
+    assert len(snapshot) > 0
+    assert snapshot.meta['versions']['daily_summary.csv'] == data_loader.get_data_version("daily_summary.csv")
+
+    # Recompute every stored query with the snapshot out of the way
+    monkeypatch.setenv("AA_DASHBOARD_SNAPSHOT", str(data_dir / "none.snapshot"))
+    DATASET_CACHE.clear()
+    for key in snapshot._entries:
+        name, args = pickle.loads(key)
+        stored, fresh = snapshot.get(key), getattr(data_loader, name)(*args)
+        if isinstance(fresh, pd.DataFrame):
+            pd.testing.assert_frame_equal(stored, fresh, obj=name)
+        else:
+            assert stored == fresh or (np.isnan(stored) and np.isnan(fresh)), name
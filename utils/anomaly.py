@@ -0,0 +1,206 @@
+"""
+Rolling statistics and anomaly detection for Adobe Analytics Dashboard
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from .metrics import METRICS, metric_inputs, derive_metrics
+
+# Baseline method -> display label
+BASELINES = {
+    'rolling': '直近28日',
+    'seasonal': '同曜日（過去4週）',
+}
+
+
+def daily_metric_values(df: pd.DataFrame, names: list, date_col: str = 'date') -> pd.DataFrame:
+    """Per-day values of registered metrics on a contiguous calendar (missing days are NaN)"""
+    days = df[date_col].dt.normalize()
+    sums = metric_inputs(df, names).groupby(days.to_numpy()).sum()
+    calendar = pd.date_range(sums.index.min(), sums.index.max(), freq='D')
+    return derive_metrics(sums.reindex(calendar), names)
+
+
+def _lag_sum(prefix: np.ndarray, t: np.ndarray, lag: int) -> np.ndarray:
+    """prefix[t - lag] with zeros before the start of the history"""
+    idx = t - lag
+    out = np.zeros((len(t),) + prefix.shape[1:])
+    valid = idx >= 0
+    out[valid] = prefix[idx[valid]]
+    return out
+
+
+class _History(NamedTuple):
+    """Scored history of one detector; replaced as a whole, never modified in place"""
+    first_date: pd.Timestamp
+    values: np.ndarray   # days x metrics
+    prefix: np.ndarray   # running sums: row t + 1 holds the total of rows 0..t
+    weekly: np.ndarray   # lag-7 running sums: row t holds the total of rows t, t-7, t-14, ...
+    stats: dict          # method -> days x (mean, std) x metrics
+
+    def truncate(self, n: int) -> '_History':
+        return _History(self.first_date, self.values[:n], self.prefix[:n + 1], self.weekly[:n],
+                        {method: stats[:n] for method, stats in self.stats.items()})
+
+
+class AnomalyDetector:
+    """Rolling and same-weekday baselines for daily KPIs, extended incrementally
+
+    Each day is scored against the days before it (never itself):
+
+    - rolling: mean/std of the previous ``window`` days
+    - seasonal: mean/std of the same weekday in the previous ``seasonal_weeks`` weeks
+
+    Both are answered from running sums of count, x and x**2 (a plain prefix
+    sum and a lag-7 prefix sum), so the whole history is scored in one
+    vectorized pass. update() only scores the days that are new or changed.
+
+    The history is an immutable snapshot swapped in by a single assignment:
+    update() (serialized by the caller) builds the new arrays aside, so
+    sessions reading scores() / anomalies() concurrently always see one
+    consistent history, old or new.
+    """
+
+    def __init__(self, names: list, window: int = 28, seasonal_weeks: int = 4,
+                 threshold: float = 3.0, min_periods: int = 7, seasonal_min_periods: int = 3):
+        self.names = list(names)
+        self.window = window
+        self.seasonal_weeks = seasonal_weeks
+        self.threshold = threshold
+        self.min_periods = min_periods
+        self.seasonal_min_periods = seasonal_min_periods
+        self.version = None
+
+        m = len(self.names)
+        self._history = _History(None, np.empty((0, m)), np.zeros((1, 3, m)), np.empty((0, 3, m)),
+                                 {method: np.empty((0, 2, m)) for method in BASELINES})
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._history.values
+
+    @property
+    def stats(self) -> dict:
+        return self._history.stats
+
+    @staticmethod
+    def _dates(history: _History) -> pd.DatetimeIndex:
+        if history.first_date is None:
+            return pd.DatetimeIndex([])
+        return pd.date_range(history.first_date, periods=len(history.values), freq='D')
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        return self._dates(self._history)
+
+    def _changed_from(self, history: _History, daily: pd.DataFrame) -> int:
+        """First stored row that differs from ``daily`` (0 if the history cannot be reused)"""
+        if history.first_date is None or daily.index[0] != history.first_date:
+            return 0
+        n = min(len(history.values), len(daily))
+        new = daily[self.names].to_numpy(dtype=float)[:n]
+        same = (new == history.values[:n]) | (np.isnan(new) & np.isnan(history.values[:n]))
+        diff = np.flatnonzero(~same.all(axis=1))
+        return int(diff[0]) if len(diff) else n
+
+    def update(self, daily: pd.DataFrame):
+        """Bring the detector up to date with a daily_metric_values() frame
+
+        Unchanged leading days are kept; only appended or revised days are
+        scored. A history that starts on a different date is rebuilt.
+        """
+        if daily.empty:
+            return self
+        history = self._history
+        keep = self._changed_from(history, daily)
+        history = history.truncate(keep)
+        if keep == 0:
+            history = history._replace(first_date=daily.index[0])
+
+        new = daily[self.names].to_numpy(dtype=float)[keep:]
+        if len(new) == 0:
+            self._history = history
+            return self
+
+        present = ~np.isnan(new)
+        x = np.where(present, new, 0.0)
+        moments = np.stack([present.astype(float), x, x * x], axis=1)
+
+        # Running sums continue from the last stored row
+        prefix = np.concatenate([history.prefix, history.prefix[-1] + np.cumsum(moments, axis=0)])
+
+        # Lag-7 sums: each new row adds the row a week earlier (chunks of 7 are independent)
+        weekly = np.concatenate([history.weekly, np.empty_like(moments)])
+        for chunk in range(keep, len(weekly), 7):
+            rows = np.arange(chunk, min(chunk + 7, len(weekly)))
+            earlier = rows - 7
+            weekly[rows] = moments[rows - keep]
+            has_earlier = earlier >= 0
+            weekly[rows[has_earlier]] += weekly[earlier[has_earlier]]
+
+        values = np.concatenate([history.values, new])
+        t = np.arange(keep, len(values))
+        stats = {
+            'rolling': np.concatenate([history.stats['rolling'], self._rolling_stats(prefix, t)]),
+            'seasonal': np.concatenate([history.stats['seasonal'], self._seasonal_stats(weekly, t)]),
+        }
+        # Publish: readers switch to the new history in one step
+        self._history = _History(history.first_date, values, prefix, weekly, stats)
+        return self
+
+    @staticmethod
+    def _mean_std(moments: np.ndarray, min_periods: int) -> np.ndarray:
+        count, total, squares = moments[:, 0], moments[:, 1], moments[:, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / count
+            var = (squares - count * mean * mean) / (count - 1)
+        std = np.sqrt(np.clip(var, 0, None))
+        enough = count >= min_periods
+        return np.stack([np.where(enough, mean, np.nan), np.where(enough, std, np.nan)], axis=1)
+
+    def _rolling_stats(self, prefix: np.ndarray, t: np.ndarray) -> np.ndarray:
+        # Window [t - window, t - 1] = prefix[t] - prefix[t - window]
+        lo = np.maximum(t - self.window, 0)
+        return self._mean_std(prefix[t] - prefix[lo], self.min_periods)
+
+    def _seasonal_stats(self, weekly: np.ndarray, t: np.ndarray) -> np.ndarray:
+        # Days t-7 .. t-7k = weekly[t - 7] - weekly[t - 7(k + 1)]
+        moments = _lag_sum(weekly, t, 7) - _lag_sum(weekly, t, 7 * (self.seasonal_weeks + 1))
+        return self._mean_std(moments, self.seasonal_min_periods)
+
+    @staticmethod
+    def _z(history: _History, method: str) -> np.ndarray:
+        mean, std = history.stats[method][:, 0], history.stats[method][:, 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (history.values - mean) / np.where(std > 0, std, np.nan)
+
+    def scores(self, method: str = 'rolling') -> pd.DataFrame:
+        """z-score of every day against its baseline (days x metrics)"""
+        history = self._history
+        return pd.DataFrame(self._z(history, method), index=self._dates(history), columns=self.names)
+
+    def anomalies(self, start_date=None, end_date=None, method: str = 'rolling') -> pd.DataFrame:
+        """Flagged days in a window as rows of (date, metric, value, baseline, z, is_bad)
+
+        ``is_bad`` is oriented by the metric: a drop in sessions or a spike in
+        bounce rate is bad.
+        """
+        history = self._history
+        dates = self._dates(history)
+        lo = 0 if start_date is None else dates.searchsorted(pd.Timestamp(start_date).normalize(), side='left')
+        hi = len(dates) if end_date is None else dates.searchsorted(pd.Timestamp(end_date).normalize(), side='right')
+
+        z = self._z(history, method)[lo:hi]
+        rows, cols = np.nonzero(np.abs(np.nan_to_num(z)) >= self.threshold)
+        sign = np.array([1 if METRICS[name].higher_is_better else -1 for name in self.names])
+
+        return pd.DataFrame({
+            'date': dates[lo:hi][rows],
+            'metric': np.array(self.names, dtype=object)[cols],
+            'value': history.values[lo:hi][rows, cols],
+            'baseline': history.stats[method][lo:hi, 0][rows, cols],
+            'z': z[rows, cols],
+            'is_bad': z[rows, cols] * sign[cols] < 0,
+        })
@@ -0,0 +1,85 @@
+"""
+Bitmap index utilities for Adobe Analytics Dashboard
+"""
+import numpy as np
+import pandas as pd
+
+
+class BitmapIndex:
+    """Per-value row positions for dimension columns of one table
+
+    Built once per table version from one stable ``argsort`` of each
+    column's factorized codes: the rows of every value are a contiguous,
+    ascending run of that order, located by per-value offsets. Build time is
+    O(n log n) and memory one position array per dimension, whatever the
+    cardinality (high-cardinality columns such as ``referrer`` included). A
+    multi-dimension slice such as device x region x date marks the rows of
+    the selected values and combines the dimensions with ``np.logical_and``
+    instead of comparing every raw row again.
+    """
+
+    def __init__(self, df: pd.DataFrame, dimensions: list, date_col: str = 'date'):
+        self.n_rows = len(df)
+        self.dimensions = [dim for dim in dimensions if dim in df.columns]
+        position_dtype = np.int32 if self.n_rows < np.iinfo(np.int32).max else np.int64
+        self._codes = {}    # dim -> {value: code}
+        self._order = {}    # dim -> row positions sorted by code
+        self._offsets = {}  # dim -> start of each code's run in _order (len = values + 1)
+        for dim in self.dimensions:
+            codes, uniques = pd.factorize(df[dim])
+            self._codes[dim] = {value: code for code, value in enumerate(uniques)}
+            self._order[dim] = np.argsort(codes, kind='stable').astype(position_dtype)
+            # Missing values (code -1) sort first and belong to no value
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            self._offsets[dim] = np.concatenate([[0], np.cumsum(counts)]) + np.count_nonzero(codes < 0)
+
+        # Dates: keep the row order sorted by date so any range is one contiguous run
+        self.date_col = date_col if date_col in df.columns else None
+        if self.date_col:
+            dates = df[date_col].to_numpy(dtype='datetime64[ns]')
+            self._date_order = np.argsort(dates, kind='stable')
+            self._sorted_dates = dates[self._date_order]
+
+    def values(self, dim: str) -> list:
+        """Distinct values of an indexed dimension"""
+        return list(self._codes.get(dim, {}))
+
+    def rows(self, dim: str, value) -> np.ndarray:
+        """Ascending row positions where ``dim`` equals ``value``"""
+        code = self._codes.get(dim, {}).get(value)
+        if code is None:
+            return self._order[dim][:0] if dim in self._order else np.empty(0, dtype=np.int64)
+        offsets = self._offsets[dim]
+        return self._order[dim][offsets[code]:offsets[code + 1]]
+
+    def applicable(self, filters: dict) -> dict:
+        """The subset of ``filters`` whose dimensions exist in this table"""
+        return {dim: vals for dim, vals in (filters or {}).items() if dim in self._codes}
+
+    def _date_rows(self, start_date, end_date) -> np.ndarray:
+        lo = np.searchsorted(self._sorted_dates, np.datetime64(pd.Timestamp(start_date), 'ns'), side='left')
+        # Inclusive of the whole end day, for hourly tables
+        end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+        hi = np.searchsorted(self._sorted_dates, np.datetime64(end, 'ns'), side='left')
+        return self._date_order[lo:hi]
+
+    def select(self, filters: dict = None, start_date=None, end_date=None) -> np.ndarray:
+        """Row positions matching every filter (values within a dimension are OR-ed)"""
+        result = np.ones(self.n_rows, dtype=bool)
+        matched = np.empty(self.n_rows, dtype=bool)
+
+        for dim, vals in self.applicable(filters).items():
+            vals = vals if isinstance(vals, (list, tuple, set)) else [vals]
+            matched[:] = False
+            for value in vals:
+                matched[self.rows(dim, value)] = True
+            np.logical_and(result, matched, out=result)
+
+        if self.date_col and (start_date is not None or end_date is not None):
+            start = start_date if start_date is not None else self._sorted_dates[0]
+            end = end_date if end_date is not None else self._sorted_dates[-1]
+            matched[:] = False
+            matched[self._date_rows(start, end)] = True
+            np.logical_and(result, matched, out=result)
+
+        return np.flatnonzero(result)
@@ -6,6 +6,9 @@ import plotly.graph_objects as go
 import streamlit as st
 import pandas as pd
 
+from .profiling import profiled
+from .telemetry import track_figure
+
 # Color palette
 COLORS = {
     'primary': '#1f77b4',
@@ -41,7 +44,24 @@ def format_number(value, prefix="", suffix="", decimal=0):
     return f"{prefix}{formatted}{suffix}"
 
 
-def create_metric_card(label: str, value, change_pct: float = None, prefix: str = "", suffix: str = ""):
+def yen_column(label: str = None, **kwargs):
+    """Column config for numeric yen amounts (formatting happens in the browser)"""
+    return st.column_config.NumberColumn(label, format="yen", **kwargs)
+
+
+def percent_column(label: str = None, decimal: int = 1, **kwargs):
+    """Column config for numeric percent values already scaled to 0-100"""
+    return st.column_config.NumberColumn(label, format=f"%.{decimal}f%%", **kwargs)
+
+
+def date_column(label: str = None, **kwargs):
+    """Column config for datetime columns shown as YYYY/MM/DD"""
+    return st.column_config.DateColumn(label, format="YYYY/MM/DD", **kwargs)
+
+
+@profiled(kind="chart")
+def create_metric_card(label: str, value, change_pct: float = None, prefix: str = "", suffix: str = "",
+                       help: str = None):
     """Create a metric card with optional change indicator"""
     # If value is already formatted as string, use it directly
     if isinstance(value, str):
@@ -49,14 +69,16 @@ def create_metric_card(label: str, value, change_pct: float = None, prefix: str
     else:
         formatted_value = format_number(value, prefix, suffix)
 
-    if change_pct is not None:
+    if change_pct is not None and not pd.isna(change_pct):
         delta = f"{change_pct:+.1f}%"
         delta_color = "normal" if change_pct >= 0 else "inverse"
-        st.metric(label=label, value=formatted_value, delta=delta, delta_color=delta_color)
+        st.metric(label=label, value=formatted_value, delta=delta, delta_color=delta_color, help=help)
     else:
-        st.metric(label=label, value=formatted_value)
+        st.metric(label=label, value=formatted_value, help=help)
 
 
+@profiled(kind="chart")
+@track_figure
 def create_line_chart(df: pd.DataFrame, x: str, y: str, title: str = "",
                       color: str = None, height: int = 400):
     """Create a line chart"""
@@ -79,6 +101,8 @@ def create_line_chart(df: pd.DataFrame, x: str, y: str, title: str = "",
     return fig
 
 
+@profiled(kind="chart")
+@track_figure
 def create_area_chart(df: pd.DataFrame, x: str, y: str, title: str = "",
                       color: str = None, height: int = 400):
     """Create an area chart"""
@@ -99,6 +123,8 @@ def create_area_chart(df: pd.DataFrame, x: str, y: str, title: str = "",
     return fig
 
 
+@profiled(kind="chart")
+@track_figure
 def create_bar_chart(df: pd.DataFrame, x: str, y: str, title: str = "",
                      orientation: str = "v", color: str = None, height: int = 400):
     """Create a bar chart"""
@@ -118,6 +144,8 @@ def create_bar_chart(df: pd.DataFrame, x: str, y: str, title: str = "",
     return fig
 
 
+@profiled(kind="chart")
+@track_figure
 def create_pie_chart(df: pd.DataFrame, values: str, names: str, title: str = "",
                      height: int = 400, hole: float = 0.4):
     """Create a donut/pie chart"""
@@ -135,15 +163,30 @@ def create_pie_chart(df: pd.DataFrame, values: str, names: str, title: str = "",
     return fig
 
 
-def create_funnel_chart(df: pd.DataFrame, x: str, y: str, title: str = "", height: int = 400):
-    """Create a funnel chart"""
-    fig = go.Figure(go.Funnel(
-        y=df[y],
-        x=df[x],
-        textposition="inside",
-        textinfo="value+percent initial",
-        marker=dict(color=COLOR_PALETTE[:len(df)]),
-    ))
+@profiled(kind="chart")
+@track_figure
+def create_funnel_chart(df: pd.DataFrame, x: str, y: str, title: str = "", height: int = 400,
+                        color: str = None):
+    """Create a funnel chart (one trace per ``color`` segment if given)"""
+    if color and color in df.columns:
+        fig = go.Figure()
+        for i, (segment, df_segment) in enumerate(df.groupby(color, sort=False)):
+            fig.add_trace(go.Funnel(
+                name=str(segment),
+                y=df_segment[y],
+                x=df_segment[x],
+                textposition="inside",
+                textinfo="value+percent initial",
+                marker=dict(color=COLOR_PALETTE[i % len(COLOR_PALETTE)]),
+            ))
+    else:
+        fig = go.Figure(go.Funnel(
+            y=df[y],
+            x=df[x],
+            textposition="inside",
+            textinfo="value+percent initial",
+            marker=dict(color=COLOR_PALETTE[:len(df)]),
+        ))
 
     fig.update_layout(
         title=title,
@@ -154,6 +197,8 @@ def create_funnel_chart(df: pd.DataFrame, x: str, y: str, title: str = "", heigh
     return fig
 
 
+@profiled(kind="chart")
+@track_figure
 def create_heatmap(df: pd.DataFrame, x: str, y: str, z: str, title: str = "", height: int = 400):
     """Create a heatmap"""
     pivot_df = df.pivot_table(values=z, index=y, columns=x, aggfunc='sum')
@@ -167,3 +212,94 @@ def create_heatmap(df: pd.DataFrame, x: str, y: str, z: str, title: str = "", he
     )
 
     return fig
+
+
+# ============================================================
+# Cross-filter state shared by the charts of a page
+# ============================================================
+CROSS_FILTER_KEY = "cross_filter"
+
+
+def get_cross_filter() -> dict:
+    """Active cross-filter as {dimension: [values]}"""
+    return {dim: list(vals) for dim, vals in st.session_state.get(CROSS_FILTER_KEY, {}).items()}
+
+
+def toggle_cross_filter(dimension: str, value):
+    """Add a dimension value to the cross-filter, or remove it if already selected"""
+    state = get_cross_filter()
+    values = state.get(dimension, [])
+    if value in values:
+        values.remove(value)
+    else:
+        values.append(value)
+    if values:
+        state[dimension] = values
+    else:
+        state.pop(dimension, None)
+    st.session_state[CROSS_FILTER_KEY] = state
+
+
+def clear_cross_filter(dimension: str = None):
+    """Clear one dimension or the whole cross-filter"""
+    state = get_cross_filter()
+    if dimension is None:
+        state = {}
+    else:
+        state.pop(dimension, None)
+    st.session_state[CROSS_FILTER_KEY] = state
+
+
+def _selected_category(fig, point: dict):
+    """Category value of a clicked point for pie, vertical and horizontal bar traces"""
+    if 'label' in point:
+        return point['label']
+    orientation = getattr(fig.data[0], 'orientation', None) if fig.data else None
+    return point.get('y') if orientation == 'h' else point.get('x')
+
+
+@profiled(kind="chart")
+def cross_filter_chart(fig, dimension: str, key: str, labels: dict = None):
+    """Render a chart whose clicked category toggles a cross-filter on ``dimension``
+
+    ``labels`` maps raw values to the labels shown in the chart (e.g. device
+    names translated to Japanese). A click updates the shared state and
+    reruns the whole page so every section re-slices.
+    """
+    event = st.plotly_chart(fig, width='stretch', on_select="rerun",
+                            selection_mode="points", key=key)
+    points = event.selection.points if event else []
+
+    # The selection stays in widget state across reruns; only act on new clicks
+    signature = tuple(sorted(str(_selected_category(fig, p)) for p in points))
+    last_key = f"_{key}_last_selection"
+    if signature == st.session_state.get(last_key, ()):
+        return
+    st.session_state[last_key] = signature
+    if not points:
+        return
+
+    reverse = {label: raw for raw, label in (labels or {}).items()}
+    for point in points:
+        category = _selected_category(fig, point)
+        toggle_cross_filter(dimension, reverse.get(category, category))
+    st.rerun(scope="app")
+
+
+def cross_filter_status(dimension_labels: dict = None):
+    """Show the active cross-filter with a button to clear it"""
+    state = get_cross_filter()
+    if not state:
+        st.caption("グラフの項目をクリックすると、他のグラフもその値で絞り込まれます（クロスフィルタ）")
+        return
+
+    dimension_labels = dimension_labels or {}
+    parts = [f"{dimension_labels.get(dim, dim)}: {', '.join(map(str, vals))}" for dim, vals in state.items()]
+    col1, col2 = st.columns([5, 1])
+    with col1:
+        st.info("クロスフィルタ適用中 — " + " / ".join(parts)
+                + "（該当するディメンションを持つデータのみ絞り込まれます）")
+    with col2:
+        if st.button("クロスフィルタ解除", key="clear_cross_filter"):
+            clear_cross_filter()
+            st.rerun()
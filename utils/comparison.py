@@ -0,0 +1,104 @@
+"""
+Period-over-period comparison utilities for Adobe Analytics Dashboard
+"""
+import numpy as np
+import pandas as pd
+
+from .metrics import METRICS, metric_inputs, derive_metrics
+
+CURRENT_PERIOD = "今期"
+
+# Reference period label -> (kind, amount)
+REFERENCE_PERIODS = {
+    "前日": ("days", 1),
+    "前週": ("days", 7),
+    "前月": ("months", 1),
+    "前年同期": ("years", 1),
+    "過去4期間平均": ("trailing", 4),
+}
+
+
+def reference_window(start_date, end_date, reference: str) -> tuple:
+    """(start, end) of a shifted reference window; trailing averages return the whole span"""
+    start, end = pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize()
+    kind, amount = REFERENCE_PERIODS[reference]
+    if kind == "days":
+        offset = pd.Timedelta(days=amount)
+    elif kind == "months":
+        offset = pd.DateOffset(months=amount)
+    elif kind == "years":
+        offset = pd.DateOffset(years=amount)
+    else:
+        length = (end - start).days + 1
+        return start - pd.Timedelta(days=length * amount), start - pd.Timedelta(days=1)
+    return start - offset, end - offset
+
+
+class ComparisonEngine:
+    """Answers KPI values for any window and many reference periods from prefix sums
+
+    The metric inputs of a daily table (see metrics.metric_inputs) are summed
+    per day onto a contiguous calendar and accumulated once. The sum over any
+    window is then ``cum[end + 1] - cum[start]``, so comparing the selected
+    window with every reference period costs a few array lookups instead of a
+    filter and aggregation per comparison.
+    """
+
+    def __init__(self, df: pd.DataFrame, names: list, date_col: str = 'date'):
+        self.names = list(names)
+        days = df[date_col].dt.normalize()
+        inputs = metric_inputs(df, self.names).groupby(days.to_numpy()).sum()
+
+        self.first_date = inputs.index.min()
+        calendar = pd.date_range(self.first_date, inputs.index.max(), freq='D')
+        daily = inputs.reindex(calendar, fill_value=0)
+
+        self.columns = list(daily.columns)
+        self.daily = daily
+        self.cum = np.vstack([np.zeros((1, len(self.columns))), np.cumsum(daily.to_numpy(dtype=float), axis=0)])
+
+    def _index(self, dates) -> np.ndarray:
+        return (pd.DatetimeIndex(dates) - self.first_date).days.to_numpy()
+
+    def window_sums(self, starts, ends) -> np.ndarray:
+        """Sums of the metric inputs for many windows at once (NaN if outside the data)"""
+        s = self._index(starts)
+        e = self._index(ends)
+        n_days = len(self.cum) - 1
+        valid = (s >= 0) & (e < n_days) & (s <= e)
+        s_safe = np.clip(s, 0, n_days - 1)
+        e_safe = np.clip(e, 0, n_days - 1)
+        sums = self.cum[e_safe + 1] - self.cum[s_safe]
+        sums[~valid] = np.nan
+        return sums
+
+    def compare(self, start_date, end_date, references=None) -> pd.DataFrame:
+        """KPI values for the window and each reference period (rows) x metric (columns)"""
+        references = list(REFERENCE_PERIODS) if references is None else list(references)
+        labels = [CURRENT_PERIOD] + references
+        windows = [(pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize())]
+        windows += [reference_window(start_date, end_date, ref) for ref in references]
+
+        starts, ends = zip(*windows)
+        sums = self.window_sums(starts, ends)
+
+        # Trailing windows hold N periods; divide the sums to get the per-period average
+        divisors = np.array([1] + [REFERENCE_PERIODS[ref][1] if REFERENCE_PERIODS[ref][0] == "trailing" else 1
+                                   for ref in references], dtype=float)
+        sums = sums / divisors[:, None]
+
+        return derive_metrics(pd.DataFrame(sums, index=labels, columns=self.columns), self.names)
+
+    def changes(self, table: pd.DataFrame) -> pd.DataFrame:
+        """Percent change of the current row vs every reference row, positive = better"""
+        current = table.loc[CURRENT_PERIOD]
+        references = table.drop(index=CURRENT_PERIOD)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = (current - references) / references.replace(0, np.nan) * 100
+        sign = pd.Series({name: 1 if METRICS[name].higher_is_better else -1 for name in table.columns})
+        return change * sign
+
+    def daily_series(self, start_date, end_date) -> pd.DataFrame:
+        """Per-day KPI values inside the window (for sparklines), from the same daily sums"""
+        window = self.daily.loc[pd.Timestamp(start_date).normalize():pd.Timestamp(end_date).normalize()]
+        return derive_metrics(window, self.names)
@@ -0,0 +1,389 @@
+"""
+Adobe Analytics data feed ingestion for Adobe Analytics Dashboard
+
+Turns raw hit-level data feeds (hit_data.tsv + column_headers.tsv) into the
+pre-aggregated tables the dashboard reads. The pipeline runs in three phases
+so memory stays bounded by the chunk size and the partition size, not by the
+size of the feed:
+
+1. partition (parallel per file): read hits in chunks, drop excluded hits,
+   keep only the columns we need and append them to one of N spill files
+   chosen by a hash of the visitor ID. All hits of a visitor land in the
+   same partition, whichever file or day they came from.
+2. sessionize (parallel per partition): load one partition, rebuild visits
+   from visitor ID + visit number and aggregate them into additive partial
+   sums per table (distinct visitor counts add up because visitors never
+   span partitions).
+3. combine: sum the partials and derive the ratio columns.
+"""
+import csv
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .funnel import compute_funnel
+
+# Data feed columns used by the pipeline (missing ones are treated as empty)
+FEED_COLUMNS = [
+    'post_visid_high', 'post_visid_low', 'visit_num', 'visit_page_num', 'hit_time_gmt', 'date_time',
+    'exclude_hit', 'hit_source', 'post_page_event', 'post_pagename', 'post_page_url', 'post_channel',
+    'post_event_list', 'post_product_list', 'duplicate_purchase', 'visit_referrer', 'visit_ref_type',
+    'paid_search', 'mobile_id', 'user_agent', 'geo_region',
+]
+
+# hit_source values that are not real hits (data sources / summary rows)
+EXCLUDED_HIT_SOURCES = ['5', '7', '8', '9']
+
+# Standard event IDs
+EVENT_PURCHASE = '1'
+EVENT_PROD_VIEW = '2'
+EVENT_CHECKOUT = '11'
+EVENT_CART_ADD = '12'
+
+# Funnel step: hit flag column -> step name
+FUNNEL_STEPS = [
+    ('prod_view', '商品閲覧'),
+    ('cart_add', 'カート追加'),
+    ('checkout', '購入手続き開始'),
+    ('purchase', '購入完了'),
+]
+
+# visit_ref_type ID -> referrer_type used by the dashboard
+REFERRER_TYPES = {
+    '2': 'Referral',
+    '3': 'Organic Search',
+    '4': 'Direct',
+    '6': 'Direct',
+    '7': 'Email',
+    '9': 'Social',
+}
+
+# geo_region values (name or JIS prefecture code) -> region label
+REGION_NAMES = {
+    'tokyo': '東京', '13': '東京',
+    'osaka': '大阪', '27': '大阪',
+    'kanagawa': '神奈川', '14': '神奈川',
+    'aichi': '愛知', '23': '愛知',
+    'fukuoka': '福岡', '40': '福岡',
+    'hokkaido': '北海道', '01': '北海道',
+    'saitama': '埼玉', '11': '埼玉',
+    'chiba': '千葉', '12': '千葉',
+    'hyogo': '兵庫', '28': '兵庫',
+}
+
+# Domain labels skipped when naming a referrer (www.google.co.jp -> google)
+_DOMAIN_NOISE = {'www', 'm', 'l', 'lm', 'mobile', 'search', 'com', 'co', 'jp', 'ne', 'or', 'net', 'org', 'io'}
+
+# Raw bytes per partition; sets the default partition count (memory per worker)
+PARTITION_BYTES = 512 * 1024 ** 2
+
+_SPILL_DTYPES = {'visitor': str, 'visit_num': np.int64, 'visit_page_num': np.int64, 'time': np.int64,
+                 'date': str, 'is_pageview': bool, 'page_name': str, 'page_url': str, 'page_category': str,
+                 'prod_view': bool, 'cart_add': bool, 'checkout': bool, 'purchase': bool,
+                 'product_list': str, 'referrer': str, 'referrer_type': str, 'device': str, 'region': str}
+
+
+def find_feed_files(feed_dir) -> list:
+    """hit_data files (plain or compressed) under a directory, in name order"""
+    return sorted(p for p in Path(feed_dir).rglob('*hit_data*.tsv*') if p.is_file())
+
+
+def read_column_headers(hit_file: Path) -> list:
+    """Column names from the column_headers.tsv next to a hit_data file (or a parent folder)"""
+    for folder in [hit_file.parent, *hit_file.parents]:
+        headers = folder / 'column_headers.tsv'
+        if headers.exists():
+            return headers.read_text(encoding='utf-8').strip('\n').split('\t')
+    raise FileNotFoundError(f"column_headers.tsv not found for {hit_file}")
+
+
+def _has_event(events: pd.Series, event_id: str) -> pd.Series:
+    return events.str.contains(rf'(?:^|,){event_id}(?:=[^,]*)?(?:,|$)', regex=True)
+
+
+def referrer_name(urls: pd.Series) -> pd.Series:
+    """Short referrer name from a URL (https://www.google.co.jp/search -> google), '' if none"""
+    unique = pd.Series(urls.unique())
+    host = unique.str.extract(r'^(?:[a-z]+://)?([^/:?#]+)', expand=False).fillna('').str.lower()
+    names = host.str.split('.').map(
+        lambda parts: next((p for p in reversed(parts) if p not in _DOMAIN_NOISE), ''))
+    return urls.map(dict(zip(unique, names)))
+
+
+def classify_device(mobile_id: pd.Series, user_agent: pd.Series) -> pd.Series:
+    """desktop / mobile / tablet from the mobile device lookup ID and user agent"""
+    is_mobile = ~mobile_id.isin(['', '0'])
+    is_tablet = user_agent.str.contains(r'iPad|Tablet|Android(?!.*Mobile)', regex=True)
+    return pd.Series(np.where(is_mobile, np.where(is_tablet, 'tablet', 'mobile'), 'desktop'),
+                     index=mobile_id.index)
+
+
+def prepare_hits(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Drop excluded hits and reduce raw feed columns to what sessionization needs"""
+    for column in FEED_COLUMNS:
+        if column not in chunk.columns:
+            chunk[column] = ''
+
+    keep = chunk['exclude_hit'].isin(['', '0']) & ~chunk['hit_source'].isin(EXCLUDED_HIT_SOURCES)
+    chunk = chunk[keep]
+
+    events = chunk['post_event_list']
+    purchase = _has_event(events, EVENT_PURCHASE) & (chunk['duplicate_purchase'] != '1')
+    url_path = chunk['post_page_url'].str.replace(r'^[a-z]+://[^/]+', '', regex=True).str.split('?').str[0]
+
+    referrer_type = chunk['visit_ref_type'].map(REFERRER_TYPES).fillna('Other')
+    referrer_type = referrer_type.mask((referrer_type == 'Organic Search') & (chunk['paid_search'] == '1'),
+                                       'Paid Search')
+    referrer = referrer_name(chunk['visit_referrer']).mask(referrer_type == 'Direct', 'direct')
+
+    return pd.DataFrame({
+        'visitor': chunk['post_visid_high'] + ':' + chunk['post_visid_low'],
+        'visit_num': pd.to_numeric(chunk['visit_num'], errors='coerce').fillna(0).astype(np.int64),
+        'visit_page_num': pd.to_numeric(chunk['visit_page_num'], errors='coerce').fillna(0).astype(np.int64),
+        'time': pd.to_numeric(chunk['hit_time_gmt'], errors='coerce').fillna(0).astype(np.int64),
+        'date': chunk['date_time'].str[:10],
+        'is_pageview': chunk['post_page_event'].isin(['', '0']),
+        'page_name': chunk['post_pagename'].where(chunk['post_pagename'] != '', url_path),
+        'page_url': url_path.where(url_path != '', '/'),
+        'page_category': chunk['post_channel'].where(chunk['post_channel'] != '', 'その他'),
+        'prod_view': _has_event(events, EVENT_PROD_VIEW),
+        'cart_add': _has_event(events, EVENT_CART_ADD),
+        'checkout': _has_event(events, EVENT_CHECKOUT),
+        'purchase': purchase,
+        'product_list': chunk['post_product_list'].where(purchase, ''),
+        'referrer': referrer.where(referrer != '', 'other'),
+        'referrer_type': referrer_type,
+        'device': classify_device(chunk['mobile_id'], chunk['user_agent']),
+        'region': chunk['geo_region'].str.lower().map(REGION_NAMES).fillna('その他'),
+    })
+
+
+def partition_file(hit_file, spill_dir, n_partitions: int, chunksize: int = 500_000) -> int:
+    """Phase 1: stream one hit_data file into per-visitor-hash spill files; returns hits kept"""
+    hit_file, spill_dir = Path(hit_file), Path(spill_dir)
+    headers = read_column_headers(hit_file)
+    wanted = set(FEED_COLUMNS)
+    reader = pd.read_csv(hit_file, sep='\t', header=None, names=headers, usecols=lambda c: c in wanted,
+                         dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE, escapechar='\\',
+                         encoding='utf-8', encoding_errors='replace', chunksize=chunksize)
+
+    kept = 0
+    for chunk in reader:
+        hits = prepare_hits(chunk)
+        kept += len(hits)
+        partition = pd.util.hash_pandas_object(hits['visitor'], index=False).to_numpy() % n_partitions
+        for part, rows in hits.groupby(partition, sort=False):
+            file_id = hashlib.md5(str(hit_file).encode()).hexdigest()[:12]
+            target = spill_dir / f"p{part:05d}" / f"{hit_file.name}.{file_id}.tsv"
+            target.parent.mkdir(parents=True, exist_ok=True)
+            rows.to_csv(target, sep='\t', index=False, mode='a', header=not target.exists())
+    return kept
+
+
+def _load_partition(part_dir: Path) -> pd.DataFrame:
+    pieces = [pd.read_csv(f, sep='\t', dtype=_SPILL_DTYPES, keep_default_na=False)
+              for f in sorted(part_dir.glob('*.tsv'))]
+    return pd.concat(pieces, ignore_index=True)
+
+
+def parse_products(hits: pd.DataFrame) -> pd.DataFrame:
+    """One row per product of purchase hits: (hit, category, product, quantity, revenue)"""
+    purchases = hits.loc[hits['product_list'] != '', 'product_list']
+    items = purchases.str.split(',').explode()
+    fields = items.str.split(';', expand=True).reindex(columns=range(4)).fillna('')
+    return pd.DataFrame({
+        'hit': items.index,
+        'product_category': fields[0].str.strip(),
+        'product': fields[1].str.strip(),
+        'quantity': pd.to_numeric(fields[2], errors='coerce').fillna(0),
+        'revenue': pd.to_numeric(fields[3], errors='coerce').fillna(0),
+    }).query("product != ''")
+
+
+def _visit_sums(visits: pd.DataFrame, keys: list) -> pd.DataFrame:
+    return visits.groupby(keys, sort=False).agg(
+        sessions=('visitor', 'size'),
+        visitors=('visitor', 'nunique'),
+        pageviews=('pageviews', 'sum'),
+        conversions=('conversions', 'sum'),
+        revenue=('revenue', 'sum'),
+        bounces=('bounce', 'sum'),
+        duration=('duration', 'sum'),
+    ).reset_index()
+
+
+def sessionize_partition(part_dir) -> dict:
+    """Phase 2: rebuild visits for one partition and return additive partial tables"""
+    hits = _load_partition(Path(part_dir))
+    hits = hits.sort_values(['visitor', 'visit_num', 'visit_page_num', 'time'], kind='stable',
+                            ignore_index=True)
+
+    # Visit boundaries: a new visitor or a new visit number
+    visitor, visit_num = hits['visitor'].to_numpy(), hits['visit_num'].to_numpy()
+    is_first = np.r_[True, (visitor[1:] != visitor[:-1]) | (visit_num[1:] != visit_num[:-1])]
+    hits['visit'] = np.cumsum(is_first) - 1
+
+    products = parse_products(hits)
+    hits['revenue'] = products.groupby('hit')['revenue'].sum().reindex(hits.index, fill_value=0)
+
+    # Visit-level table; attributes come from the first hit of the visit
+    first = hits[is_first].set_index('visit')
+    by_visit = hits.groupby('visit', sort=True)
+    visits = first[['visitor', 'visit_num', 'date', 'referrer', 'referrer_type', 'device', 'region']].assign(
+        pageviews=by_visit['is_pageview'].sum(),
+        conversions=by_visit['purchase'].sum(),
+        revenue=by_visit['revenue'].sum(),
+        bounce=by_visit.size() == 1,
+        duration=by_visit['time'].max() - by_visit['time'].min(),
+    )
+
+    daily = _visit_sums(visits, ['date'])
+    daily = daily.merge(
+        visits.assign(new=visits['visit_num'] == 1).groupby(['date', 'new'])['visitor'].nunique()
+        .unstack(fill_value=0).reindex(columns=[True, False], fill_value=0)
+        .rename(columns={True: 'new_visitors', False: 'returning_visitors'}).reset_index(),
+        on='date', how='left')
+
+    # Page views: time on page is the gap to the next page view of the same visit
+    views = hits[hits['is_pageview']]
+    view_visit, view_time = views['visit'].to_numpy(), views['time'].to_numpy()
+    same_visit_next = np.r_[view_visit[1:] == view_visit[:-1], False][:len(views)]
+    views = views.assign(
+        time_on_page=np.where(same_visit_next, np.r_[view_time[1:], 0][:len(views)] - view_time, 0),
+        timed=same_visit_next,
+        exit=~same_visit_next,
+        entrance=np.r_[True, view_visit[1:] != view_visit[:-1]][:len(views)],
+    )
+    pages = views.groupby(['date', 'page_name', 'page_url', 'page_category'], sort=False).agg(
+        pageviews=('visit', 'size'),
+        unique_pageviews=('visit', 'nunique'),
+        time_on_page=('time_on_page', 'sum'),
+        timed=('timed', 'sum'),
+        exits=('exit', 'sum'),
+        entrances=('entrance', 'sum'),
+    ).reset_index()
+
+    # Funnel: distinct visitors reaching each step per day
+    funnel = pd.concat([
+        hits.loc[hits[flag], ['date', 'visitor']].drop_duplicates()
+        .groupby('date').size().rename('users').reset_index()
+        .assign(step_number=number, step_name=name)
+        for number, (flag, name) in enumerate(FUNNEL_STEPS, start=1)
+    ], ignore_index=True)
+
+    product_sales = (products.assign(date=hits['date'].to_numpy()[products['hit'].to_numpy()])
+                     .groupby(['date', 'product', 'product_category'], sort=False)[['quantity', 'revenue']]
+                     .sum().reset_index())
+
+    return {
+        'daily_summary': daily,
+        'page_metrics': pages,
+        'referrer_metrics': _visit_sums(visits, ['date', 'referrer', 'referrer_type']),
+        'device_metrics': _visit_sums(visits, ['date', 'device']),
+        'region_metrics': _visit_sums(visits, ['date', 'region']),
+        'conversion_funnel': funnel,
+        'product_sales': product_sales,
+    }
+
+
+def _ratio(numerator: pd.Series, denominator: pd.Series, digits: int) -> pd.Series:
+    return (numerator / denominator.replace(0, np.nan)).fillna(0).round(digits)
+
+
+def combine_partials(partials: list) -> dict:
+    """Phase 3: sum partial tables from every partition and derive the dashboard columns"""
+    keys = {
+        'daily_summary': ['date'],
+        'page_metrics': ['date', 'page_name', 'page_url', 'page_category'],
+        'referrer_metrics': ['date', 'referrer', 'referrer_type'],
+        'device_metrics': ['date', 'device'],
+        'region_metrics': ['date', 'region'],
+        'conversion_funnel': ['date', 'step_number', 'step_name'],
+        'product_sales': ['date', 'product', 'product_category'],
+    }
+    if not partials:
+        raise ValueError("No hits left after excluding filtered hits")
+    sums = {name: pd.concat([p[name] for p in partials], ignore_index=True)
+            .groupby(key, sort=True).sum().reset_index()
+            for name, key in keys.items()}
+
+    daily = sums['daily_summary']
+    daily['bounce_rate'] = _ratio(daily['bounces'], daily['sessions'], 4)
+    daily['avg_session_duration'] = _ratio(daily['duration'], daily['sessions'], 2)
+    daily['pages_per_session'] = _ratio(daily['pageviews'], daily['sessions'], 2)
+
+    pages = sums['page_metrics']
+    pages['avg_time_on_page'] = _ratio(pages['time_on_page'], pages['timed'], 2)
+    pages['exit_rate'] = _ratio(pages['exits'], pages['pageviews'], 4)
+
+    for name in ['referrer_metrics', 'device_metrics']:
+        sums[name]['bounce_rate'] = _ratio(sums[name]['bounces'], sums[name]['sessions'], 4)
+
+    funnel = compute_funnel(sums['conversion_funnel'], segment='date')
+    rates = ['conversion_rate_from_prev', 'conversion_rate_from_start']
+    funnel[rates] = funnel[rates].fillna(0).round(4)
+
+    products = sums['product_sales']
+    products = products.assign(product_id=products['product'], product_name=products['product'],
+                               unit_price=_ratio(products['revenue'], products['quantity'], 0),
+                               product_category=products['product_category'].replace('', 'その他'))
+
+    columns = {
+        'daily_summary': ['date', 'visitors', 'new_visitors', 'returning_visitors', 'sessions', 'pageviews',
+                          'conversions', 'revenue', 'bounce_rate', 'avg_session_duration', 'pages_per_session'],
+        'page_metrics': ['date', 'page_name', 'page_url', 'page_category', 'pageviews', 'unique_pageviews',
+                         'avg_time_on_page', 'exit_rate', 'entrances'],
+        'referrer_metrics': ['date', 'referrer', 'referrer_type', 'sessions', 'visitors', 'pageviews',
+                             'conversions', 'revenue', 'bounce_rate'],
+        'device_metrics': ['date', 'device', 'sessions', 'visitors', 'pageviews', 'conversions', 'revenue',
+                           'bounce_rate'],
+        'region_metrics': ['date', 'region', 'sessions', 'visitors', 'pageviews', 'conversions', 'revenue'],
+        'conversion_funnel': ['date', 'step_number', 'step_name', 'users', 'conversion_rate_from_prev',
+                              'conversion_rate_from_start'],
+        'product_sales': ['date', 'product_id', 'product_name', 'product_category', 'unit_price', 'quantity',
+                          'revenue'],
+    }
+    tables = {**sums, 'conversion_funnel': funnel, 'product_sales': products}
+    return {name: tables[name].reindex(columns=cols) for name, cols in columns.items()}
+
+
+def ingest_feeds(feed_dir, output_dir, workers: int = None, partitions: int = None,
+                 chunksize: int = 500_000, work_dir=None) -> dict:
+    """Run the full pipeline and write one CSV per dashboard table; returns the tables
+
+    ``workers`` defaults to the number of cores. ``partitions`` defaults to
+    one per PARTITION_BYTES of raw feed (at least one per worker), which
+    bounds how much of the feed a single worker holds while sessionizing.
+    """
+    files = find_feed_files(feed_dir)
+    if not files:
+        raise FileNotFoundError(f"No hit_data files found under {feed_dir}")
+
+    workers = workers or os.cpu_count() or 1
+    if partitions is None:
+        total_bytes = sum(f.stat().st_size for f in files)
+        partitions = max(workers, math.ceil(total_bytes / PARTITION_BYTES))
+
+    spill_dir = Path(tempfile.mkdtemp(prefix='aa_feed_', dir=work_dir))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(partition_file, files, [spill_dir] * len(files), [partitions] * len(files),
+                          [chunksize] * len(files)))
+            part_dirs = sorted(p for p in spill_dir.iterdir() if p.is_dir())
+            partials = list(pool.map(sessionize_partition, part_dirs))
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    tables = combine_partials(partials)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for name, df in tables.items():
+        df.to_csv(output_dir / f"{name}.csv", index=False, encoding='utf-8-sig')
+    return tables
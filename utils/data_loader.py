@@ -1,28 +1,125 @@
 """
 Data loading utilities for Adobe Analytics Dashboard
 """
+import copy
+import os
+import pickle
+import time
+
+import numpy as np
 import pandas as pd
 import streamlit as st
 from pathlib import Path
 
-DATA_DIR = Path(__file__).parent.parent / "sample_data"
+from .resample import resample, has_intraday, period_start
+from .metrics import compute_metrics, derive_metrics
+from .comparison import ComparisonEngine, reference_window
+from .bitmap_index import BitmapIndex
+from .anomaly import AnomalyDetector, daily_metric_values
+from .profiling import profiled, tracked_cache
+from .snapshot import SNAPSHOT_FILE, Snapshot, snapshotted
+from .datasets import DATASET_CACHE, current_dataset, dataset_dir, table_key
+from . import telemetry
 
-@st.cache_data
-def load_data(filename: str) -> pd.DataFrame:
-    """Load CSV data with caching"""
-    filepath = DATA_DIR / filename
+# AA_DASHBOARD_DATA_DIR points the dashboard at another data folder (e.g. a generated dataset);
+# with AA_DASHBOARD_DATASETS_DIR each session reads the dataset selected in the sidebar instead
+DATA_DIR = Path(os.environ.get("AA_DASHBOARD_DATA_DIR") or Path(__file__).parent.parent / "sample_data")
+
+# Dimension columns indexed with bitmaps for cross-filtering
+INDEXED_DIMENSIONS = ['device', 'referrer', 'referrer_type', 'region', 'page_category', 'product_category']
+
+# Stored 0-1 rates materialized as 0-100 percent columns when a table is loaded
+PERCENT_COLUMNS = ['bounce_rate', 'exit_rate']
+
+def _table_path(table: str) -> Path:
+    """Path of a table key; a Parquet file with the same stem takes precedence over the CSV"""
+    dataset, _, filename = table.rpartition('/')
+    filepath = (dataset_dir(dataset) if dataset else DATA_DIR) / filename
+    parquet = filepath.with_suffix('.parquet')
+    return parquet if parquet.exists() else filepath
+
+
+def _version(table: str) -> int:
+    filepath = _table_path(table)
+    if not filepath.exists():
+        return 0
+    return filepath.stat().st_mtime_ns
+
+
+def _table(filename: str) -> tuple:
+    """(table key, version) of a table in the current session's dataset
+
+    The key is qualified with the dataset, so every cache below keeps the
+    report suites apart.
+    """
+    table = table_key(filename, current_dataset())
+    return table, _version(table)
+
+
+def get_data_version(filename: str) -> int:
+    """Version token for a table (file mtime); changes whenever the file is rewritten"""
+    return _table(filename)[1]
+
+
+@tracked_cache(st.cache_resource)
+def _open_snapshot(path: str, version: int):
+    try:
+        return Snapshot(path)
+    except (OSError, ValueError, pickle.UnpicklingError):
+        return None
+
+
+def get_snapshot():
+    """Precomputed query snapshot (see build_snapshot.py), or None if there is none
+
+    AA_DASHBOARD_SNAPSHOT overrides its location (default: dashboard.snapshot
+    in the data folder; each dataset of AA_DASHBOARD_DATASETS_DIR has its own).
+    The file is reopened whenever it is rebuilt.
+    """
+    dataset = current_dataset()
+    if dataset:
+        path = dataset_dir(dataset) / SNAPSHOT_FILE
+    else:
+        path = Path(os.environ.get("AA_DASHBOARD_SNAPSHOT") or DATA_DIR / SNAPSHOT_FILE)
+    try:
+        version = path.stat().st_mtime_ns
+    except OSError:
+        return None
+    return _open_snapshot(str(path), version)
+
+
+@tracked_cache(DATASET_CACHE)
+def _load_csv(table: str, version: int) -> pd.DataFrame:
+    """Read one CSV (or its Parquet counterpart); cached per (table, version) within the dataset budget
+
+    The cached frame is shared, not copied per call: callers must not modify it.
+    """
+    filepath = _table_path(table)
     if not filepath.exists():
         st.error(f"File not found: {filepath}")
         return pd.DataFrame()
 
-    df = pd.read_csv(filepath)
+    started = time.perf_counter()
+    df = pd.read_parquet(filepath) if filepath.suffix == '.parquet' else pd.read_csv(filepath)
 
     if 'date' in df.columns:
         df['date'] = pd.to_datetime(df['date'])
+    telemetry.record_csv_parse(table, time.perf_counter() - started, len(df))
+
+    # Derived columns are computed once per table version instead of on every rerun
+    for column in PERCENT_COLUMNS:
+        if column in df.columns:
+            df[f"{column}_pct"] = df[column] * 100
 
     return df
 
 
+@profiled(kind="data")
+def load_data(filename: str) -> pd.DataFrame:
+    """Load CSV data with caching"""
+    return _load_csv(*_table(filename))
+
+
 def get_date_range(df: pd.DataFrame) -> tuple:
     """Get min and max dates from dataframe"""
     if 'date' not in df.columns or df.empty:
@@ -30,34 +127,242 @@ def get_date_range(df: pd.DataFrame) -> tuple:
     return df['date'].min(), df['date'].max()
 
 
+@profiled(kind="data")
 def filter_by_date(df: pd.DataFrame, start_date, end_date) -> pd.DataFrame:
     """Filter dataframe by date range"""
     if 'date' not in df.columns:
         return df
 
-    mask = (df['date'] >= pd.to_datetime(start_date)) & (df['date'] <= pd.to_datetime(end_date))
+    # The end date is inclusive of the whole day, so hourly rows after 00:00 are kept
+    end = pd.to_datetime(end_date).normalize() + pd.Timedelta(days=1)
+    mask = (df['date'] >= pd.to_datetime(start_date)) & (df['date'] < end)
     return df[mask]
 
 
+@tracked_cache(DATASET_CACHE)
+@snapshotted(get_snapshot)
+def _filter_cached(table: str, version: int, start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
+    df = _load_csv(table, version)
+    telemetry.record_rows_scanned("filter", len(df))
+    return filter_by_date(df, start_date, end_date)
+
+
+def load_filtered(filename: str, start_date, end_date) -> pd.DataFrame:
+    """Load a table filtered to a date range, cached per (table version, start, end)
+
+    All pages share this cache, so switching pages with the same period
+    does not refilter the tables again.
+    """
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    return _filter_cached(*_table(filename), start, end)
+
+
+@tracked_cache(DATASET_CACHE)
+def _bitmap_index(table: str, version: int) -> BitmapIndex:
+    return BitmapIndex(_load_csv(table, version), INDEXED_DIMENSIONS)
+
+
+def get_bitmap_index(filename: str) -> BitmapIndex:
+    """Per-dimension bitmap index of a table, built once per table version"""
+    return _bitmap_index(*_table(filename))
+
+
+def _freeze_filters(filters: dict) -> tuple:
+    """Hashable, order-independent form of a {dimension: values} filter"""
+    frozen = []
+    for dim, vals in sorted((filters or {}).items()):
+        vals = vals if isinstance(vals, (list, tuple, set)) else [vals]
+        frozen.append((dim, tuple(sorted(vals))))
+    return tuple(frozen)
+
+
+@tracked_cache(DATASET_CACHE)
+@snapshotted(get_snapshot)
+def _slice_cached(table: str, version: int, start_date: pd.Timestamp, end_date: pd.Timestamp,
+                  filters: tuple) -> pd.DataFrame:
+    index = _bitmap_index(table, version)
+    applicable = index.applicable(dict(filters))
+    if not applicable:
+        return _filter_cached(table, version, start_date, end_date)
+    rows = index.select(applicable, start_date, end_date)
+    telemetry.record_rows_scanned("slice", len(rows))
+    return _load_csv(table, version).iloc[rows]
+
+
+def load_sliced(filename: str, start_date, end_date, filters: dict = None) -> pd.DataFrame:
+    """Load a table filtered to a date range and dimension values (cross-filter)
+
+    Dimensions the table does not have are ignored. Slices are answered from
+    the bitmap index and cached per (table version, period, filters).
+    """
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    frozen = _freeze_filters(filters)
+    if not frozen:
+        return _filter_cached(*_table(filename), start, end)
+    return _slice_cached(*_table(filename), start, end, frozen)
+
+
+@tracked_cache(DATASET_CACHE)
+@snapshotted(get_snapshot)
+def _aggregate_cached(table: str, version: int, start_date: pd.Timestamp, end_date: pd.Timestamp,
+                      by: tuple, agg: dict, filters: tuple = (), derive: tuple = ()) -> pd.DataFrame:
+    if filters:
+        df = _slice_cached(table, version, start_date, end_date, filters)
+    else:
+        df = _filter_cached(table, version, start_date, end_date)
+    telemetry.record_rows_scanned("aggregate", len(df))
+    result = df.groupby(list(by)).agg(agg).reset_index()
+    return _with_derived(result, derive)
+
+
+def _with_derived(sums: pd.DataFrame, derive: tuple) -> pd.DataFrame:
+    """Append registry ratio metrics (e.g. cvr) computed from aggregated sums"""
+    if not derive:
+        return sums
+    return pd.concat([sums, derive_metrics(sums, list(derive))], axis=1)
+
+
+def aggregate_by(filename: str, start_date, end_date, by: tuple, agg: dict, filters: dict = None,
+                 derive=()) -> pd.DataFrame:
+    """Group a date-filtered table and cache the aggregate per (table version, period, spec)
+
+    ``derive`` names registry metrics (sum/ratio) added from the aggregated
+    sums inside the cache, so pages do not add them on every rerun.
+    """
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    return _aggregate_cached(*_table(filename), start, end, tuple(by), agg,
+                             _freeze_filters(filters), tuple(derive))
+
+
+@tracked_cache(DATASET_CACHE)
+@snapshotted(get_snapshot)
+def _resample_cached(table: str, version: int, start_date: pd.Timestamp, end_date: pd.Timestamp,
+                     freq: str, agg: dict, week_start: int, derive: tuple = ()) -> pd.DataFrame:
+    df = _filter_cached(table, version, start_date, end_date)
+    telemetry.record_rows_scanned("resample", len(df))
+    return _with_derived(resample(df, freq, agg, week_start=week_start), derive)
+
+
+def resample_by(filename: str, start_date, end_date, freq: str, agg: dict, week_start: int = 0,
+                derive=()) -> pd.DataFrame:
+    """Resample a date-filtered table to hour/day/week/month, cached per (table version, period, spec)
+
+    ``derive`` adds registry ratio metrics (e.g. cvr) computed from the bucket sums.
+    """
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    return _resample_cached(*_table(filename), start, end, freq, agg, week_start,
+                            tuple(derive))
+
+
+@tracked_cache(DATASET_CACHE)
+@snapshotted(get_snapshot)
+def _resample_long_cached(table: str, version: int, start_date: pd.Timestamp, end_date: pd.Timestamp,
+                          freq: str, series: dict, var_name: str, value_name: str, week_start: int) -> pd.DataFrame:
+    wide = _resample_cached(table, version, start_date, end_date, freq,
+                            {column: 'sum' for column in series}, week_start)
+    long = wide.melt(id_vars=['date'], value_vars=list(series), var_name=var_name, value_name=value_name)
+    long[var_name] = long[var_name].map(series)
+    return long
+
+
+def resample_long(filename: str, start_date, end_date, freq: str, series: dict,
+                  var_name: str = '指標', value_name: str = '値', week_start: int = 0) -> pd.DataFrame:
+    """Long-format (melted) view of summed columns for multi-series charts
+
+    ``series`` maps columns to the labels shown in the legend. The melted
+    frame is cached per (table version, period, spec).
+    """
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    return _resample_long_cached(*_table(filename), start, end, freq, series,
+                                 var_name, value_name, week_start)
+
+
+@tracked_cache(DATASET_CACHE)
+@snapshotted(get_snapshot)
+def _resample_metrics_cached(table: str, version: int, start_date: pd.Timestamp, end_date: pd.Timestamp,
+                             freq: str, names: tuple, week_start: int) -> pd.DataFrame:
+    df = _filter_cached(table, version, start_date, end_date)
+    telemetry.record_rows_scanned("resample_metrics", len(df))
+    keys = pd.Series(period_start(df['date'], freq, week_start), index=df.index, name='date')
+    return compute_metrics(df, list(names), by=keys).sort_values('date', ignore_index=True)
+
+
+def resample_metrics(filename: str, start_date, end_date, freq: str, names, week_start: int = 0) -> pd.DataFrame:
+    """Registered metrics per hour/day/week/month bucket, cached per (table version, period, spec)
+
+    Unlike resample_by, rates are aggregated with the registry rules
+    (weighted means / ratios of sums) instead of averaging daily rates.
+    """
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    return _resample_metrics_cached(*_table(filename), start, end, freq, tuple(names), week_start)
+
+
+def has_hourly_data(filename: str) -> bool:
+    """True if a table is stored at hourly grain"""
+    return has_intraday(load_data(filename))
+
+
+@tracked_cache(DATASET_CACHE)
+@snapshotted(get_snapshot)
+def _group_quantile_cached(table: str, version: int, start_date: pd.Timestamp, end_date: pd.Timestamp,
+                           by: tuple, column: str, q: float) -> float:
+    # The aggregate is already cached and small (one row per group), so the exact quantile is cheap
+    totals = _aggregate_cached(table, version, start_date, end_date, by, {column: 'sum'})[column].to_numpy()
+    return float(np.quantile(totals, q)) if len(totals) else np.nan
+
+
+def group_quantile(filename: str, start_date, end_date, by, column: str, q: float) -> float:
+    """Quantile of per-group totals of ``column`` over a period, cached per (table version, period)"""
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    by = (by,) if isinstance(by, str) else tuple(by)
+    return _group_quantile_cached(*_table(filename), start, end, by, column, q)
+
+
 def get_comparison_data(df: pd.DataFrame, current_start, current_end, period_type: str = "前週") -> pd.DataFrame:
     """Get comparison period data"""
-    current_start = pd.to_datetime(current_start)
-    current_end = pd.to_datetime(current_end)
-    period_days = (current_end - current_start).days + 1
-
-    if period_type == "前日":
-        prev_start = current_start - pd.Timedelta(days=1)
-        prev_end = current_end - pd.Timedelta(days=1)
-    elif period_type == "前週":
-        prev_start = current_start - pd.Timedelta(days=7)
-        prev_end = current_end - pd.Timedelta(days=7)
-    else:  # 前月
-        prev_start = current_start - pd.Timedelta(days=30)
-        prev_end = current_end - pd.Timedelta(days=30)
-
+    prev_start, prev_end = reference_window(current_start, current_end, period_type)
     return filter_by_date(df, prev_start, prev_end)
 
 
+@tracked_cache(DATASET_CACHE)
+def _comparison_engine(table: str, version: int, names: tuple) -> ComparisonEngine:
+    return ComparisonEngine(_load_csv(table, version), list(names))
+
+
+def get_comparison_engine(filename: str, names) -> ComparisonEngine:
+    """Prefix-sum comparison engine for a daily table, built once per table version"""
+    return _comparison_engine(*_table(filename), tuple(names))
+
+
+@tracked_cache(DATASET_CACHE)
+def _anomaly_detector(table: str, version: int, names: tuple) -> AnomalyDetector:
+    # Continue from the detector of the previous table version while it is resident;
+    # the copy is updated aside, so sessions still reading the old one are unaffected
+    previous = DATASET_CACHE.previous(_anomaly_detector, table, names)
+    detector = copy.copy(previous) if previous is not None else AnomalyDetector(names)
+    df = _load_csv(table, version)
+    if not df.empty:
+        detector.update(daily_metric_values(df, detector.names))
+    detector.version = version
+    return detector
+
+
+def get_anomaly_detector(filename: str, names) -> AnomalyDetector:
+    """Rolling/weekday anomaly detector for a daily table, updated incrementally per table version
+
+    When the file changes, only the days that were appended or revised are
+    scored; the baselines of unchanged days are reused.
+    """
+    return _anomaly_detector(*_table(filename), tuple(names))
+
+
 def calculate_change(current_value, previous_value) -> tuple:
     """Calculate percentage change and return (change_value, change_pct, is_positive)"""
     if previous_value == 0:
@@ -0,0 +1,244 @@
+"""
+Dataset (report suite) selection and the memory-budgeted dataset cache
+
+With AA_DASHBOARD_DATASETS_DIR set, every subfolder that contains a
+daily_summary table is a dataset (one Adobe report suite) that can be chosen
+in the sidebar. Loaded tables and their per-table indexes are held in
+DATASET_CACHE, grouped by dataset: when the total exceeds the budget
+(AA_DASHBOARD_CACHE_MB), the least recently used datasets are dropped as a
+whole, so many suites can share one server. The per-query results derived
+from those tables (period filters, slices, aggregates, resamples) and the
+anomaly detectors are cached there too, so they count toward the budget and
+are freed with their dataset.
+"""
+import functools
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from . import telemetry
+from .filters import _bind, _sync
+
+DATASETS_DIR = Path(os.environ["AA_DASHBOARD_DATASETS_DIR"]) if os.environ.get("AA_DASHBOARD_DATASETS_DIR") else None
+# Dataset selected for new sessions (default: the first one in name order)
+DEFAULT_DATASET = os.environ.get("AA_DASHBOARD_DATASET")
+CACHE_BUDGET_MB = float(os.environ.get("AA_DASHBOARD_CACHE_MB", "2048"))
+
+# Durable session-state key of the selected dataset
+DATASET_KEY = "dataset"
+
+
+def list_datasets() -> list:
+    """Names of the dataset folders under DATASETS_DIR (empty when it is not configured)"""
+    if DATASETS_DIR is None or not DATASETS_DIR.is_dir():
+        return []
+    return sorted(p.name for p in DATASETS_DIR.iterdir()
+                  if p.is_dir() and any((p / f"daily_summary{ext}").exists() for ext in ('.csv', '.parquet')))
+
+
+def current_dataset() -> str:
+    """Dataset of the running session, or None outside a session / without DATASETS_DIR
+
+    Scripts and benchmarks (no session) keep reading the data_loader.DATA_DIR folder.
+    """
+    if DATASETS_DIR is None or get_script_run_ctx() is None:
+        return None
+    dataset = st.session_state.get(DATASET_KEY)
+    if dataset is None:
+        names = list_datasets()
+        if not names:
+            return None
+        dataset = DEFAULT_DATASET if DEFAULT_DATASET in names else names[0]
+    return dataset
+
+
+def dataset_dir(dataset: str) -> Path:
+    """Folder of a dataset under DATASETS_DIR"""
+    return DATASETS_DIR / dataset
+
+
+def table_key(filename: str, dataset: str = None) -> str:
+    """Dataset-qualified table name used as the cache key ("<dataset>/<file>")"""
+    return f"{dataset}/{filename}" if dataset else filename
+
+
+def dataset_of(table: str) -> str:
+    """Dataset part of a table key ("" for the default data folder)"""
+    return table.rpartition('/')[0]
+
+
+def estimate_nbytes(obj, _seen: set = None) -> int:
+    """Approximate memory held by a cached value (frames, arrays and the objects containing them)"""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = obj.memory_usage(index=True, deep=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_nbytes(k, seen) + estimate_nbytes(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_nbytes(v, seen) for v in obj)
+    if hasattr(obj, '__dict__'):
+        return sys.getsizeof(obj) + estimate_nbytes(vars(obj), seen)
+    return sys.getsizeof(obj)
+
+
+def _freeze(value):
+    """Hashable form of a cache argument (dicts keep their order, which shapes the result)"""
+    if isinstance(value, dict):
+        return ('dict', tuple((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, set):
+        return ('set', tuple(sorted(value)))
+    return value
+
+
+class DatasetCache:
+    """LRU cache of per-dataset values under a total memory budget
+
+    Use as a decorator (directly or through ``tracked_cache``) on functions
+    whose first two arguments are a table key and its version. Entries are
+    grouped by the dataset of the table key; using any entry marks it and its
+    dataset as most recently used. When the estimated total exceeds
+    ``budget_bytes``, whole datasets are evicted oldest first, never the one
+    being stored into; if that one alone is still over budget, its least
+    recently used entries go next. Storing a new version of a table drops the
+    entries of its older versions.
+    """
+
+    def __init__(self, budget_bytes: float):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._datasets = OrderedDict()  # dataset -> OrderedDict(key: (value, nbytes)), least recent first
+        self._loading = {}              # key -> lock held while the value is computed
+        self._nbytes = 0
+        self.evictions = 0
+
+    def __call__(self, fn):
+        name = fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(table: str, version, *args, **kwargs):
+            dataset = dataset_of(table)
+            key = (name, table, version, _freeze(args), _freeze(sorted(kwargs.items())))
+            found, value = self._get(dataset, key)
+            if found:
+                return value
+            with self._lock:
+                loading = self._loading.setdefault(key, threading.Lock())
+            # One session computes a missing value; others wait for it instead of loading it again
+            try:
+                with loading:
+                    found, value = self._get(dataset, key)
+                    if not found:
+                        value = fn(table, version, *args, **kwargs)
+                        self._put(dataset, key, value)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            return value
+
+        wrapper.clear = self.clear
+        return wrapper
+
+    def _get(self, dataset: str, key: tuple):
+        with self._lock:
+            entries = self._datasets.get(dataset)
+            if entries is None or key not in entries:
+                return False, None
+            entries.move_to_end(key)
+            self._datasets.move_to_end(dataset)
+            return True, entries[key][0]
+
+    def previous(self, fn, table: str, *args, **kwargs):
+        """Resident value of ``fn`` for ``table`` and these arguments at any version, or None
+
+        Lets an incrementally maintained value (e.g. an anomaly detector) be
+        carried over to the next version of its table instead of rebuilt.
+        """
+        rest = (_freeze(args), _freeze(sorted(kwargs.items())))
+        with self._lock:
+            for key, (value, _) in self._datasets.get(dataset_of(table), {}).items():
+                if key[:2] == (fn.__name__, table) and key[3:] == rest:
+                    return value
+        return None
+
+    def _put(self, dataset: str, key: tuple, value):
+        nbytes = estimate_nbytes(value)
+        evicted = []
+        with self._lock:
+            entries = self._datasets.setdefault(dataset, OrderedDict())
+            for stale in [k for k in entries if k[:2] == key[:2] and k[2] != key[2]]:
+                self._nbytes -= entries.pop(stale)[1]
+            self._nbytes += nbytes - (entries[key][1] if key in entries else 0)
+            entries[key] = (value, nbytes)
+            self._datasets.move_to_end(dataset)
+            while self._nbytes > self.budget_bytes and len(self._datasets) > 1:
+                oldest, values = self._datasets.popitem(last=False)
+                self._nbytes -= sum(n for _, n in values.values())
+                evicted.append(oldest)
+            while self._nbytes > self.budget_bytes and len(entries) > 1:
+                oldest = next(iter(entries))
+                if oldest == key:
+                    break
+                self._nbytes -= entries.pop(oldest)[1]
+            self.evictions += len(evicted)
+        telemetry.record_dataset_cache(self.resident(), evicted)
+
+    def clear(self):
+        with self._lock:
+            self._datasets.clear()
+            self._nbytes = 0
+
+    def resident(self) -> list:
+        """``(dataset, entries, bytes)`` per resident dataset, most recently used first"""
+        with self._lock:
+            return [(dataset, len(entries), sum(n for _, n in entries.values()))
+                    for dataset, entries in reversed(self._datasets.items())]
+
+    def resident_frame(self) -> pd.DataFrame:
+        rows = [(dataset or "既定", entries, nbytes / 1024 ** 2) for dataset, entries, nbytes in self.resident()]
+        return pd.DataFrame(rows, columns=['データセット', 'エントリ', 'メモリ(MB)'])
+
+
+DATASET_CACHE = DatasetCache(CACHE_BUDGET_MB * 1024 ** 2)
+
+
+def _select_dataset(widget_key: str, state_key: str):
+    _sync(widget_key, state_key)
+    # Custom dates and cross-filter values of the previous suite may not exist in the new one
+    for key in ('custom_start', 'custom_end', 'cross_filter'):
+        st.session_state.pop(key, None)
+
+
+def dataset_selector() -> str:
+    """Render the sidebar dataset (report suite) selector when several datasets exist; call before loading data"""
+    names = list_datasets()
+    if not names:
+        return None
+
+    st.session_state.setdefault(DATASET_KEY, current_dataset())
+    if st.session_state[DATASET_KEY] not in names:
+        st.session_state[DATASET_KEY] = names[0]
+    dataset = st.sidebar.selectbox("データセット", names, **{**_bind(DATASET_KEY), 'on_change': _select_dataset})
+
+    resident = DATASET_CACHE.resident()
+    used = sum(nbytes for _, _, nbytes in resident) / 1024 ** 2
+    budget = DATASET_CACHE.budget_bytes / 1024 ** 2
+    with st.sidebar.expander(f"キャッシュ: {len(resident)} 件 / {used:,.1f} MB（上限 {budget:,.0f} MB）"):
+        st.dataframe(DATASET_CACHE.resident_frame(), hide_index=True, width='stretch',
+                     column_config={'メモリ(MB)': st.column_config.NumberColumn(format="%.1f")})
+        st.caption(f"追い出し: {DATASET_CACHE.evictions:,} 回")
+    return dataset
@@ -0,0 +1,268 @@
+"""
+Chunked CSV / XLSX export for Adobe Analytics Dashboard
+
+Detail tables are encoded ``chunk_rows`` rows at a time straight from the
+(cached) frame into a temporary file, so the peak extra memory of an export
+is one formatted chunk, not a formatted copy of the whole table. XLSX is
+written as a minimal SpreadsheetML package whose worksheet XML is streamed
+into the zip entry, without an Excel library.
+
+When the dashboard is served through server.py, exports are registered
+under a token and streamed from the temporary file by an HTTP route
+(export_routes), so the finished file is never held in server memory.
+"""
+import codecs
+import io
+import secrets
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 5_000
+# Bytes read from the temporary file per streamed response chunk
+STREAM_CHUNK = 1024 * 1024
+# Registered exports kept for the streaming route (oldest are dropped first)
+MAX_PENDING = 256
+PENDING_TTL = 30 * 60
+EXPORT_ROUTE = "/api/export"
+
+MIME_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+_EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+_ILLEGAL_XML_CHARS = r'[\x00-\x08\x0b\x0c\x0e-\x1f]'
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+# Style 0 is the default, style 1 shows serial dates as YYYY/MM/DD
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy/mm/dd"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_HEAD = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+               '<sheetViews><sheetView workbookViewId="0">'
+               '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+               '</sheetView></sheetViews><sheetData>')
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def _chunks(df: pd.DataFrame, chunk_rows: int):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def write_csv(df: pd.DataFrame, f, chunk_rows: int = CHUNK_ROWS):
+    """Write ``df`` as UTF-8 CSV (with BOM, so Excel reads Japanese headers) to binary file ``f``"""
+    f.write(codecs.BOM_UTF8)
+    f.write(df.iloc[0:0].to_csv(index=False).encode('utf-8'))
+    for chunk in _chunks(df, chunk_rows):
+        f.write(chunk.to_csv(index=False, header=False, date_format='%Y-%m-%d').encode('utf-8'))
+
+
+def _inline_strings(values: pd.Series) -> pd.Series:
+    text = values.astype(str).str.replace(_ILLEGAL_XML_CHARS, '', regex=True)
+    text = text.str.replace('&', '&amp;', regex=False).str.replace('<', '&lt;', regex=False) \
+        .str.replace('>', '&gt;', regex=False)
+    return '<c t="inlineStr"><is><t xml:space="preserve">' + text + '</t></is></c>'
+
+
+def _xlsx_cells(values: pd.Series) -> pd.Series:
+    """One ``<c>`` element per value; missing values become empty cells"""
+    missing = values.isna().to_numpy()
+    if pd.api.types.is_bool_dtype(values):
+        cells = '<c t="b"><v>' + values.astype('Int8').astype(str) + '</v></c>'
+    elif pd.api.types.is_integer_dtype(values):
+        cells = '<c><v>' + values.astype(str) + '</v></c>'
+    elif pd.api.types.is_numeric_dtype(values):
+        numbers = values.to_numpy(dtype=float, na_value=np.nan)
+        missing = ~np.isfinite(numbers)
+        cells = '<c><v>' + pd.Series(numbers, index=values.index).astype(str) + '</v></c>'
+    elif pd.api.types.is_datetime64_any_dtype(values):
+        serial = (values.dt.tz_localize(None) if values.dt.tz is not None else values) - _EXCEL_EPOCH
+        cells = '<c s="1"><v>' + (serial / pd.Timedelta(days=1)).astype(str) + '</v></c>'
+    else:
+        cells = _inline_strings(values)
+    return cells.where(~missing, '<c/>')
+
+
+def write_xlsx(df: pd.DataFrame, f, chunk_rows: int = CHUNK_ROWS, sheet_name: str = "Sheet1"):
+    """Write ``df`` as a single-sheet XLSX workbook to binary file ``f``"""
+    with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _ROOT_RELS)
+        zf.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name[:31], {'"': '&quot;'})))
+        zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        zf.writestr('xl/styles.xml', _STYLES)
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(_SHEET_HEAD.encode('utf-8'))
+            header = _inline_strings(pd.Series([str(c) for c in df.columns], dtype=object))
+            sheet.write(('<row>' + ''.join(header) + '</row>').encode('utf-8'))
+            for chunk in _chunks(df, chunk_rows):
+                rows = np.full(len(chunk), '<row>', dtype=object)
+                for column in range(chunk.shape[1]):
+                    rows += _xlsx_cells(chunk.iloc[:, column]).to_numpy(dtype=object)
+                sheet.write((''.join(rows + '</row>')).encode('utf-8'))
+            sheet.write(_SHEET_TAIL.encode('utf-8'))
+
+
+WRITERS = {
+    'csv': write_csv,
+    'xlsx': write_xlsx,
+}
+
+
+def _encode(df: pd.DataFrame, fmt: str, f, chunk_rows: int):
+    writer = io.BufferedWriter(f, buffer_size=STREAM_CHUNK)
+    WRITERS[fmt](df, writer, chunk_rows)
+    writer.flush()
+    writer.detach()
+
+
+def export_bytes(df: pd.DataFrame, fmt: str, chunk_rows: int = CHUNK_ROWS) -> bytes:
+    """Encode ``df`` in ``fmt`` through a temporary file (closed before returning) and return the file's bytes"""
+    with tempfile.TemporaryFile(buffering=0) as f:
+        _encode(df, fmt, f, chunk_rows)
+        f.seek(0)
+        return f.read()
+
+
+def export_file(df: pd.DataFrame, fmt: str, chunk_rows: int = CHUNK_ROWS) -> io.RawIOBase:
+    """Encode ``df`` in ``fmt`` into an anonymous temporary file and return it rewound
+
+    The caller owns the file and must close it.
+    """
+    f = tempfile.TemporaryFile(buffering=0)
+    try:
+        _encode(df, fmt, f, chunk_rows)
+        f.seek(0)
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+
+# ============================================================
+# Streaming route (server.py)
+# ============================================================
+_lock = threading.Lock()
+_pending = OrderedDict()  # token -> (slot, df, fmt, file name, registered at)
+_slots = {}               # (session, key, fmt) -> token
+_streaming = False
+
+
+def streaming_enabled() -> bool:
+    """Whether export_routes() is mounted in this process (the app runs through server.py)"""
+    return _streaming
+
+
+def register_export(slot: tuple, df: pd.DataFrame, fmt: str, file_name: str) -> str:
+    """Register ``df`` for download and return its URL path
+
+    ``slot`` identifies the button (session, key, format): while the same frame
+    is registered again on later reruns the URL stays the same, a new frame
+    replaces the previous registration of the slot.
+    """
+    now = time.monotonic()
+    with _lock:
+        token = _slots.get(slot)
+        entry = _pending.get(token)
+        if entry is None or entry[1] is not df or entry[3] != file_name:
+            _pending.pop(token, None)
+            token = secrets.token_urlsafe(16)
+            _slots[slot] = token
+        _pending[token] = (slot, df, fmt, file_name, now)
+        _pending.move_to_end(token)
+        while _pending and (len(_pending) > MAX_PENDING or now - next(iter(_pending.values()))[4] > PENDING_TTL):
+            _, (old_slot, *_) = _pending.popitem(last=False)
+            _slots.pop(old_slot, None)
+    return f"{EXPORT_ROUTE}/{token}"
+
+
+def _read_chunks(f):
+    try:
+        while chunk := f.read(STREAM_CHUNK):
+            yield chunk
+    finally:
+        f.close()
+
+
+def export_routes() -> list:
+    """Starlette routes that stream registered exports; pass to ``st.App(routes=...)``"""
+    global _streaming
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import PlainTextResponse, StreamingResponse
+    from starlette.routing import Route
+
+    async def download(request):
+        with _lock:
+            entry = _pending.get(request.path_params['token'])
+        if entry is None:
+            return PlainTextResponse("ダウンロードの有効期限が切れました。ページを再読み込みしてください。", status_code=404)
+        _, df, fmt, file_name, _ = entry
+        f = await run_in_threadpool(export_file, df, fmt)
+        size = f.seek(0, io.SEEK_END)
+        f.seek(0)
+        fallback = file_name.encode('ascii', 'replace').decode().replace('"', '_')
+        disposition = f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(file_name)}"
+        return StreamingResponse(_read_chunks(f), media_type=MIME_TYPES[fmt],
+                                 headers={'Content-Disposition': disposition, 'Content-Length': str(size)})
+
+    _streaming = True
+    return [Route(EXPORT_ROUTE + "/{token}", download)]
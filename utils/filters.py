@@ -0,0 +1,76 @@
+"""
+Shared filter widgets for Adobe Analytics Dashboard
+"""
+from datetime import timedelta
+
+import streamlit as st
+
+from .resample import GRANULARITIES
+
+DATE_PRESETS = ["過去7日", "過去30日", "過去90日", "カスタム"]
+COMPARISON_TYPES = ["前週", "前日", "前月", "前年同期", "過去4期間平均"]
+
+# Durable session-state keys shared by every page. Widget keys are cleaned up
+# by Streamlit when switching pages, so each widget copies its value here.
+STATE_DEFAULTS = {
+    'date_preset': DATE_PRESETS[0],
+    'comparison_type': COMPARISON_TYPES[0],
+    'custom_start': None,
+    'custom_end': None,
+}
+
+
+def _sync(widget_key: str, state_key: str):
+    st.session_state[state_key] = st.session_state[widget_key]
+
+
+def _bind(state_key: str) -> dict:
+    """Seed a widget from the durable state and copy changes back on edit"""
+    widget_key = f"_{state_key}"
+    st.session_state[widget_key] = st.session_state[state_key]
+    return dict(key=widget_key, on_change=_sync, args=(widget_key, state_key))
+
+
+def date_range_selector(min_date, max_date, show_comparison: bool = True) -> tuple:
+    """Render the shared period/comparison selector and return (start_date, end_date, comparison_type)"""
+    for key, value in STATE_DEFAULTS.items():
+        st.session_state.setdefault(key, value)
+    if st.session_state['custom_start'] is None:
+        st.session_state['custom_start'] = min_date.date()
+    if st.session_state['custom_end'] is None:
+        st.session_state['custom_end'] = max_date.date()
+
+    st.sidebar.subheader("期間選択")
+
+    date_option = st.sidebar.radio("プリセット", DATE_PRESETS, horizontal=True, **_bind('date_preset'))
+
+    if date_option == "過去7日":
+        start_date = max_date - timedelta(days=6)
+        end_date = max_date
+    elif date_option == "過去30日":
+        start_date = max_date - timedelta(days=29)
+        end_date = max_date
+    elif date_option == "過去90日":
+        start_date = min_date
+        end_date = max_date
+    else:
+        col1, col2 = st.sidebar.columns(2)
+        with col1:
+            start_date = st.date_input("開始日", min_value=min_date, max_value=max_date,
+                                       **_bind('custom_start'))
+        with col2:
+            end_date = st.date_input("終了日", min_value=min_date, max_value=max_date,
+                                     **_bind('custom_end'))
+
+    comparison_type = st.session_state['comparison_type']
+    if show_comparison:
+        comparison_type = st.sidebar.selectbox("比較期間", COMPARISON_TYPES, **_bind('comparison_type'))
+
+    return start_date, end_date, comparison_type
+
+
+def granularity_selector(key: str, hourly: bool = False, default: str = "日別") -> str:
+    """Render a 集計単位 radio and return the granularity ('hour', 'day', 'week', 'month')"""
+    options = [label for label, freq in GRANULARITIES.items() if hourly or freq != "hour"]
+    label = st.radio("集計単位", options, index=options.index(default), horizontal=True, key=key)
+    return GRANULARITIES[label]
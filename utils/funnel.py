@@ -0,0 +1,52 @@
+"""
+Funnel utilities for Adobe Analytics Dashboard
+"""
+import numpy as np
+import pandas as pd
+
+# Optional segment columns a funnel table may carry -> display label
+FUNNEL_SEGMENTS = {
+    'device': 'デバイス',
+    'referrer_type': '流入元タイプ',
+    'region': '地域',
+}
+
+
+def available_segments(df: pd.DataFrame) -> dict:
+    """Segment dimensions present in a funnel table"""
+    return {col: label for col, label in FUNNEL_SEGMENTS.items() if col in df.columns}
+
+
+def compute_funnel(df: pd.DataFrame, segment: str = None, step_col: str = 'step_number',
+                   name_col: str = 'step_name', value_col: str = 'users') -> pd.DataFrame:
+    """Aggregate an N-step funnel (optionally per segment) and add conversion rates
+
+    Step-to-step and from-start rates for every segment are computed in one
+    vectorized pass over the aggregated rows, so the cost does not depend on
+    the number of steps or segments.
+    """
+    keys = [segment] if segment else []
+    agg = df.groupby(keys + [step_col, name_col], sort=True)[value_col].sum().reset_index()
+
+    values = agg[value_col].to_numpy(dtype=float)
+    n = len(values)
+    if n == 0:
+        return agg.assign(conversion_rate_from_prev=[], conversion_rate_from_start=[])
+
+    # First row of each segment block
+    if segment:
+        codes = pd.factorize(agg[segment])[0]
+        is_first = np.r_[True, codes[1:] != codes[:-1]]
+    else:
+        is_first = np.zeros(n, dtype=bool)
+        is_first[0] = True
+    block_start = np.maximum.accumulate(np.where(is_first, np.arange(n), 0))
+
+    prev = np.r_[np.nan, values[:-1]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        from_prev = np.where(is_first, 1.0, values / prev)
+        from_start = values / values[block_start]
+
+    agg['conversion_rate_from_prev'] = from_prev
+    agg['conversion_rate_from_start'] = from_start
+    return agg
@@ -0,0 +1,129 @@
+"""
+Metric definitions for Adobe Analytics Dashboard
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Metric:
+    """One KPI and how it aggregates across rows
+
+    - agg='sum': sum of ``column``
+    - agg='weighted_mean': mean of ``column`` weighted by ``weight`` (e.g. sessions)
+    - agg='ratio': sum(numerator) / sum(denominator) * scale
+    """
+    label: str
+    agg: str = 'sum'
+    column: str = None
+    weight: str = None
+    numerator: str = None
+    denominator: str = None
+    scale: float = 1.0
+    higher_is_better: bool = True
+
+
+METRICS = {
+    'visitors': Metric('訪問者数', column='visitors'),
+    'new_visitors': Metric('新規訪問者数', column='new_visitors'),
+    'returning_visitors': Metric('リピーター数', column='returning_visitors'),
+    'sessions': Metric('セッション数', column='sessions'),
+    'pageviews': Metric('ページビュー', column='pageviews'),
+    'conversions': Metric('コンバージョン数', column='conversions'),
+    'revenue': Metric('売上', column='revenue'),
+    'quantity': Metric('販売数', column='quantity'),
+    'entrances': Metric('入口数', column='entrances'),
+    'bounce_rate': Metric('直帰率', agg='weighted_mean', column='bounce_rate', weight='sessions',
+                          scale=100, higher_is_better=False),
+    'avg_session_duration': Metric('平均セッション時間', agg='weighted_mean',
+                                   column='avg_session_duration', weight='sessions'),
+    'pages_per_session': Metric('平均閲覧ページ数', agg='ratio', numerator='pageviews',
+                                denominator='sessions'),
+    'cvr': Metric('CVR', agg='ratio', numerator='conversions', denominator='sessions', scale=100),
+    'avg_order_value': Metric('平均注文額', agg='ratio', numerator='revenue', denominator='conversions'),
+    'exit_rate': Metric('離脱率', agg='weighted_mean', column='exit_rate', weight='pageviews',
+                        scale=100, higher_is_better=False),
+    'avg_time_on_page': Metric('平均滞在時間', agg='weighted_mean', column='avg_time_on_page',
+                               weight='pageviews'),
+}
+
+
+def _weighted_column(metric: Metric) -> str:
+    return f"__{metric.column}_x_{metric.weight}"
+
+
+def metric_inputs(df: pd.DataFrame, names: list) -> pd.DataFrame:
+    """Row-level columns whose sums are needed to compute ``names``
+
+    Sum metrics and ratio numerators/denominators are passed through;
+    weighted means add a ``column * weight`` product column. Summing this
+    frame over any set of rows and passing it to derive_metrics() gives the
+    metrics for those rows.
+    """
+    sum_columns = {}
+    products = {}
+    for name in names:
+        metric = METRICS[name]
+        if metric.agg == 'sum':
+            sum_columns[metric.column] = metric.column
+        elif metric.agg == 'ratio':
+            sum_columns[metric.numerator] = metric.numerator
+            sum_columns[metric.denominator] = metric.denominator
+        elif metric.agg == 'weighted_mean':
+            sum_columns[metric.weight] = metric.weight
+            products[_weighted_column(metric)] = (metric.column, metric.weight)
+        else:
+            raise ValueError(f"Unknown aggregation: {metric.agg}")
+
+    base = df[list(sum_columns)]
+    if products:
+        base = base.assign(**{name: df[col] * df[weight] for name, (col, weight) in products.items()})
+    return base
+
+
+def compute_metrics(df: pd.DataFrame, names: list, by=None):
+    """Compute a set of registered metrics, optionally per group, in one pass
+
+    All sums needed by the requested metrics (including ratio numerators and
+    weighted-mean products) are collected first and aggregated with a single
+    groupby, so shared intermediates such as ``sessions`` are summed once.
+    ``by`` may be column names or Series aligned with ``df`` (e.g. period keys).
+    Returns a Series when ``by`` is None, otherwise a DataFrame with one row
+    per group (group keys as columns).
+    """
+    base = metric_inputs(df, names)
+
+    if by is None:
+        sums = base.sum().to_frame().T
+    else:
+        keys = [by] if isinstance(by, (str, pd.Series)) else list(by)
+        sums = base.groupby([df[k] if isinstance(k, str) else k for k in keys], sort=False).sum()
+
+    result = derive_metrics(sums, names)
+
+    if by is None:
+        return result.iloc[0].fillna(0)
+    return result.reset_index()
+
+
+def derive_metrics(sums: pd.DataFrame, names: list) -> pd.DataFrame:
+    """Compute registered metrics from already aggregated sums (e.g. a cached groupby)
+
+    Weighted means need the ``column * weight`` sums produced by
+    compute_metrics, so plain aggregates only support sum and ratio metrics.
+    """
+    result = pd.DataFrame(index=sums.index)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name in names:
+            metric = METRICS[name]
+            if metric.agg == 'sum':
+                values = sums[metric.column]
+            elif metric.agg == 'ratio':
+                values = sums[metric.numerator] / sums[metric.denominator].replace(0, np.nan) * metric.scale
+            else:
+                values = sums[_weighted_column(metric)] / sums[metric.weight].replace(0, np.nan) * metric.scale
+            result[name] = values
+    return result
+
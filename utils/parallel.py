@@ -0,0 +1,64 @@
+"""
+Parallel aggregation utilities for Adobe Analytics Dashboard
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import pandas as pd
+import streamlit as st
+
+from .profiling import profiled
+
+# Below this many input rows the sections run serially: pickling frames to
+# worker processes costs more than the groupbys themselves
+PARALLEL_MIN_ROWS = 200_000
+
+
+def available_cores() -> int:
+    """CPU cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+@st.cache_resource
+def get_worker_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all sessions, one worker per available core
+
+    Workers are spawned rather than forked because the Streamlit server is
+    multi-threaded.
+    """
+    return ProcessPoolExecutor(max_workers=available_cores(),
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+def _input_rows(task: partial) -> int:
+    frames = {id(a): a for a in (*task.args, *task.keywords.values()) if isinstance(a, pd.DataFrame)}
+    return sum(len(df) for df in frames.values())
+
+
+@profiled(kind="aggregate")
+def run_parallel(tasks: dict, min_rows: int = PARALLEL_MIN_ROWS) -> dict:
+    """Run independent aggregations and return their results by name
+
+    ``tasks`` maps a name to a ``functools.partial`` of a module-level
+    function (e.g. ``partial(top_k, df, 'region', 'sessions', 10)``) so it
+    can be sent to a worker process. Everything runs serially when the inputs
+    are small, when there is a single task or a single core, or if the pool
+    is unavailable.
+    """
+    rows = sum(_input_rows(task) for task in tasks.values())
+    if len(tasks) < 2 or rows < min_rows or available_cores() < 2:
+        return {name: task() for name, task in tasks.items()}
+
+    pool = get_worker_pool()
+    try:
+        futures = {name: pool.submit(task) for name, task in tasks.items()}
+        return {name: future.result() for name, future in futures.items()}
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a fresh pool next time
+        get_worker_pool.clear()
+        return {name: task() for name, task in tasks.items()}
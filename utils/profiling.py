@@ -0,0 +1,176 @@
+"""
+Profiling utilities for Adobe Analytics Dashboard
+"""
+import functools
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+from . import telemetry
+from .filters import _bind
+
+# Session-state keys of the opt-in sidebar toggles
+PROFILE_KEY = "perf_debug"
+PROFILE_MEMORY_KEY = "perf_debug_memory"
+
+# Profile of the current script run, or None when profiling is off
+_current = ContextVar("profile", default=None)
+
+
+class Profile:
+    """Timings, allocations and cache hits/misses collected during one script run"""
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.started = time.perf_counter()
+        self.sections = {}  # name -> [kind, calls, seconds, allocated bytes]
+        self.caches = {}    # name -> [calls, misses]
+
+    def add_section(self, name: str, kind: str, seconds: float, allocated: int):
+        entry = self.sections.setdefault(name, [kind, 0, 0.0, 0])
+        entry[1] += 1
+        entry[2] += seconds
+        entry[3] += allocated
+
+    def sections_frame(self) -> pd.DataFrame:
+        rows = [(name, kind, calls, seconds * 1000, allocated / 1024)
+                for name, (kind, calls, seconds, allocated) in self.sections.items()]
+        df = pd.DataFrame(rows, columns=['名前', '種類', '呼出', '時間(ms)', '割当(KB)'])
+        return df.sort_values('時間(ms)', ascending=False, ignore_index=True)
+
+    def caches_frame(self) -> pd.DataFrame:
+        rows = [(name, calls, calls - misses, misses) for name, (calls, misses) in self.caches.items()]
+        df = pd.DataFrame(rows, columns=['キャッシュ', '呼出', 'ヒット', 'ミス'])
+        return df.sort_values('呼出', ascending=False, ignore_index=True)
+
+
+def start_profiling() -> Profile:
+    """Begin a profile for this script run if the sidebar toggle is on (call at the top of a page)"""
+    if not st.session_state.get(PROFILE_KEY, False):
+        _current.set(None)
+        return None
+
+    memory = st.session_state.get(PROFILE_MEMORY_KEY, False)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    profile = Profile(memory=memory)
+    _current.set(profile)
+    return profile
+
+
+@contextmanager
+def profile_section(name: str, kind: str = "section"):
+    """Time (and optionally measure net allocations of) a block; no-op when profiling is off"""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+
+    before = tracemalloc.get_traced_memory()[0] if profile.memory else 0
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        after = tracemalloc.get_traced_memory()[0] if profile.memory else 0
+        profile.add_section(name, kind, time.perf_counter() - started, after - before)
+
+
+def profiled(name: str = None, kind: str = "section"):
+    """Decorator form of profile_section; the disabled path is one context-variable lookup"""
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with profile_section(label, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def tracked_cache(cache=st.cache_data, **options):
+    """Streamlit cache decorator that also counts calls and misses for the profile
+
+    Use in place of ``st.cache_data`` / ``st.cache_resource``. The inner
+    function body only runs on a miss, so counting both sides gives the hit
+    rate without touching Streamlit's cache internals.
+    """
+    def decorator(fn):
+        label = fn.__name__
+
+        @functools.wraps(fn)
+        def on_miss(*args, **kwargs):
+            profile = _current.get()
+            if profile is not None:
+                profile.caches.setdefault(label, [0, 0])[1] += 1
+            result = fn(*args, **kwargs)
+            telemetry.record_cache_call(label, miss=True, stored=result)
+            return result
+
+        cached = cache(**options)(on_miss) if options else cache(on_miss)
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            profile = _current.get()
+            if profile is not None:
+                profile.caches.setdefault(label, [0, 0])[0] += 1
+            telemetry.record_cache_call(label)
+            return cached(*args, **kwargs)
+
+        call.clear = cached.clear
+        return call
+    return decorator
+
+
+def timed_rerun(fn):
+    """Decorator for a page's main function that records each script run's latency for telemetry
+
+    The latency is recorded in ``finally``, so runs ended early by ``st.stop()``,
+    a rerun request or an exception are counted as well.
+    """
+    page = Path(fn.__code__.co_filename).stem
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not telemetry.ENABLED:
+            return fn(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            telemetry.record_rerun(page, time.perf_counter() - started)
+    return wrapper
+
+
+def performance_panel():
+    """Opt-in sidebar panel with this rerun's timings, allocations and cache hits (call at the end of a page)"""
+    for key in (PROFILE_KEY, PROFILE_MEMORY_KEY):
+        st.session_state.setdefault(key, False)
+
+    with st.sidebar.expander("🛠 パフォーマンス計測", expanded=st.session_state[PROFILE_KEY]):
+        st.checkbox("計測を有効にする", **_bind(PROFILE_KEY))
+        st.checkbox("メモリ割り当ても計測（低速）", **_bind(PROFILE_MEMORY_KEY))
+
+        profile = _current.get()
+        if profile is None:
+            st.caption("有効にすると、このページの再実行ごとの処理時間とキャッシュ状況を表示します。")
+            return
+
+        st.caption(f"再実行全体: {(time.perf_counter() - profile.started) * 1000:.0f} ms")
+        st.dataframe(profile.sections_frame(), hide_index=True, width='stretch',
+                     column_config={
+                         '時間(ms)': st.column_config.NumberColumn(format="%.1f"),
+                         '割当(KB)': st.column_config.NumberColumn(format="%.0f"),
+                     })
+        if profile.caches:
+            st.dataframe(profile.caches_frame(), hide_index=True, width='stretch')
@@ -0,0 +1,47 @@
+"""
+Top-N ranking utilities for Adobe Analytics Dashboard
+"""
+import numpy as np
+import pandas as pd
+
+
+def top_rows(df: pd.DataFrame, column: str, k: int = 10, ascending: bool = False) -> pd.DataFrame:
+    """Return the k rows with the largest ``column`` values without sorting the whole frame
+
+    Uses partial selection (np.argpartition, O(n)) and only sorts the k
+    selected rows. ``ascending`` sets the order of the result: ascending=True
+    puts the largest value last, which is what horizontal bar charts expect.
+    ``k=None`` keeps every row (a plain sort by ``column``).
+    """
+    n = len(df)
+    if k is None:
+        k = n
+    if k <= 0 or n == 0:
+        return df.iloc[0:0]
+
+    values = df[column].to_numpy(dtype=float)
+    values = np.where(np.isnan(values), -np.inf, values)
+
+    if k < n:
+        idx = np.argpartition(-values, k - 1)[:k]
+    else:
+        idx = np.arange(n)
+
+    order = np.argsort(values[idx], kind='stable')
+    if not ascending:
+        order = order[::-1]
+    return df.iloc[idx[order]]
+
+
+def top_k(df: pd.DataFrame, by, column: str, k: int = 10, agg: dict = None,
+          ascending: bool = False) -> pd.DataFrame:
+    """Group by ``by``, aggregate, and keep the top k groups by ``column``
+
+    Replaces ``groupby(...).agg(...).sort_values(...).tail(k)``: groups are not
+    sorted by key and only the k winners are sorted by value.
+    """
+    if agg is None:
+        agg = {column: 'sum'}
+    grouped = df.groupby(by, sort=False).agg(agg).reset_index()
+    return top_rows(grouped, column, k, ascending=ascending)
+
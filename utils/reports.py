@@ -0,0 +1,402 @@
+"""
+Batch report export for Adobe Analytics Dashboard
+
+Builds the KPIs, figures and tables of every dashboard page for a period and
+segment with the same data-layer queries and section aggregations as the
+pages, renders the figures of all reports of a batch on one process pool with
+Plotly's static image engine (kaleido), and writes an HTML and/or PDF file
+per report. Without kaleido (or Chrome), HTML reports embed interactive figures
+instead.
+"""
+import base64
+import functools
+import html
+import importlib.util
+import io
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+
+from .charts import (
+    create_line_chart, create_area_chart, create_bar_chart, create_pie_chart, create_funnel_chart,
+    format_number
+)
+from .comparison import CURRENT_PERIOD
+from .data_loader import (
+    load_data, load_filtered, load_sliced, aggregate_by, resample_by, resample_long, resample_metrics,
+    group_quantile, get_comparison_engine
+)
+from .metrics import METRICS, compute_metrics
+from .parallel import available_cores, run_parallel
+from .sections import KPI_METRICS, DEVICE_LABELS, traffic_tasks, conversion_tasks, behavior_tasks
+
+# Dimension -> table whose values list the segments of that dimension
+SEGMENT_TABLES = {
+    'device': "device_metrics.csv",
+    'referrer_type': "referrer_metrics.csv",
+    'referrer': "referrer_metrics.csv",
+    'region': "region_metrics.csv",
+    'page_category': "page_metrics.csv",
+    'product_category': "product_sales.csv",
+}
+
+IMAGE_WIDTH = 1100
+IMAGE_HEIGHT = 500
+# Rows of a detail table drawn on a PDF page
+PDF_TABLE_ROWS = 25
+
+
+@dataclass(frozen=True)
+class ReportSpec:
+    """One report: a period, an optional segment ((dimension, value), ...) and the KPI comparison"""
+    start: pd.Timestamp
+    end: pd.Timestamp
+    filters: tuple = ()
+    comparison: str = "前週"
+    freq: str = 'day'
+
+    @property
+    def segment_label(self) -> str:
+        return " / ".join(f"{dim}={value}" for dim, value in self.filters) or "全体"
+
+    @property
+    def title(self) -> str:
+        return f"Analytics レポート {self.start:%Y/%m/%d} - {self.end:%Y/%m/%d}（{self.segment_label}）"
+
+    @property
+    def slug(self) -> str:
+        segment = "_".join(f"{dim}-{value}" for dim, value in self.filters) or "all"
+        return re.sub(r'[\\/:*?"<>|\s]+', '-', f"{self.start:%Y%m%d}-{self.end:%Y%m%d}_{segment}")
+
+
+def segment_values(dimension: str) -> list:
+    """Distinct values of a segment dimension, for one report per value"""
+    return sorted(load_data(SEGMENT_TABLES[dimension])[dimension].dropna().unique().tolist())
+
+
+# ------------------------------------------------------------
+# Report contents (same queries and section aggregations as the pages)
+# ------------------------------------------------------------
+def _kpi_table(spec: ReportSpec) -> pd.DataFrame:
+    engine = get_comparison_engine("daily_summary.csv", KPI_METRICS)
+    kpi_table = engine.compare(spec.start, spec.end)
+    changes = engine.changes(kpi_table)
+    current = kpi_table.loc[CURRENT_PERIOD].fillna(0)
+    rows = []
+    for name in KPI_METRICS:
+        value = current[name]
+        if name in ('bounce_rate', 'cvr'):
+            text = f"{value:.2f}%"
+        else:
+            text = format_number(value, prefix="¥" if name in ('revenue', 'avg_order_value') else "")
+        change = changes.loc[spec.comparison, name]
+        rows.append({'指標': METRICS[name].label, '値': text,
+                     spec.comparison: "-" if pd.isna(change) else f"{change:+.1f}%"})
+    return pd.DataFrame(rows)
+
+
+def build_report(spec: ReportSpec) -> dict:
+    """KPIs and [{'title', 'figures', 'tables'}] sections of one report"""
+    start, end, freq = spec.start, spec.end, spec.freq
+    filters = dict(spec.filters)
+
+    df_daily = load_filtered("daily_summary.csv", start, end)
+    df_referrer = load_sliced("referrer_metrics.csv", start, end, filters)
+    df_device = load_sliced("device_metrics.csv", start, end, filters)
+    df_region = load_sliced("region_metrics.csv", start, end, filters)
+    df_funnel = load_sliced("conversion_funnel.csv", start, end, filters)
+    df_products = load_sliced("product_sales.csv", start, end, filters)
+    df_pages = load_sliced("page_metrics.csv", start, end, filters)
+    pv_threshold = group_quantile("page_metrics.csv", start, end, 'page_name', 'pageviews', 0.25)
+
+    aggregates = run_parallel({
+        **{f"traffic/{k}": v for k, v in traffic_tasks(df_referrer, df_device, df_region).items()},
+        **{f"conversion/{k}": v for k, v in conversion_tasks(df_funnel, df_products, df_referrer).items()},
+        **{f"behavior/{k}": v for k, v in behavior_tasks(df_pages, pv_threshold).items()},
+    })
+
+    visitors_sessions = resample_long("daily_summary.csv", start, end, freq,
+                                      {'visitors': '訪問者数', 'sessions': 'セッション数'})
+    pageviews = resample_by("daily_summary.csv", start, end, freq, {'pageviews': 'sum'})
+    cv_trend = resample_by("daily_summary.csv", start, end, freq, {
+        'revenue': 'sum',
+        'conversions': 'sum',
+        'sessions': 'sum'
+    }, derive=['cvr'])
+    visitor_trend = resample_long("daily_summary.csv", start, end, freq, {
+        'new_visitors': '新規訪問者',
+        'returning_visitors': 'リピーター'
+    }, var_name='タイプ', value_name='訪問者数')
+    engagement = resample_metrics("daily_summary.csv", start, end, freq, ['avg_session_duration', 'bounce_rate'])
+    visitor_totals = compute_metrics(df_daily, ['new_visitors', 'returning_visitors'])
+    device = aggregates['traffic/device'].assign(device=lambda d: d['device'].map(DEVICE_LABELS))
+    ref_cv = aggregates['conversion/ref_cv']
+
+    ref_detail = aggregate_by("referrer_metrics.csv", start, end, ('referrer', 'referrer_type'), {
+        'sessions': 'sum',
+        'visitors': 'sum',
+        'conversions': 'sum',
+        'revenue': 'sum'
+    }, filters=filters, derive=['cvr']).sort_values('sessions', ascending=False)
+    ref_detail.columns = ['流入元', 'タイプ', 'セッション', '訪問者', 'CV', '売上', 'CVR(%)']
+    prod_detail = aggregates['conversion/prod_detail'].copy()
+    prod_detail.columns = ['商品名', 'カテゴリ', '単価', '販売数', '売上']
+    page_detail = aggregate_by("page_metrics.csv", start, end, ('page_name', 'page_category'), {
+        'pageviews': 'sum',
+        'unique_pageviews': 'sum',
+        'avg_time_on_page': 'mean',
+        'exit_rate_pct': 'mean',
+        'entrances': 'sum'
+    }, filters=filters).sort_values('pageviews', ascending=False)
+    page_detail.columns = ['ページ名', 'カテゴリ', 'PV', 'UU', '平均滞在時間(秒)', '離脱率(%)', '入口数']
+    funnel = aggregates['conversion/funnel'][
+        ['step_name', 'users', 'conversion_rate_from_prev', 'conversion_rate_from_start']]
+    funnel = funnel.assign(conversion_rate_from_prev=funnel['conversion_rate_from_prev'] * 100,
+                           conversion_rate_from_start=funnel['conversion_rate_from_start'] * 100)
+    funnel.columns = ['ステップ', 'ユーザー数', '前ステップからの転換率(%)', '開始からの転換率(%)']
+
+    sections = [
+        {'title': "KPI サマリー", 'figures': [
+            create_line_chart(visitors_sessions, x='date', y='値', color='指標', title="訪問者数・セッション数 推移"),
+            create_area_chart(df_daily, x='date', y='revenue', title="売上 推移"),
+        ], 'tables': []},
+        {'title': "トラフィック分析", 'figures': [
+            create_area_chart(pageviews, x='date', y='pageviews', title="ページビュー数"),
+            create_pie_chart(aggregates['traffic/ref_type'], values='sessions', names='referrer_type',
+                             title="流入元タイプ別セッション"),
+            create_bar_chart(aggregates['traffic/ref_top'], x='referrer', y='sessions', title="流入元別セッション数 TOP10"),
+            create_pie_chart(device, values='sessions', names='device', title="デバイス別セッション割合"),
+            create_bar_chart(device, x='device', y='cvr', title="デバイス別CVR(%)"),
+            create_bar_chart(aggregates['traffic/region_sessions'], x='region', y='sessions',
+                             title="地域別セッション数 TOP10", orientation='h'),
+            create_bar_chart(aggregates['traffic/region_revenue'], x='region', y='revenue',
+                             title="地域別売上 TOP10", orientation='h'),
+        ], 'tables': [("流入元詳細", ref_detail)]},
+        {'title': "コンバージョン分析", 'figures': [
+            create_funnel_chart(aggregates['conversion/funnel'], x='users', y='step_name', title="購入ファネル"),
+            create_area_chart(cv_trend, x='date', y='revenue', title="売上推移"),
+            create_line_chart(cv_trend, x='date', y='cvr', title="CVR推移(%)"),
+            create_pie_chart(aggregates['conversion/prod_cat'], values='revenue', names='product_category',
+                             title="カテゴリ別売上構成"),
+            create_bar_chart(aggregates['conversion/prod_top'], x='product_name', y='revenue',
+                             title="商品別売上 TOP7", orientation='h'),
+            create_bar_chart(ref_cv.sort_values('conversions', ascending=True), x='referrer_type', y='conversions',
+                             title="流入元タイプ別CV数", orientation='h'),
+            create_bar_chart(ref_cv.sort_values('cvr', ascending=True), x='referrer_type', y='cvr',
+                             title="流入元タイプ別CVR(%)", orientation='h'),
+        ], 'tables': [("ファネル詳細", funnel), ("商品別詳細", prod_detail)]},
+        {'title': "ユーザー行動分析", 'figures': [
+            create_pie_chart(pd.DataFrame({
+                'タイプ': ['新規訪問者', 'リピーター'],
+                '訪問者数': [visitor_totals['new_visitors'], visitor_totals['returning_visitors']]
+            }), values='訪問者数', names='タイプ', title="訪問者タイプ構成"),
+            create_area_chart(visitor_trend, x='date', y='訪問者数', color='タイプ', title="訪問者タイプ推移"),
+            create_line_chart(engagement, x='date', y='avg_session_duration', title="平均セッション時間(秒)"),
+            create_line_chart(engagement, x='date', y='bounce_rate', title="直帰率(%)"),
+            create_bar_chart(aggregates['behavior/page_pv'], x='page_name', y='pageviews',
+                             title="ページ別PV数 TOP10", orientation='h'),
+            create_pie_chart(aggregates['behavior/page_cat'], values='pageviews', names='page_category',
+                             title="カテゴリ別PV構成"),
+            create_bar_chart(aggregates['behavior/exit'], x='page_name', y='exit_rate_pct',
+                             title="離脱率の高いページ TOP10", orientation='h'),
+            create_bar_chart(aggregates['behavior/time'], x='page_name', y='avg_time_on_page',
+                             title="滞在時間の長いページ TOP10 (秒)", orientation='h'),
+            create_bar_chart(aggregates['behavior/entry'], x='page_name', y='entrances',
+                             title="入口ページ TOP10", orientation='h'),
+        ], 'tables': [("ページ別詳細データ", page_detail)]},
+    ]
+    return {'spec': spec, 'kpis': _kpi_table(spec), 'sections': sections}
+
+
+# ------------------------------------------------------------
+# Static image rendering on a process pool
+# ------------------------------------------------------------
+@functools.cache
+def static_image_available() -> bool:
+    """True if Plotly's static image engine (kaleido, and the Chrome it drives) can render"""
+    if importlib.util.find_spec('kaleido') is None:
+        return False
+    try:
+        pio.to_image(go.Figure(), format='png', width=10, height=10)
+    except (RuntimeError, ValueError):
+        return False
+    return True
+
+
+def _start_engine():
+    """Keep one headless browser per worker where the engine supports it (kaleido >= 1.1)
+
+    Only called after static_image_available(): the persistent server waits
+    forever instead of raising when Chrome is missing.
+    """
+    import kaleido
+    start = getattr(kaleido, 'start_sync_server', None)
+    if start is not None:
+        start(silence_warnings=True)
+
+
+def _to_image(fig_json: str, fmt: str = 'png', width: int = IMAGE_WIDTH, height: int = IMAGE_HEIGHT,
+              scale: float = 1.0) -> bytes:
+    return pio.to_image(pio.from_json(fig_json), format=fmt, width=width, height=height, scale=scale)
+
+
+def render_images(figures: list, fmt: str = 'png', workers: int = None, scale: float = 1.0) -> list:
+    """Static images of ``figures`` (in order), rendered in parallel on worker processes
+
+    Figures are sent as JSON; each worker starts the engine once and renders
+    a share of them. Runs serially with a single worker.
+    """
+    render = partial(_to_image, fmt=fmt, scale=scale)
+    payloads = [fig.to_json() for fig in figures]
+    workers = min(workers or available_cores(), len(payloads))
+    if workers < 2:
+        _start_engine()
+        return [render(payload) for payload in payloads]
+    # Spawned rather than forked: the engine runs a browser subprocess and the caller may be threaded
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_start_engine) as pool:
+        return list(pool.map(render, payloads, chunksize=max(1, len(payloads) // (workers * 4))))
+
+
+# ------------------------------------------------------------
+# HTML / PDF assembly
+# ------------------------------------------------------------
+def _display_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Numbers with thousands separators and dates as YYYY/MM/DD, for HTML and PDF tables"""
+    out = df.copy()
+    for column in out.columns:
+        values = out[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            out[column] = values.dt.strftime('%Y/%m/%d')
+        elif pd.api.types.is_integer_dtype(values):
+            out[column] = values.map('{:,}'.format)
+        elif pd.api.types.is_float_dtype(values):
+            out[column] = values.map('{:,.2f}'.format)
+    return out
+
+
+def table_figure(title: str, df: pd.DataFrame, max_rows: int = PDF_TABLE_ROWS) -> go.Figure:
+    """A table drawn as a figure, so PDF pages are rendered by the same engine as the charts"""
+    shown = _display_frame(df.head(max_rows))
+    if len(df) > max_rows:
+        title = f"{title}（上位 {max_rows} / {len(df)} 件）"
+    fig = go.Figure(go.Table(
+        header=dict(values=list(shown.columns), fill_color='#1f77b4', font=dict(color='white'), align='left'),
+        cells=dict(values=[shown[column] for column in shown.columns], align='left'),
+    ))
+    fig.update_layout(title=title, margin=dict(l=20, r=20, t=60, b=20))
+    return fig
+
+
+def report_figures(report: dict, pdf: bool = False) -> list:
+    """Figures to render for a report, in page order (PDF adds the KPI and detail tables)"""
+    figures = []
+    if pdf:
+        figures.append(table_figure(f"{report['spec'].title} — KPI", report['kpis']))
+    for section in report['sections']:
+        figures.extend(section['figures'])
+        if pdf:
+            figures.extend(table_figure(title, df) for title, df in section['tables'])
+    return figures
+
+
+_STYLE = """
+body { font-family: sans-serif; margin: 2rem; color: #262730; }
+h1 { font-size: 1.5rem; } h2 { border-bottom: 1px solid #ddd; padding-bottom: .3rem; margin-top: 2rem; }
+.figures { display: grid; grid-template-columns: repeat(auto-fit, minmax(480px, 1fr)); gap: 1rem; }
+.figures img { width: 100%; }
+table { border-collapse: collapse; font-size: .85rem; margin: .5rem 0 1rem; }
+th, td { border: 1px solid #ddd; padding: .25rem .5rem; text-align: right; }
+th { background: #f0f2f6; }
+.note { color: #808495; font-size: .85rem; }
+"""
+
+
+def _html_table(df: pd.DataFrame) -> str:
+    return _display_frame(df).to_html(index=False, border=0, escape=True)
+
+
+def to_html(report: dict, images: list = None, plotlyjs: str = "plotly.min.js") -> str:
+    """HTML page of a report: PNG images (in report_figures order) or, without images,
+    interactive figures that load plotly.js from ``plotlyjs``"""
+    spec = report['spec']
+    figures = iter(images) if images is not None else None
+    parts = [f"<h1>{html.escape(spec.title)}</h1>",
+             f"<p class=\"note\">比較: {html.escape(spec.comparison)}。セグメントは該当する列を持つテーブル"
+             "（流入元・デバイス・地域・ページ・商品・ファネル）にのみ適用されます。</p>",
+             _html_table(report['kpis'])]
+    for section in report['sections']:
+        parts.append(f"<h2>{html.escape(section['title'])}</h2><div class=\"figures\">")
+        for fig in section['figures']:
+            if figures is not None:
+                data = base64.b64encode(next(figures)).decode('ascii')
+                parts.append(f"<img src=\"data:image/png;base64,{data}\">")
+            else:
+                parts.append(f"<div>{fig.to_html(full_html=False, include_plotlyjs=False)}</div>")
+        parts.append("</div>")
+        for title, df in section['tables']:
+            parts.append(f"<h3>{html.escape(title)}</h3>{_html_table(df)}")
+    script = "" if images is not None else f"<script src=\"{html.escape(plotlyjs)}\"></script>"
+    return (f"<!DOCTYPE html><html lang=\"ja\"><head><meta charset=\"utf-8\">"
+            f"<title>{html.escape(spec.title)}</title>{script}<style>{_STYLE}</style></head>"
+            f"<body>{''.join(parts)}</body></html>")
+
+
+def to_pdf(images: list) -> bytes:
+    """Multi-page PDF with one rendered PNG (report_figures(pdf=True) order) per page"""
+    from PIL import Image
+
+    pages = [Image.open(io.BytesIO(image)).convert('RGB') for image in images]
+    buffer = io.BytesIO()
+    pages[0].save(buffer, format='PDF', save_all=True, append_images=pages[1:], resolution=100)
+    return buffer.getvalue()
+
+
+def export_reports(specs: list, output_dir, formats=('html',), workers: int = None) -> list:
+    """Build every report, render all of their figures in one pool, and write the files
+
+    Returns the written paths. PDF output requires kaleido and Chrome; HTML falls back
+    to interactive figures (with plotly.min.js written once next to them).
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    static = static_image_available()
+    if 'pdf' in formats and not static:
+        raise RuntimeError("PDF 出力には kaleido と Chrome が必要です（pip install kaleido && kaleido_get_chrome）")
+
+    reports = [build_report(spec) for spec in specs]
+
+    # One batch for all reports keeps every worker busy until the end
+    batches = []
+    if static:
+        for report in reports:
+            if 'html' in formats:
+                batches.append((report, 'html', report_figures(report)))
+            if 'pdf' in formats:
+                batches.append((report, 'pdf', report_figures(report, pdf=True)))
+        images = render_images([fig for _, _, figures in batches for fig in figures], workers=workers)
+    else:
+        batches = [(report, 'html', None) for report in reports]
+        (output_dir / "plotly.min.js").write_text(get_plotlyjs(), encoding='utf-8')
+
+    written, offset = [], 0
+    for report, fmt, figures in batches:
+        report_images = None
+        if figures is not None:
+            report_images = images[offset:offset + len(figures)]
+            offset += len(figures)
+        path = output_dir / f"{report['spec'].slug}.{fmt}"
+        if fmt == 'html':
+            path.write_text(to_html(report, report_images), encoding='utf-8')
+        else:
+            path.write_bytes(to_pdf(report_images))
+        written.append(path)
+    return written
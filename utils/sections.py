@@ -0,0 +1,106 @@
+"""
+Section aggregations shared by the dashboard pages and the batch reports
+
+Each function returns ``{name: functools.partial}`` tasks for ``run_parallel``,
+so a page and a report for the same period compute identical frames.
+"""
+from functools import partial
+
+import pandas as pd
+
+from .funnel import compute_funnel
+from .metrics import compute_metrics
+from .ranking import top_k, top_rows
+
+# KPI cards of the summary page, in display order
+KPI_METRICS = [
+    'visitors', 'sessions', 'pageviews', 'bounce_rate',
+    'conversions', 'cvr', 'revenue', 'avg_order_value',
+]
+
+DEVICE_LABELS = {
+    'desktop': 'デスクトップ',
+    'mobile': 'モバイル',
+    'tablet': 'タブレット'
+}
+
+
+def traffic_tasks(df_referrer: pd.DataFrame, df_device: pd.DataFrame, df_region: pd.DataFrame) -> dict:
+    return {
+        'ref_type': partial(top_k, df_referrer, 'referrer_type', 'sessions', None, agg={
+            'sessions': 'sum',
+            'visitors': 'sum'
+        }),
+        'ref_top': partial(top_k, df_referrer, 'referrer', 'sessions', 10, agg={
+            'sessions': 'sum',
+            'conversions': 'sum',
+            'revenue': 'sum'
+        }),
+        'device': partial(compute_metrics, df_device, ['sessions', 'visitors', 'conversions', 'revenue', 'cvr'],
+                          by='device'),
+        'region_sessions': partial(top_k, df_region, 'region', 'sessions', 10, agg={
+            'sessions': 'sum'
+        }, ascending=True),
+        'region_revenue': partial(top_k, df_region, 'region', 'revenue', 10, agg={
+            'sessions': 'sum',
+            'conversions': 'sum',
+            'revenue': 'sum'
+        }, ascending=True),
+    }
+
+
+def conversion_tasks(df_funnel: pd.DataFrame, df_products: pd.DataFrame, df_referrer: pd.DataFrame,
+                     funnel_segment: str = None) -> dict:
+    return {
+        'funnel': partial(compute_funnel, df_funnel, segment=funnel_segment),
+        'prod_cat': partial(top_k, df_products, 'product_category', 'revenue', None, agg={
+            'revenue': 'sum',
+            'quantity': 'sum'
+        }),
+        'prod_top': partial(top_k, df_products, 'product_name', 'revenue', 7, agg={
+            'revenue': 'sum',
+            'quantity': 'sum'
+        }, ascending=True),
+        'prod_detail': partial(top_k, df_products, ['product_name', 'product_category', 'unit_price'],
+                               'revenue', None, agg={
+            'quantity': 'sum',
+            'revenue': 'sum'
+        }),
+        'ref_cv': partial(compute_metrics, df_referrer, ['conversions', 'revenue', 'sessions', 'cvr'],
+                          by='referrer_type'),
+        'ref_detail': partial(compute_metrics, df_referrer, ['sessions', 'conversions', 'revenue', 'cvr'],
+                              by='referrer'),
+    }
+
+
+def category_totals(df: pd.DataFrame, by: str, column: str) -> pd.DataFrame:
+    """Sum of ``column`` per ``by`` value, largest first"""
+    return df.groupby(by).agg({column: 'sum'}).reset_index().sort_values(column, ascending=False)
+
+
+def top_pages_by(df_pages: pd.DataFrame, column: str, pv_threshold: float, k: int = 10) -> pd.DataFrame:
+    """Pages with the highest mean ``column``, ignoring pages with at most ``pv_threshold`` PV
+
+    Sorted ascending for horizontal bar charts.
+    """
+    df = df_pages.groupby('page_name').agg({
+        column: 'mean',
+        'pageviews': 'sum'
+    }).reset_index()
+    df = df[df['pageviews'] > pv_threshold]  # Filter low traffic pages
+    return top_rows(df, column, k, ascending=True)
+
+
+def behavior_tasks(df_pages: pd.DataFrame, pv_threshold: float) -> dict:
+    return {
+        'page_pv': partial(top_k, df_pages, 'page_name', 'pageviews', 10, agg={
+            'pageviews': 'sum',
+            'unique_pageviews': 'sum'
+        }, ascending=True),
+        'page_cat': partial(category_totals, df_pages, 'page_category', 'pageviews'),
+        'exit': partial(top_pages_by, df_pages, 'exit_rate_pct', pv_threshold),
+        'time': partial(top_pages_by, df_pages, 'avg_time_on_page', pv_threshold),
+        'entry': partial(top_k, df_pages, 'page_name', 'entrances', 10, agg={
+            'entrances': 'sum'
+        }, ascending=True),
+    }
@@ -0,0 +1,152 @@
+"""
+Precomputed query snapshot for Adobe Analytics Dashboard
+
+build_snapshot.py renders every page for every preset and option and stores
+the results of the cached data-layer queries in one file. The app memory-maps
+that file and answers cache misses from it, so the first render after a
+restart does not load or aggregate the tables. Entries are keyed by the query
+arguments, which include each table's data version: once a table is rewritten
+its queries no longer match and are computed as usual.
+
+File layout: magic, header length, pickled header (metadata and the location
+of every entry), then the entries. Each entry is a protocol-5 pickle whose
+array buffers are stored out-of-band at 64-byte aligned offsets, so only the
+entries actually requested are paged in.
+"""
+import functools
+import inspect
+import mmap
+import os
+import pickle
+import struct
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+MAGIC = b"AASNAP01"
+ALIGN = 64
+SNAPSHOT_FILE = "dashboard.snapshot"
+
+_HEADER = struct.Struct('<8sQ')
+_MISSING = object()
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGN) * ALIGN
+
+
+def entry_key(fn, args: tuple, kwargs: dict) -> bytes:
+    """Key of one call: function name and its bound arguments (defaults applied)"""
+    bound = inspect.signature(fn).bind(*args, **kwargs)
+    bound.apply_defaults()
+    return pickle.dumps((fn.__name__, tuple(bound.arguments.values())), protocol=4)
+
+
+class Snapshot:
+    """Read-only view of a snapshot file"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _HEADER.size:
+            raise ValueError(f"Not a dashboard snapshot: {path}")
+        magic, length = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"Not a dashboard snapshot: {path}")
+        header = pickle.loads(self._mmap[_HEADER.size:_HEADER.size + length])
+        self.meta = header['meta']
+        self._entries = header['entries']
+        self._data_start = _aligned(_HEADER.size + length)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self._entries
+
+    def get(self, key: bytes, default=None):
+        """Stored value for ``key``; buffers are copied out of the map so arrays are writable"""
+        location = self._entries.get(key)
+        if location is None:
+            return default
+        offset, length, buffers = location
+        start = self._data_start
+        with memoryview(self._mmap) as view:
+            return pickle.loads(view[start + offset:start + offset + length],
+                                buffers=[bytearray(view[start + o:start + o + n]) for o, n in buffers])
+
+
+def write_snapshot(path, entries: dict, meta: dict = None) -> int:
+    """Write ``{key: value}`` to ``path`` atomically and return the file size in bytes"""
+    path = Path(path)
+    chunks, index, offset = [], {}, 0
+    for key, value in entries.items():
+        buffers = []
+        body = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+        chunks.append((offset, body))
+        entry_offset, offset = offset, offset + len(body)
+        locations = []
+        for buffer in buffers:
+            raw = buffer.raw()
+            offset = _aligned(offset)
+            chunks.append((offset, raw))
+            locations.append((offset, raw.nbytes))
+            offset += raw.nbytes
+        index[key] = (entry_offset, len(body), locations)
+
+    header = pickle.dumps({'meta': meta or {}, 'entries': index}, protocol=4)
+    data_start = _aligned(_HEADER.size + len(header))
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        for chunk_offset, chunk in chunks:
+            f.seek(data_start + chunk_offset)
+            f.write(chunk)
+        f.truncate(data_start + offset)
+    # Readers that still map the old file keep it until they reopen
+    os.replace(tmp, path)
+    return path.stat().st_size
+
+
+# ------------------------------------------------------------
+# Recording (build_snapshot.py) and serving (data_loader)
+# ------------------------------------------------------------
+_recording = None
+_recording_lock = threading.Lock()
+
+
+@contextmanager
+def recording():
+    """Collect the result of every snapshotted query run inside the block into the yielded dict"""
+    global _recording
+    _recording = entries = {}
+    try:
+        yield entries
+    finally:
+        _recording = None
+
+
+def snapshotted(get_snapshot):
+    """Decorator for cached query functions: serve a miss from ``get_snapshot()`` when it has the call
+
+    Place it under the cache decorator so cache hits never reach it. While
+    recording, the snapshot is bypassed and every computed result is kept.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            entries = _recording
+            if entries is not None:
+                result = fn(*args, **kwargs)
+                with _recording_lock:
+                    entries[entry_key(fn, args, kwargs)] = result
+                return result
+            snapshot = get_snapshot()
+            if snapshot is not None:
+                result = snapshot.get(entry_key(fn, args, kwargs), _MISSING)
+                if result is not _MISSING:
+                    return result
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
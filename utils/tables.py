@@ -0,0 +1,107 @@
+"""
+Table utilities for Adobe Analytics Dashboard
+"""
+import math
+from functools import partial
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from .export import MIME_TYPES, export_bytes, register_export, streaming_enabled
+
+PAGE_SIZES = [25, 50, 100]
+
+
+def sort_and_filter(df: pd.DataFrame, sort_by: str = None, ascending: bool = False,
+                    query: str = "", search_columns: list = None) -> pd.DataFrame:
+    """Filter rows by a substring query and sort, without touching the source frame"""
+    if query:
+        columns = search_columns or [c for c in df.columns if df[c].dtype == object]
+        mask = pd.Series(False, index=df.index)
+        for col in columns:
+            mask |= df[col].astype(str).str.contains(query, case=False, regex=False, na=False)
+        df = df[mask]
+
+    if sort_by and sort_by in df.columns:
+        df = df.sort_values(sort_by, ascending=ascending, kind='stable')
+
+    return df
+
+
+def get_page(df: pd.DataFrame, page: int, page_size: int) -> pd.DataFrame:
+    """Return one page (1-based) of rows"""
+    start = (page - 1) * page_size
+    return df.iloc[start:start + page_size]
+
+
+def download_buttons(df: pd.DataFrame, key: str, file_name: str):
+    """CSV / XLSX download buttons for ``df``
+
+    The file is encoded in chunks only when a button is clicked, so rendering
+    the table never builds an export. Served through server.py the buttons are
+    links to the streaming export route; otherwise Streamlit's deferred
+    download holds the finished file in memory until it is sent.
+    """
+    ctx = get_script_run_ctx()
+    session = ctx.session_id if ctx else None
+    cols = st.columns([1, 1, 6])
+    for col, fmt in zip(cols, MIME_TYPES):
+        label = f"{fmt.upper()} ダウンロード"
+        with col:
+            if streaming_enabled():
+                url = register_export((session, key, fmt), df, fmt, f"{file_name}.{fmt}")
+                st.link_button(label, url)
+            else:
+                st.download_button(label, data=partial(export_bytes, df, fmt),
+                                   file_name=f"{file_name}.{fmt}", mime=MIME_TYPES[fmt],
+                                   key=f"{key}_download_{fmt}", on_click="ignore")
+
+
+def paginated_dataframe(df: pd.DataFrame, key: str, sort_by: str = None, ascending: bool = False,
+                        search_columns: list = None, column_config: dict = None,
+                        page_size: int = 50, file_name: str = None):
+    """Render a detail table that only sends one page of rows to the browser
+
+    Sorting and filtering run on the server against the (cached) aggregate;
+    the browser only receives ``page_size`` rows per rerun. With ``file_name``
+    the current search and sort order can be downloaded as CSV / XLSX.
+    """
+    sort_options = list(df.columns)
+    if sort_by not in sort_options:
+        sort_by = sort_options[0] if sort_options else None
+
+    col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+    with col1:
+        query = st.text_input("検索", key=f"{key}_query", placeholder="キーワードで絞り込み")
+    with col2:
+        sort_col = st.selectbox("並び替え", sort_options, index=sort_options.index(sort_by) if sort_by else 0,
+                                key=f"{key}_sort")
+    with col3:
+        order = st.selectbox("順序", ["降順", "昇順"], index=1 if ascending else 0, key=f"{key}_order")
+    with col4:
+        size = st.selectbox("表示件数", PAGE_SIZES,
+                            index=PAGE_SIZES.index(page_size) if page_size in PAGE_SIZES else 1,
+                            key=f"{key}_size")
+
+    df_view = sort_and_filter(df, sort_col, order == "昇順", query, search_columns)
+    total = len(df_view)
+    n_pages = max(1, math.ceil(total / size))
+
+    # Keep the stored page in range when a new filter shrinks the result
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = n_pages
+
+    page = st.number_input("ページ", min_value=1, max_value=n_pages, step=1, key=page_key)
+    page = min(int(page), n_pages)
+
+    st.dataframe(get_page(df_view, page, size), width='stretch', hide_index=True,
+                 column_config=column_config)
+
+    first = (page - 1) * size + 1 if total else 0
+    last = min(page * size, total)
+    st.caption(f"全 {total:,} 件中 {first:,} - {last:,} 件を表示 ({page}/{n_pages} ページ)")
+
+    if file_name:
+        download_buttons(df_view, key, file_name)
@@ -0,0 +1,265 @@
+"""
+Telemetry export for Adobe Analytics Dashboard
+
+Process-wide counters, gauges and histograms for the data and chart layers,
+exported in OpenMetrics text format and as JSON lines so they can be scraped
+and alerted on without attaching a profiler. Telemetry is off unless one of
+the environment variables below is set; every recording call then returns
+after a single flag check.
+
+- AA_DASHBOARD_TELEMETRY_DIR: write metrics.prom (latest snapshot) and append
+  to metrics.jsonl at most every AA_DASHBOARD_TELEMETRY_INTERVAL seconds
+- AA_DASHBOARD_METRICS_PORT: serve the OpenMetrics text at http://localhost:<port>/metrics
+- AA_DASHBOARD_FIGURE_SAMPLE: fraction of figures whose JSON payload is measured (default 0.1)
+"""
+import functools
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+TELEMETRY_DIR = os.environ.get("AA_DASHBOARD_TELEMETRY_DIR")
+METRICS_PORT = os.environ.get("AA_DASHBOARD_METRICS_PORT")
+FLUSH_INTERVAL = float(os.environ.get("AA_DASHBOARD_TELEMETRY_INTERVAL", "10"))
+FIGURE_SAMPLE_RATE = float(os.environ.get("AA_DASHBOARD_FIGURE_SAMPLE", "0.1"))
+
+ENABLED = bool(TELEMETRY_DIR or METRICS_PORT)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'aa_dashboard_rerun_seconds': ('histogram', "Full script rerun latency per page", SECONDS_BUCKETS),
+    'aa_dashboard_csv_parse_seconds': ('histogram', "CSV read and parse time per file", SECONDS_BUCKETS),
+    'aa_dashboard_csv_rows': ('counter', "Rows parsed from CSV files", None),
+    'aa_dashboard_cache_calls': ('counter', "Calls to cached data-layer functions", None),
+    'aa_dashboard_cache_misses': ('counter', "Cache misses (function body executed)", None),
+    'aa_dashboard_cache_miss_bytes': ('counter', "Bytes of DataFrames stored by cache misses", None),
+    'aa_dashboard_query_rows_scanned': ('histogram', "Rows scanned per data-layer query", ROWS_BUCKETS),
+    'aa_dashboard_figure_payload_bytes': ('histogram', "Serialized Plotly figure size (sampled)", BYTES_BUCKETS),
+    'aa_dashboard_process_rss_bytes': ('gauge', "Resident set size of the dashboard process", None),
+    'aa_dashboard_dataset_cache_bytes': ('gauge', "Estimated memory of the tables cached per dataset", None),
+    'aa_dashboard_dataset_evictions': ('counter', "Datasets evicted from the cache to stay within budget", None),
+}
+
+
+class Registry:
+    """Thread-safe store of metric samples keyed by (name, labels)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}  # (name, labels) -> float, or [bucket counts..., sum, count] for histograms
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1.0):
+        with self._lock:
+            key = (name, labels)
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def set(self, name: str, labels: tuple = (), value: float = 0.0):
+        with self._lock:
+            self._values[(name, labels)] = value
+
+    def observe(self, name: str, labels: tuple = (), value: float = 0.0):
+        buckets = METRICS[name][2]
+        with self._lock:
+            key = (name, labels)
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in self._values.items()}
+
+
+REGISTRY = Registry()
+
+
+def _label_text(labels: tuple, extra: tuple = ()) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def process_rss_bytes() -> int:
+    """Current resident set size (falls back to peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+        except ImportError:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def to_openmetrics(snapshot: dict = None) -> str:
+    """Render a snapshot in the OpenMetrics text exposition format"""
+    snapshot = REGISTRY.snapshot() if snapshot is None else snapshot
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        samples = sorted((labels, value) for (metric, labels), value in snapshot.items() if metric == name)
+        if not samples:
+            continue
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"# HELP {name} {help_text}")
+        for labels, value in samples:
+            if kind == 'counter':
+                lines.append(f"{name}_total{_label_text(labels)} {value}")
+            elif kind == 'gauge':
+                lines.append(f"{name}{_label_text(labels)} {value}")
+            else:
+                for bound, count in zip(buckets, value):
+                    lines.append(f"{name}_bucket{_label_text(labels, (('le', float(bound)),))} {count}")
+                lines.append(f"{name}_bucket{_label_text(labels, (('le', '+Inf'),))} {value[-1]}")
+                lines.append(f"{name}_sum{_label_text(labels)} {value[-2]}")
+                lines.append(f"{name}_count{_label_text(labels)} {value[-1]}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def to_json_record(snapshot: dict = None) -> dict:
+    """One JSON-lines record: timestamp plus every sample (histograms as buckets/sum/count)"""
+    snapshot = REGISTRY.snapshot() if snapshot is None else snapshot
+    samples = []
+    for (name, labels), value in sorted(snapshot.items()):
+        sample = {'name': name, 'labels': dict(labels)}
+        if isinstance(value, list):
+            buckets = METRICS[name][2]
+            sample.update(buckets=dict(zip(map(str, buckets), value)), sum=value[-2], count=value[-1])
+        else:
+            sample['value'] = value
+        samples.append(sample)
+    return {'timestamp': time.time(), 'samples': samples}
+
+
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def flush(force: bool = False):
+    """Refresh the RSS gauge and write metrics.prom / metrics.jsonl (rate-limited)"""
+    global _last_flush
+    if not ENABLED:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        return
+    with _flush_lock:
+        if not force and now - _last_flush < FLUSH_INTERVAL:
+            return
+        _last_flush = now
+        REGISTRY.set('aa_dashboard_process_rss_bytes', (), process_rss_bytes())
+        if not TELEMETRY_DIR:
+            return
+        snapshot = REGISTRY.snapshot()
+        out_dir = Path(TELEMETRY_DIR)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        tmp = out_dir / "metrics.prom.tmp"
+        tmp.write_text(to_openmetrics(snapshot), encoding='utf-8')
+        os.replace(tmp, out_dir / "metrics.prom")
+        with open(out_dir / "metrics.jsonl", 'a', encoding='utf-8') as f:
+            f.write(json.dumps(to_json_record(snapshot), ensure_ascii=False) + "\n")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        REGISTRY.set('aa_dashboard_process_rss_bytes', (), process_rss_bytes())
+        body = to_openmetrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/openmetrics-text; version=1.0.0; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server():
+    """Serve /metrics on AA_DASHBOARD_METRICS_PORT once per process (no-op if unset)"""
+    global _server
+    if not METRICS_PORT or _server is not None:
+        return
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(('127.0.0.1', int(METRICS_PORT)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="aa-metrics", daemon=True).start()
+
+
+# ------------------------------------------------------------
+# Recording helpers used by the data and chart layers
+# ------------------------------------------------------------
+def record_rerun(page: str, seconds: float):
+    if ENABLED:
+        start_metrics_server()
+        REGISTRY.observe('aa_dashboard_rerun_seconds', (('page', page),), seconds)
+        flush()
+
+
+def record_csv_parse(filename: str, seconds: float, rows: int):
+    if ENABLED:
+        labels = (('file', filename),)
+        REGISTRY.observe('aa_dashboard_csv_parse_seconds', labels, seconds)
+        REGISTRY.inc('aa_dashboard_csv_rows', labels, rows)
+
+
+def record_cache_call(cache: str, miss: bool = False, stored=None):
+    if ENABLED:
+        labels = (('cache', cache),)
+        if not miss:
+            REGISTRY.inc('aa_dashboard_cache_calls', labels)
+            return
+        REGISTRY.inc('aa_dashboard_cache_misses', labels)
+        if hasattr(stored, 'memory_usage'):
+            REGISTRY.inc('aa_dashboard_cache_miss_bytes', labels, float(stored.memory_usage(index=True).sum()))
+
+
+def record_dataset_cache(resident: list, evicted: list = ()):
+    if ENABLED:
+        for dataset in evicted:
+            labels = (('dataset', dataset),)
+            REGISTRY.inc('aa_dashboard_dataset_evictions', labels)
+            REGISTRY.set('aa_dashboard_dataset_cache_bytes', labels, 0.0)
+        for dataset, _, nbytes in resident:
+            REGISTRY.set('aa_dashboard_dataset_cache_bytes', (('dataset', dataset),), float(nbytes))
+
+
+def record_rows_scanned(query: str, rows: int):
+    if ENABLED:
+        REGISTRY.observe('aa_dashboard_query_rows_scanned', (('query', query),), rows)
+
+
+def track_figure(fn):
+    """Decorator for chart helpers: record the JSON payload size of a sample of figures"""
+    if not ENABLED:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        fig = fn(*args, **kwargs)
+        if FIGURE_SAMPLE_RATE > 0 and random.random() < FIGURE_SAMPLE_RATE:
+            REGISTRY.observe('aa_dashboard_figure_payload_bytes', (('chart', fn.__name__),),
+                             len(fig.to_json()))
+        return fig
+    return wrapper